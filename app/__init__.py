@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, abort, jsonify, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_restx import Api
 
@@ -29,6 +29,7 @@ def create_app(env=None):
     app.config.from_object(config_by_name[app_env])
     klang_config.set_path(app_env)
     grew_config.set_url(app_env)
+    grew_config.load_options(app.config)
     parser_config.set_url(app_env)
 
     api = Api(
@@ -55,6 +56,24 @@ def create_app(env=None):
     def health():
         return jsonify("healthy")
 
+    @app.route("/metrics")
+    def metrics():
+        """Grew client metrics of the worker process that answers, for the super admins or when
+        METRICS_ENABLED is set"""
+        from flask_login import current_user
+        from app.utils.grew_cache import grew_cache
+        from app.utils.grew_utils import grew_circuit_breaker, grew_metrics, grew_single_flight
+        from app.utils.search_cache import search_cache
+
+        if not app.config["METRICS_ENABLED"] and not (current_user.is_authenticated and current_user.super_admin):
+            abort(404)
+        grew = grew_metrics.snapshot()
+        grew["cache"] = grew_cache.stats()
+        grew["coalescing"] = grew_single_flight.stats()
+        grew["circuit_breaker"] = grew_circuit_breaker.stats()
+        grew["search_cache"] = search_cache.stats()
+        return jsonify(grew)
+
     ## service for mp3 file, which will be taken from app/public folder
     @app.route('/media/<path:path>')
     def media(path):
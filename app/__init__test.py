@@ -1,4 +1,5 @@
-from app.test.fixtures import app, client  # noqa
+from app.test.fixtures import app, client, db  # noqa
+from app.user.model import User
 
 
 def test_app_creates(app):  # noqa
@@ -12,3 +13,25 @@ def test_app_healthy(app, client):  # noqa
         assert resp.status_code == 200
         assert resp.is_json
         assert resp.json == "healthy"
+
+
+def test_app_metrics(app, client):  # noqa
+    with client:
+        assert client.get("/metrics").status_code == 404
+        app.config["METRICS_ENABLED"] = True
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.is_json
+        assert set(resp.json) >= {"pid", "endpoints", "cache", "coalescing"}
+
+
+def test_app_metrics_for_super_admins(app, client, db):  # noqa
+    db.session.add(User(id="admin", username="admin", super_admin=True))
+    db.session.add(User(id="alice", username="alice", super_admin=False))
+    db.session.commit()
+    # the session cookie is secure, and each request gets its own app context as flask_login keeps the user in g
+    for user_id, status_code in (("alice", 404), ("admin", 200)):
+        with client.session_transaction(base_url="https://localhost") as session:
+            session["_user_id"] = user_id
+        with app.app_context():
+            assert client.get("/metrics", base_url="https://localhost").status_code == status_code
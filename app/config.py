@@ -1,4 +1,5 @@
 import os
+import tempfile
 from typing import List, Type
 
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
@@ -28,6 +29,28 @@ class Config:
     SESSION_COOKIE_HTTPONLY = False
     SESSION_COOKIE_SECURE = True
     MAX_TOKENS = MAX_TOKENS
+    # threads checking and rewriting the files of a multi-file upload
+    UPLOAD_WORKERS = 4
+    # seconds after the last chunk before an unfinished chunked upload is deleted
+    CHUNKED_UPLOAD_EXPIRY = 24 * 3600
+    # bytes, a bigger chunk is refused with 413, and an upload whose unfinished last sentence (no empty line
+    # yet) gets bigger than CHUNKED_UPLOAD_MAX_SENTENCE_SIZE fails with 400
+    CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 ** 2
+    CHUNKED_UPLOAD_MAX_SENTENCE_SIZE = 1024 ** 2
+    # compressed files of the exports kept on disk by sample version (app/utils/export_cache.py), in bytes
+    EXPORT_CACHE_ENABLED = True
+    EXPORT_CACHE_SIZE = 2 * 1024 ** 3
+    # threads compressing the files of an export archive in parallel, each keeps at most 8 MiB of compressed
+    # data in memory (MEMBER_MEMORY_SIZE in app/utils/export_archive.py), the rest goes to a temporary file
+    EXPORT_COMPRESSION_WORKERS = 4
+    # background jobs (app/jobs): number of worker processes started by `python -m app.jobs.worker`, seconds
+    # between two polls of the queue, a running job without heartbeat for JOB_STALE_TIMEOUT seconds is failed
+    # and the finished jobs are deleted with their files after JOB_RETENTION seconds
+    JOB_WORKERS = 2
+    JOB_POLL_INTERVAL = 1
+    JOB_HEARTBEAT_INTERVAL = 30
+    JOB_STALE_TIMEOUT = 300
+    JOB_RETENTION = 7 * 24 * 3600
     CACHE_TYPE = 'filesystem'
     CACHE_DIR = CACHE_FOLDER
     MAIL_SERVER = 'smtp.gmail.com'
@@ -37,6 +60,47 @@ class Config:
     MAIL_DEFAULT_SENDER = os.getenv("MAIL_USERNAME")
     MAIL_USE_TLS = True
     MAIL_USE_SSL = False
+    # overrides the grew server url chosen from the environment name
+    GREW_SERVER = os.getenv("GREW_SERVER")
+    GREW_POOL_SIZE = 10
+    GREW_CONNECT_TIMEOUT = 3.05
+    GREW_READ_TIMEOUT = 60
+    # read timeout (or (connect, read) tuple) of the grew functions that can take longer
+    GREW_TIMEOUTS = {
+        "searchRequestInGraphs": 300,
+        "tryPackage": 300,
+        "relationTables": 300,
+        "getLexicon": 300,
+        "saveConll": 300,
+        "insertConll": 300,
+    }
+    GREW_MAX_RETRIES = 2
+    GREW_RETRY_BACKOFF = 0.2
+    GREW_CACHE_ENABLED = True
+    GREW_CACHE_TIMEOUT = 300
+    # the tagsets of a sample are kept until the sample is written, this only bounds the cache size
+    GREW_TAGSET_CACHE_TIMEOUT = 86400
+    # formatted search and try package results kept in the memory of each worker until their project is
+    # written (app/utils/search_cache.py), in bytes. Every uwsgi process has its own cache and arborator-backend.ini
+    # limits each of them to 512 MB of address space (limit-as), of which a loaded worker already takes about
+    # 130 MB, plus 8 MB of stack by thread of the pools and the grew reply being read. A full cache and a search
+    # being formatted for it (up to a quarter of the cache) must fit in what is left with a wide margin
+    SEARCH_CACHE_ENABLED = True
+    SEARCH_CACHE_SIZE = 32 * 1024 ** 2
+    # maximum number of samples fetched in parallel for exports, parser trainings and github commits
+    GREW_SAMPLES_FETCH_WORKERS = 4
+    # maximum number of uploaded samples created and saved in parallel
+    GREW_SAMPLES_SAVE_WORKERS = 4
+    # grew calls slower than this (in seconds) are logged, 0 disables the log
+    GREW_SLOW_CALL_THRESHOLD = 5
+    # after this many consecutive failures grew calls fail fast with 503 for GREW_BREAKER_RESET_TIMEOUT
+    # seconds, then a single probe request is sent. One alert e-mail is sent per outage
+    GREW_BREAKER_FAILURE_THRESHOLD = 5
+    GREW_BREAKER_RESET_TIMEOUT = 30
+    GREW_BREAKER_ALERT_INTERVAL = 3600
+    # /metrics names the projects and samples of the grew calls: it is only served to the super admins,
+    # unless this is set for a scraper on a private network
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "") == "1"
     
 class DevelopmentConfig(Config):
     CONFIG_NAME = "dev"
@@ -77,6 +141,8 @@ class TestingConfig(Config):
     TESTING = True
     basedir = os.path.dirname(os.path.abspath(__file__))
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'arborator_test.sqlite')
+    # the tests and benchmarks must not leave cache entries in the repository
+    CACHE_DIR = os.path.join(tempfile.gettempdir(), "arborator_test_cache")
 
     PROJECT_IMAGE_FOLDER = UPLOAD_IMAGE_FOLDER
     UPLOAD_IMAGE_EXTENSIONS = ['.jpg', '.png', '.gif', '.jpeg']
@@ -12,8 +12,8 @@ if args.mode != 'prod' and args.mode != 'dev':
     print('mode must be prod or dev')
     exit()
 
-if args.version != 'refactor_github' and args.version != 'add_grew_history' and args.version != 'update_dependencies':
-    print('version must be refactor_github or add_grew_history')
+if args.version not in ('refactor_github', 'add_grew_history', 'update_dependencies', 'add_jobs'):
+    print('version must be refactor_github, add_grew_history, update_dependencies or add_jobs')
     exit()
 
 mode = args.mode
@@ -35,6 +35,13 @@ def migrate_update_dependencies(engine):
     with engine.connect() as connection:
         connection.execute(text("ALTER TABLE projects ADD collaborative_mode BOOLEAN NOT NULL DEFAULT(1);"))
 
+def migrate_add_jobs(engine):
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE jobs (id INTEGER NOT NULL, uuid VARCHAR, project_id INTEGER, user_id VARCHAR(256), type VARCHAR NOT NULL, status VARCHAR NOT NULL, params TEXT, progress INTEGER, total INTEGER, result TEXT, error VARCHAR, cancel_requested BOOLEAN, worker_pid INTEGER, created_at FLOAT, started_at FLOAT, ended_at FLOAT, heartbeat FLOAT, PRIMARY KEY(id), FOREIGN KEY(project_id) REFERENCES projects(id), FOREIGN KEY(user_id) REFERENCES users(id));"))
+        connection.execute(text("CREATE UNIQUE INDEX ix_jobs_uuid ON jobs (uuid);"))
+        connection.execute(text("CREATE INDEX ix_jobs_status ON jobs (status);"))
+        connection.commit()
+
 if args.version == 'add_grew_history':
     migrate_add_grew_history(engine)
            
@@ -42,4 +49,7 @@ if args.version == 'refactor_github':
     migrate_refactor_github(engine)
 
 if args.version == 'update_dependencies':
-    migrate_update_dependencies(engine)
\ No newline at end of file
+    migrate_update_dependencies(engine)
+
+if args.version == 'add_jobs':
+    migrate_add_jobs(engine)
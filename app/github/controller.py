@@ -3,6 +3,7 @@ from flask import request
 from flask_login import current_user
 from flask_accepts.decorators.decorators import responds
 
+from app.jobs.service import JobService
 from app.projects.service import ProjectService
 from app.user.service import UserService
 from app.projects.service import LastAccessService
@@ -29,19 +30,20 @@ class GithubSynchronizationResource(Resource):
             full_name(str): the name of the repository to be synchronized
             branch_import(str): branch used for the import
             branch_sync(str): branch to be used for the synchronization
+            background (query string): run the import as a job
         """
         data = request.get_json()
         full_name = data.get("fullName")
         branch_import = data.get("branchImport")
         branch_sync = data.get("branchSync")
 
-        project = ProjectService.get_by_name(project_name)
-        github_access_token = UserService.get_by_id(current_user.id).github_access_token
+        if JobService.is_background_request():
+            project = ProjectService.get_by_name(project_name)
+            params = { "project_name": project_name, "full_name": full_name, "branch_import": branch_import, "branch_sync": branch_sync }
+            job = JobService.submit("github_import", project.id, current_user.id, params)
+            return { "status": "OK", "data": { "jobId": job.uuid } }, 202
 
-        GithubWorkflowService.import_files_from_github(full_name, project_name, branch_import, branch_sync)
-        sha = GithubService.get_sha_base_tree(github_access_token, full_name, branch_sync)
-        data = { "project_id": project.id, "user_id": current_user.id, "repository_name": full_name, "branch": branch_sync, "base_sha": sha }
-        GithubRepositoryService.create(data)
+        GithubWorkflowService.synchronize(project_name, full_name, branch_import, branch_sync)
 
     def delete(self, project_name):
         """Delete synchronization"""
@@ -100,7 +102,12 @@ class GithubPullResource(Resource):
         return GithubWorkflowService.check_pull(github_access_token, project_name)
     
     def post(self, project_name):
-        """Pull changes"""
+        """Pull changes, with ?background=true the pull runs as a job"""
+        if JobService.is_background_request():
+            project = ProjectService.get_by_name(project_name)
+            job = JobService.submit("github_pull", project.id, current_user.id, { "project_name": project_name })
+            return { "status": "OK", "data": { "jobId": job.uuid } }, 202
+
         GithubWorkflowService.pull_changes(project_name)
         LastAccessService.update_last_access_per_user_and_project(current_user.id, project_name, "write")
         return { "status": "ok" }
@@ -10,9 +10,10 @@ from typing import List
 from flask import abort
 from flask_login import current_user
 
-from app import db
+from app import db, grew_config
 from app.config import Config
-from app.projects.service import ProjectService
+from app.jobs.service import JobContext, job_handler
+from app.projects.service import LastAccessService, ProjectService
 from app.utils.grew_utils import GrewService, grew_request , SampleExportService
 from app.user.service import UserService
 import app.samples.service as SampleService
@@ -422,7 +423,9 @@ class GithubService:
             new_base_sha(str)
         """
         tree = []
-        sample_names, sample_content_files = GrewService.get_samples_with_string_contents(project_name, updated_samples)
+        sample_names, sample_content_files = GrewService.get_samples_with_string_contents(
+            project_name, updated_samples, max_workers=grew_config.samples_fetch_workers
+        )
         for sample_name, sample in zip(sample_names,sample_content_files):
             content = sample.get(USERNAME)
             sha = GithubService.create_blob_for_updated_file(access_token, full_name, content)
@@ -555,7 +558,26 @@ class GithubService:
 class GithubWorkflowService:
 
     @staticmethod
-    def import_files_from_github(full_name, project_name, branch, branch_syn):
+    def synchronize(project_name, full_name, branch_import, branch_sync, on_progress=None):
+        """Import the files of a github repository and create the synchronization
+
+        Args:
+            project_name (str)
+            full_name (str): the name of the repository to be synchronized
+            branch_import (str): branch used for the import
+            branch_sync (str): branch to be used for the synchronization
+            on_progress (Callable[[int, int], None], optional): called with the number of imported files and the total
+        """
+        project = ProjectService.get_by_name(project_name)
+        github_access_token = UserService.get_by_id(current_user.id).github_access_token
+
+        GithubWorkflowService.import_files_from_github(full_name, project_name, branch_import, branch_sync, on_progress)
+        sha = GithubService.get_sha_base_tree(github_access_token, full_name, branch_sync)
+        data = { "project_id": project.id, "user_id": current_user.id, "repository_name": full_name, "branch": branch_sync, "base_sha": sha }
+        GithubRepositoryService.create(data)
+
+    @staticmethod
+    def import_files_from_github(full_name, project_name, branch, branch_syn, on_progress=None):
         """Import files from github:
             - Get repository files names of specific branch 
             - For non existing samples we create commit status for every new file
@@ -568,6 +590,7 @@ class GithubWorkflowService:
             project_name (str)
             branch (str): branch used for the import
             branch_syn (str): branch used for the synchronization
+            on_progress (Callable[[int, int], None], optional): called with the number of imported files and the total
         """
         project = ProjectService.get_by_name(project_name)
         access_token = UserService.get_by_id(current_user.id).github_access_token
@@ -584,12 +607,12 @@ class GithubWorkflowService:
 
         tmp_zip_file = GithubService.download_github_repository(access_token, full_name, branch)
         GithubService.extract_repository(tmp_zip_file)
-        GithubWorkflowService.clone_github_repository(conll_files, project_name)
+        GithubWorkflowService.clone_github_repository(conll_files, project_name, on_progress)
         if branch_syn != branch:  
             GithubService.create_new_branch_arborator(access_token, full_name, branch_syn, branch)
         
     @staticmethod 
-    def clone_github_repository(files, project_name):
+    def clone_github_repository(files, project_name, on_progress=None):
         """
             Clone github repository means create new samples from the files 
             of sync repo and create commit status for each sample
@@ -597,14 +620,24 @@ class GithubWorkflowService:
         Args:
             files (List[str])
             project_name (str)
+            on_progress (Callable[[int, int], None], optional): called with the number of imported files and the total
         """
-        for file in files:
-            path_file = os.path.join(Config.UPLOAD_FOLDER, file)
-            sample_name = file.split(CONLL)[0]
-            GithubWorkflowService.create_sample(sample_name, path_file, project_name)
-            project_id = ProjectService.get_by_name(project_name).id
-            GithubCommitStatusService.create(project_id, sample_name)
-            os.remove(path_file)
+        try:
+            for index, file in enumerate(files, start=1):
+                path_file = os.path.join(Config.UPLOAD_FOLDER, file)
+                sample_name = file.split(CONLL)[0]
+                GithubWorkflowService.create_sample(sample_name, path_file, project_name)
+                project_id = ProjectService.get_by_name(project_name).id
+                GithubCommitStatusService.create(project_id, sample_name)
+                os.remove(path_file)
+                if on_progress:
+                    on_progress(index, len(files))
+        finally:
+            # the extracted files left when the import is interrupted
+            for file in files:
+                path_file = os.path.join(Config.UPLOAD_FOLDER, file)
+                if os.path.exists(path_file):
+                    os.remove(path_file)
 
     @staticmethod
     def create_sample(sample_name, path_file, project_name):
@@ -615,13 +648,14 @@ class GithubWorkflowService:
             path_file (str)
             project_name (str)
         """
-        if not SampleService.check_sentences_without_sent_ids(path_file):
-            SampleService.add_new_sent_ids(path_file, sample_name)
-
-        SampleService.check_duplicate_sent_id(path_file, sample_name)
-        SampleService.check_if_file_has_user_ids(path_file, sample_name)
-        SampleService.add_or_replace_userid(path_file, USERNAME)
-        SampleService.add_or_keep_timestamps(path_file)
+        transformer = SampleService.ConlluTransformer(
+            sample_name,
+            user_id=USERNAME,
+            new_sent_ids="if_missing",
+            check_duplicate_sent_ids=True,
+            check_user_ids=True,
+        )
+        transformer.rewrite(path_file)
         
         grew_samples = GrewService.get_samples(project_name)
         samples_names = [sa["name"] for sa in grew_samples]
@@ -669,7 +703,7 @@ class GithubWorkflowService:
         return sync_repository.base_sha != base_tree
     
     @staticmethod 
-    def pull_changes(project_name):
+    def pull_changes(project_name, on_progress=None):
         """Pull changes:
             - compare between two commits
             - get the modified files 
@@ -680,6 +714,7 @@ class GithubWorkflowService:
 
         Args:
             project_name (str)
+            on_progress (Callable[[int, int], None], optional): called with the number of pulled files and the total
         """
         project = ProjectService.get_by_name(project_name)
         sync_repository = GithubRepositoryService.get_by_project_id(project.id)
@@ -687,7 +722,7 @@ class GithubWorkflowService:
 
         base_tree = GithubService.get_sha_base_tree(github_access_token, sync_repository.repository_name, sync_repository.branch)
         modified_files = GithubService.compare_two_commits(github_access_token, sync_repository.repository_name, sync_repository.base_sha, base_tree)
-        for file in modified_files:
+        for index, file in enumerate(modified_files, start=1):
             if extension.search(file.get('filename')):
                 sample_name = file.get("filename").split(".conllu")[0]
                 file_content= GithubService.get_file_content_by_commit_sha(github_access_token, sync_repository.repository_name, file.get("filename"), base_tree)
@@ -698,6 +733,8 @@ class GithubWorkflowService:
                     GithubWorkflowService.pull_change_existing_sample(project_name, sample_name, download_url)
                 if file.get("status") == "removed":
                     GithubWorkflowService.delete_sample_from_project(project_name, sample_name)
+            if on_progress:
+                on_progress(index, len(modified_files))
         GithubRepositoryService.update_sha(project.id, base_tree)
 
     @staticmethod
@@ -745,19 +782,14 @@ class GithubWorkflowService:
         content = requests.get(download_url).text 
         file_name = sample_name + "_modified.conllu"
         path_file = os.path.join(Config.UPLOAD_FOLDER, file_name)
-        with open(path_file, "w") as file:
-            file.write(content)
-
-        SampleService.add_or_replace_userid(path_file, USERNAME)
-        SampleService.add_or_keep_timestamps(path_file)
+        SampleService.ConlluTransformer(sample_name, user_id=USERNAME).write(content, path_file)
         
         with open(path_file, "rb") as file_to_save:
             GrewService.save_sample(project_name, sample_name, file_to_save)
         os.remove(path_file)
         
         conlls_strings = SampleService.split_conll_string_to_conlls_list(content)
-        reply = grew_request("getConll", data={"project_id": project_name, "sample_id": sample_name},)
-        sample_trees =SampleExportService.serve_sample_trees(reply.get("data", {}))
+        sample_trees = SampleExportService.serve_sample_trees(GrewService.get_sample_trees(project_name, sample_name))
         modified_sentences = []
         for conll in conlls_strings:
             for line in conll.rstrip().split("\n"):
@@ -796,3 +828,22 @@ class GithubWorkflowService:
         SampleService.SampleBlindAnnotationLevelService.delete_by_sample_name(project.id, sample_name)
 
 
+@job_handler("github_import")
+def run_github_import_job(context: JobContext):
+    """Background version of the synchronization endpoint"""
+    params = context.params
+    GithubWorkflowService.synchronize(
+        params["project_name"],
+        params["full_name"],
+        params["branch_import"],
+        params["branch_sync"],
+        on_progress=lambda done, total: context.update(progress=done, total=total),
+    )
+
+
+@job_handler("github_pull")
+def run_github_pull_job(context: JobContext):
+    """Background version of the pull endpoint"""
+    project_name = context.params["project_name"]
+    GithubWorkflowService.pull_changes(project_name, on_progress=lambda done, total: context.update(progress=done, total=total))
+    LastAccessService.update_last_access_per_user_and_project(context.job.user_id, project_name, "write")
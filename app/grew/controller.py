@@ -1,13 +1,16 @@
-import os 
+import json
 
 from flask import abort, request, Response
 from flask_login import current_user
 from flask_restx import Namespace, Resource
 
-from app.config import Config
+from app import grew_config
 from app.projects.service import LastAccessService, ProjectService
 from app.github.service import GithubCommitStatusService, GithubRepositoryService
-from app.utils.grew_utils import GrewService, SampleExportService
+from app.utils.export_archive import ExportFormat
+from app.utils.grew_utils import STREAM_CHUNK_SIZE, GrewService, SampleExportService, SearchResultsBuilder, search_query_key
+from app.utils.json_stream import JsonStreamError, iter_json_object
+from app.utils.search_cache import search_cache
 
 
 
@@ -23,34 +26,23 @@ class ApplyRuleResource(Resource):
 
         Args:
             project_name (str)
+            data ({sample_name: {sent_id: rewrite result}}): see TryPackageResource, only the graphs with
+                modified nodes or edges are saved
         """
         project =ProjectService.get_by_name(project_name)
         ProjectService.check_if_freezed(project)
-        
-        args = request.get_json()
-        data = args.get("data")
 
-        for sample_name, sample_trees in data.items():
-            new_conll = ''
-            for tree in sample_trees.values():
-                
-                if 'validated' in tree["conlls"].keys() and GithubRepositoryService.get_by_project_id(project.id):
+        # the body is decoded sample by sample while it is received, the samples read are saved meanwhile
+        body_chunks = iter(lambda: request.stream.read(STREAM_CHUNK_SIZE), b"")
+        samples = iter_json_object(body_chunks, "data", {})
+        github_repository = GithubRepositoryService.get_by_project_id(project.id)
+        try:
+            for sample_name, user_ids in GrewService.save_rule_results(project_name, samples, grew_config.samples_save_workers):
+                if 'validated' in user_ids and github_repository:
                     GithubCommitStatusService.update_changes(project.id, sample_name)
-                    
-                for user in tree["conlls"]:
-                    new_conll += tree["conlls"][user] + "\n\n"
-                    
-            file_name = sample_name + "_modified.conllu"
-            path_file = os.path.join(Config.UPLOAD_FOLDER, file_name)
-            
-            with open(path_file, "w") as file:
-                file.write(new_conll)
-                
-            with open(path_file, "rb") as file_to_save:
-                GrewService.save_sample(project_name, sample_name, file_to_save)
-            
-            os.remove(path_file)    
-                
+        except (JsonStreamError, json.JSONDecodeError) as e:
+            abort(400, "Invalid rewrite results: {}".format(e))
+
         LastAccessService.update_last_access_per_user_and_project(current_user.id, project_name, "write")
 
 
@@ -67,24 +59,16 @@ class SearchResource(Resource):
             user_type (str) 
             sample_ids (List[str] | [])
             otherUser (str | "" )
+            pageSize (int, optional): number of sentences of a page
+            cursor (str, optional): next_cursor of the previous page
+            stream (bool, optional): NDJSON response, a line per sentence
         Returns:
-            trees
+            trees, or a page of trees (see SearchResultsBuilder.response)
         """
         args = request.get_json()
-        pattern = args.get("pattern")
-        trees_type = args.get("userType") 
-        sample_ids = args.get("sampleIds")
-        other_user = args.get("otherUser")
-        if not sample_ids: 
-            sample_ids = []
+        search_results, query_key = search_from_args(project_name, args)
 
-        response = GrewService.search_request_in_graphs(project_name, pattern, sample_ids, trees_type, other_user)
-        search_results = response["data"]
-        
-        trees = {}
-        for result in search_results:
-            trees = GrewService.format_trees_new(result, trees)
-        return trees
+        return SearchResultsBuilder().response(search_results, args, query_key, project_name)
 
 @api.route("/<string:project_name>/try-package")
 class TryPackageResource(Resource):
@@ -99,8 +83,11 @@ class TryPackageResource(Resource):
             user_type (str) 
             sample_ids (List[str] | [])
             otherUser (str | "" )
+            pageSize (int, optional): number of sentences of a page
+            cursor (str, optional): next_cursor of the previous page
+            stream (bool, optional): NDJSON response, a line per sentence
         Returns:
-            trees
+            trees, or a page of trees (see SearchResultsBuilder.response)
         """
         args = request.get_json()
         
@@ -111,13 +98,11 @@ class TryPackageResource(Resource):
         if not sample_ids: 
             sample_ids = []
             
-        response = GrewService.try_package(project_name, package, sample_ids, user_type, other_user)
-        try_package_results = response["data"]
-        
-        trees = {}
-        for result in try_package_results:
-            trees = GrewService.format_trees_new(result, trees, is_package=True)
-        return trees
+        try_package_results = GrewService.try_package(project_name, package, sample_ids, user_type, other_user)
+        user_ids = GrewService.get_user_ids(user_type, other_user)
+        query_key = search_query_key("try-package", project_name, package, sample_ids, user_ids)
+
+        return SearchResultsBuilder(is_package=True).response(try_package_results, args, query_key, project_name)
 
 @api.route("/<string:project_name>/relation-table")
 class RelationTableResource(Resource):
@@ -149,47 +134,71 @@ class ExportGrewResultsResource(Resource):
     
     def post(self, project_name: str):
         """
-            Export search results
+            Export search results, by reference: the search is run again from its parameters (its results
+            are usually still in the search cache of the worker). The search cache lives in the memory of each
+            worker, so a resultId alone only works on the worker that ran the search
 
         Args:
             project_name (str)
             users (List[str])
-            search_results (tree type)
+            pattern, userType, sampleIds, otherUser: see SearchResource
+            resultId (str, optional): result_id of a page of the search, sent with the parameters or alone
+            searchResults (tree type, optional): the search results themselves, when neither are sent
+            format, compression, compressionLevel: see ExportSampleResource
 
         Returns:
-            rsponse: zip file attachement
+            rsponse: archive attachement
         """
         args = request.get_json()
-        search_results = args.get("searchResults")
         users = args.get("users")
-        
-        trees = {}
-        sample_content_files = []
-        samples_names = []
-        
-        for sample_name, results in search_results.items():
-            samples_names.append(sample_name)
-            trees = {}
-            for sent_id, tree in results.items():
-                trees[sent_id] = tree['conlls']
-            
-            sample_tree_nots_noui = SampleExportService.serve_sample_trees(trees, timestamps=False, user_ids=False, validated_by=False)
-            sample_content = SampleExportService.sample_tree_to_content_file(sample_tree_nots_noui)
-                
-            sample_content_files.append(sample_content)
-
-        zip_file = SampleExportService.content_files_to_zip(
-            samples_names, sample_content_files, users
-        )
-
-        resp = Response(
-            zip_file,
-            status=200,
-            mimetype="application/zip",
-            headers={
-                "Content-Disposition": "attachment;filename=dump.{}.zip".format(project_name)
-            },
-        )
-        return resp
-        
-            
\ No newline at end of file
+        try:
+            export_format = ExportFormat.from_args(args)
+        except ValueError as e:
+            abort(400, str(e))
+
+        result_id = args.get("resultId")
+        if args.get("pattern") is not None:
+            search_results, query_key = search_from_args(project_name, args)
+            if result_id and result_id != query_key:
+                abort(400, "resultId does not match the search parameters")
+            # served from the search cache when this worker has the results, else the search is run again
+            sentences = SearchResultsBuilder().iter_page(search_results, 0, None, {}, project_name, query_key)
+        elif result_id:
+            cached_search = search_cache.get(project_name, result_id)
+            if cached_search is None:
+                abort(404, "These search results are not in the cache, send the search parameters (pattern, userType, sampleIds, otherUser) to run it again")
+            sentences = cached_search.sentences
+        elif args.get("searchResults") is not None:
+            sentences = (
+                (sample_name, sent_id, tree)
+                for sample_name, results in args["searchResults"].items()
+                for sent_id, tree in results.items()
+            )
+        else:
+            abort(400, "The search to export is missing (pattern, resultId or searchResults)")
+
+        members = SampleExportService.iter_search_results_members(sentences, users)
+        chunks = SampleExportService.iter_archive(members, export_format)
+        return SampleExportService.archive_response(chunks, "dump.{}".format(project_name), export_format)
+
+
+def search_from_args(project_name: str, args):
+    """Grew search of the arguments of SearchResource
+
+    Args:
+        project_name (str)
+        args (dict): pattern, userType, sampleIds, otherUser
+
+    Returns:
+        (Iterator[grew_search_result], query_key)
+    """
+    pattern = args.get("pattern")
+    trees_type = args.get("userType")
+    sample_ids = args.get("sampleIds")
+    other_user = args.get("otherUser")
+    if not sample_ids:
+        sample_ids = []
+
+    search_results = GrewService.search_request_in_graphs(project_name, pattern, sample_ids, trees_type, other_user)
+    user_ids = GrewService.get_user_ids(trees_type, other_user)
+    return search_results, search_query_key("search", project_name, pattern, sample_ids, user_ids)
@@ -0,0 +1,7 @@
+BASE_ROUTE = "projects"
+
+
+def register_routes(api, app, root="api"):
+    from .controller import api as job_api
+
+    api.add_namespace(job_api, path=f"/{root}/{BASE_ROUTE}")
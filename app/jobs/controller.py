@@ -0,0 +1,59 @@
+import json
+import os
+
+from flask import abort
+from flask.helpers import send_file
+from flask_restx import Namespace, Resource
+from flask_accepts.decorators.decorators import responds
+from flask_login import current_user
+
+from app.projects.service import ProjectService
+from .service import JobService, SUCCEEDED
+from .schema import JobSchema
+
+api = Namespace("Jobs", description="Endpoints for following the background jobs of a project")
+
+
+def get_job_or_abort(project_name, job_id):
+    project = ProjectService.get_by_name(project_name)
+    ProjectService.check_if_project_exist(project)
+    job = JobService.get_by_uuid(project.id, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404, "There is no such job")
+    return job
+
+
+@api.route("/<string:project_name>/jobs")
+class JobsResource(Resource):
+    """Jobs submitted by the user in a project"""
+    @responds(schema=JobSchema(many=True), api=api)
+    def get(self, project_name):
+        """Get the last jobs of the user"""
+        project = ProjectService.get_by_name(project_name)
+        ProjectService.check_if_project_exist(project)
+        return JobService.get_user_jobs(project.id, current_user.id)
+
+
+@api.route("/<string:project_name>/jobs/<string:job_id>")
+class JobResource(Resource):
+    @responds(schema=JobSchema, api=api)
+    def get(self, project_name, job_id):
+        """Get the status, the progress and the (partial) result of a job"""
+        return get_job_or_abort(project_name, job_id)
+
+    @responds(schema=JobSchema, api=api)
+    def delete(self, project_name, job_id):
+        """Cancel a job"""
+        return JobService.cancel(get_job_or_abort(project_name, job_id))
+
+
+@api.route("/<string:project_name>/jobs/<string:job_id>/file")
+class JobFileResource(Resource):
+    def get(self, project_name, job_id):
+        """Download the file produced by a job (e.g. the zip of an export)"""
+        job = get_job_or_abort(project_name, job_id)
+        file_name = json.loads(job.result or "{}").get("file")
+        if job.status != SUCCEEDED or not file_name:
+            abort(404, "This job has no file")
+        path_file = os.path.abspath(os.path.join(JobService.get_workdir(job), file_name))
+        return send_file(path_file, download_name=file_name, as_attachment=True)
@@ -0,0 +1,20 @@
+from mypy_extensions import TypedDict
+
+
+class JobInterface(TypedDict, total=False):
+    """Typed interface for background jobs"""
+    id: int
+    uuid: str
+    project_id: int
+    user_id: str
+    type: str
+    status: str
+    params: str
+    progress: int
+    total: int
+    result: str
+    error: str
+    cancel_requested: bool
+    created_at: float
+    started_at: float
+    ended_at: float
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Boolean, String, Integer, Float, Text
+
+from app import db
+from app.shared.model import BaseM
+
+
+class Job(db.Model, BaseM):
+    """Long running operation of a project executed by the job workers (see app/jobs/worker.py)"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String, unique=True, index=True)
+    project_id = Column(Integer, db.ForeignKey("projects.id"))
+    user_id = Column(String(256), db.ForeignKey("users.id"))
+    type = Column(String, nullable=False)
+    status = Column(String, nullable=False, index=True)
+    params = Column(Text)  # json
+    progress = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)  # json, can be partial while the job is running
+    error = Column(String, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    worker_pid = Column(Integer, nullable=True)
+    created_at = Column(Float)
+    started_at = Column(Float, nullable=True)
+    ended_at = Column(Float, nullable=True)
+    heartbeat = Column(Float, nullable=True)
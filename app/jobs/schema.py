@@ -0,0 +1,18 @@
+import json
+
+from marshmallow import fields, Schema
+
+
+class JobSchema(Schema):
+    """Job status sent to the frontend"""
+    id = fields.String(attribute="uuid")
+    type = fields.String(attribute="type")
+    status = fields.String(attribute="status")
+    progress = fields.Integer(attribute="progress")
+    total = fields.Integer(attribute="total")
+    result = fields.Function(lambda job: json.loads(job.result) if job.result else None)
+    error = fields.String(attribute="error")
+    cancelRequested = fields.Boolean(attribute="cancel_requested")
+    createdAt = fields.Float(attribute="created_at")
+    startedAt = fields.Float(attribute="started_at")
+    endedAt = fields.Float(attribute="ended_at")
@@ -0,0 +1,310 @@
+import json
+import os
+import shutil
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from flask import request
+from sqlalchemy import update
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from app.config import Config
+from .model import Job
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+JOBS_FOLDER = os.path.join(Config.UPLOAD_FOLDER, "jobs")
+
+job_handlers: Dict[str, Callable[["JobContext"], Optional[dict]]] = {}
+
+
+def job_handler(job_type: str):
+    """Register the function that runs the jobs of job_type. It gets a JobContext and returns the
+    final result of the job (json serializable). The handlers run in the job workers as the user who
+    submitted the job, so current_user can be used as in the endpoints.
+
+    Args:
+        job_type (str)
+    """
+    def register(fct):
+        job_handlers[job_type] = fct
+        return fct
+    return register
+
+
+class JobCancelled(Exception):
+    """Raised in the handler of a job cancelled by the user, at its next progress report"""
+
+
+class JobContext:
+    """What the handler of a job sees: the parameters, a working directory and the progress report"""
+
+    def __init__(self, job: Job):
+        self.job = job
+        self.params = json.loads(job.params or "{}")
+        self.partial_result = {}
+
+    @property
+    def workdir(self) -> str:
+        workdir = JobService.get_workdir(self.job)
+        os.makedirs(workdir, exist_ok=True)
+        return workdir
+
+    def update(self, progress: int = None, total: int = None, result: dict = None):
+        """Store the progress and the partial result of the job, this is also where the cancellation is checked
+
+        Args:
+            progress (int, optional): number of steps done
+            total (int, optional): number of steps
+            result (dict, optional): merged in the partial result sent by the status endpoint
+
+        Raises:
+            JobCancelled
+        """
+        if progress is not None:
+            self.job.progress = progress
+        if total is not None:
+            self.job.total = total
+        if result:
+            self.partial_result.update(result)
+            self.job.result = json.dumps(self.partial_result)
+        self.job.heartbeat = time.time()
+        db.session.commit()
+        # the commit expired the job, cancel_requested is read again from the db
+        if self.job.cancel_requested:
+            raise JobCancelled()
+
+
+class JobService:
+
+    @staticmethod
+    def is_background_request() -> bool:
+        """The endpoints that can run as a job do it when they are called with ?background=true"""
+        return request.args.get("background", "").lower() in ("1", "true", "yes")
+
+    @staticmethod
+    def submit(job_type: str, project_id: int, user_id: str, params: dict, files: List[FileStorage] = []) -> Job:
+        """Queue a new job
+
+        Args:
+            job_type (str): one of the registered job handlers
+            project_id (int)
+            user_id (str)
+            params (dict): json serializable parameters of the handler
+            files (List[FileStorage], optional): uploaded files, stored in the job working directory and
+                listed in params["files"] as {"path", "filename"}
+
+        Returns:
+            Job
+        """
+        if job_type not in job_handlers:
+            raise ValueError("Unknown job type {}".format(job_type))
+        job = Job(
+            uuid=str(uuid.uuid4()),
+            project_id=project_id,
+            user_id=user_id,
+            type=job_type,
+            status=QUEUED,
+            progress=0,
+            cancel_requested=False,
+            created_at=time.time(),
+        )
+        if files:
+            workdir = JobService.get_workdir(job)
+            os.makedirs(workdir, exist_ok=True)
+            params = dict(params, files=[])
+            for index, fileobject in enumerate(files):
+                path = "upload_{}".format(index)
+                fileobject.save(os.path.join(workdir, path))
+                params["files"].append({"path": path, "filename": fileobject.filename})
+        job.params = json.dumps(params)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def get_by_uuid(project_id: int, job_uuid: str) -> Job:
+        """Get a job of the project
+
+        Args:
+            project_id (int)
+            job_uuid (str)
+
+        Returns:
+            Job
+        """
+        return Job.query.filter_by(project_id=project_id, uuid=job_uuid).first()
+
+    @staticmethod
+    def find_submitted(project_id: int, job_type: str, params: dict) -> Optional[Job]:
+        """Last job of a type whose params contain the given values, to avoid submitting the same operation
+        twice. The failed and cancelled jobs are ignored so that the operation can be submitted again
+
+        Args:
+            project_id (int)
+            job_type (str)
+            params (dict)
+
+        Returns:
+            Job | None
+        """
+        jobs = (
+            Job.query.filter_by(project_id=project_id, type=job_type)
+            .filter(Job.status.notin_((FAILED, CANCELLED)))
+            .order_by(Job.id.desc())
+        )
+        for job in jobs:
+            job_params = json.loads(job.params or "{}")
+            if all(job_params.get(key) == value for key, value in params.items()):
+                return job
+        return None
+
+    @staticmethod
+    def get_user_jobs(project_id: int, user_id: str, limit: int = 50) -> List[Job]:
+        """Get the last jobs submitted by a user in a project
+
+        Args:
+            project_id (int)
+            user_id (str)
+            limit (int, optional)
+
+        Returns:
+            List[Job]
+        """
+        return (
+            Job.query.filter_by(project_id=project_id, user_id=user_id)
+            .order_by(Job.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    @staticmethod
+    def cancel(job: Job) -> Job:
+        """Cancel a job: a queued job is never run, a running job stops at its next progress report
+
+        Args:
+            job (Job)
+
+        Returns:
+            Job
+        """
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            job.ended_at = time.time()
+        elif job.status == RUNNING:
+            job.cancel_requested = True
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def get_workdir(job: Job) -> str:
+        return os.path.join(JOBS_FOLDER, job.uuid)
+
+    @staticmethod
+    def claim_next(worker_pid: int) -> Optional[Job]:
+        """Take the oldest queued job, several workers can call it at the same time
+
+        Args:
+            worker_pid (int)
+
+        Returns:
+            Job | None
+        """
+        while True:
+            job = Job.query.filter_by(status=QUEUED).order_by(Job.id).first()
+            if job is None:
+                return None
+            now = time.time()
+            claimed = db.session.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == QUEUED)
+                .values(status=RUNNING, worker_pid=worker_pid, started_at=now, heartbeat=now)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return job
+
+    @staticmethod
+    def run(job: Job):
+        """Run a claimed job with its handler and store its outcome
+
+        Args:
+            job (Job)
+        """
+        context = JobContext(job)
+        try:
+            handler = job_handlers.get(job.type)
+            if handler is None:
+                raise ValueError("Unknown job type {}".format(job.type))
+            result = handler(context)
+            job.status = SUCCEEDED
+            if result is not None:
+                job.result = json.dumps(result)
+        except JobCancelled:
+            db.session.rollback()
+            job.status = CANCELLED
+        except HTTPException as e:
+            db.session.rollback()
+            job.status = FAILED
+            job.error = e.description
+        except Exception as e:
+            traceback.print_exc()
+            db.session.rollback()
+            job.status = FAILED
+            job.error = str(e)
+        job.ended_at = time.time()
+        db.session.commit()
+        workdir = JobService.get_workdir(job)
+        if os.path.isdir(workdir) and not os.listdir(workdir):
+            os.rmdir(workdir)
+        print("<JOBS> {} job {} {}".format(job.type, job.uuid, job.status))
+
+    @staticmethod
+    def beat(job_id: int):
+        """Tell that the worker running the job is alive, called from the heartbeat thread of the worker"""
+        with db.engine.begin() as connection:
+            connection.execute(update(Job).where(Job.id == job_id).values(heartbeat=time.time()))
+
+    @staticmethod
+    def fail_stale_jobs(stale_timeout: float) -> int:
+        """Mark as failed the running jobs whose worker stopped sending heartbeats
+
+        Args:
+            stale_timeout (float): seconds
+
+        Returns:
+            int: number of failed jobs
+        """
+        stale_jobs = Job.query.filter(Job.status == RUNNING, Job.heartbeat < time.time() - stale_timeout).all()
+        for job in stale_jobs:
+            job.status = FAILED
+            job.error = "The job worker stopped"
+            job.ended_at = time.time()
+        db.session.commit()
+        return len(stale_jobs)
+
+    @staticmethod
+    def purge(retention: float) -> int:
+        """Delete the jobs finished for more than retention seconds, and their files
+
+        Args:
+            retention (float): seconds
+
+        Returns:
+            int: number of deleted jobs
+        """
+        old_jobs = Job.query.filter(Job.status.in_(FINISHED_STATUSES), Job.ended_at < time.time() - retention).all()
+        for job in old_jobs:
+            shutil.rmtree(JobService.get_workdir(job), ignore_errors=True)
+            db.session.delete(job)
+        db.session.commit()
+        return len(old_jobs)
@@ -0,0 +1,150 @@
+import io
+import json
+import os
+
+import pytest
+from flask import abort
+from flask_login import current_user
+from werkzeug.datastructures import FileStorage
+
+from app.test.fixtures import app, db  # noqa
+from app.projects.model import Project
+from app.user.model import User
+from app.jobs.model import Job
+from app.jobs.service import JobService, job_handler, CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED
+from app.jobs.worker import JobWorker
+
+
+@pytest.fixture(autouse=True)
+def jobs_folder(monkeypatch, tmp_path):
+    monkeypatch.setattr("app.jobs.service.JOBS_FOLDER", str(tmp_path))
+
+
+@job_handler("test_count")
+def count_job(context):
+    total = context.params["total"]
+    context.update(total=total)
+    for index in range(1, total + 1):
+        context.update(progress=index, result={"last": index})
+    with open(os.path.join(context.workdir, context.params["files"][0]["path"])) as uploaded_file:
+        content = uploaded_file.read()
+    return {"user": current_user.username, "content": content}
+
+
+@job_handler("test_cancel")
+def cancelled_job(context):
+    context.job.cancel_requested = True
+    context.update(progress=1)
+    raise AssertionError("the job should have been cancelled")
+
+
+@job_handler("test_fail")
+def failing_job(context):
+    abort(406, "wrong sample")
+
+
+def create_project(db):  # noqa
+    db.session.add(User(id="user_id", username="alice"))
+    project = Project(project_name="project", visibility=2)
+    db.session.add(project)
+    db.session.commit()
+    return project
+
+
+def test_run_jobs(app, db):  # noqa
+    project = create_project(db)
+    files = [FileStorage(io.BytesIO(b"content"), filename="sample.conllu")]
+    job = JobService.submit("test_count", project.id, "user_id", {"total": 3}, files=files)
+    assert job.status == QUEUED
+
+    assert JobWorker(app).run_pending() == 1
+    db.session.refresh(job)
+    assert job.status == SUCCEEDED
+    assert (job.progress, job.total) == (3, 3)
+    assert json.loads(job.result) == {"user": "alice", "content": "content"}
+
+
+def test_cancel_and_failure(app, db):  # noqa
+    project = create_project(db)
+    queued = JobService.submit("test_count", project.id, "user_id", {"total": 1})
+    JobService.cancel(queued)
+    cancelled = JobService.submit("test_cancel", project.id, "user_id", {})
+    failed = JobService.submit("test_fail", project.id, "user_id", {})
+
+    assert JobWorker(app).run_pending() == 2
+    for job in (queued, cancelled, failed):
+        db.session.refresh(job)
+    assert queued.status == CANCELLED and queued.started_at is None
+    assert cancelled.status == CANCELLED and cancelled.progress == 1
+    assert failed.status == FAILED and failed.error == "wrong sample"
+
+
+def test_stale_jobs_and_purge(app, db):  # noqa
+    project = create_project(db)
+    job = JobService.submit("test_count", project.id, "user_id", {"total": 1})
+    assert JobService.claim_next(worker_pid=1).id == job.id
+    assert JobService.claim_next(worker_pid=2) is None
+    assert job.status == RUNNING
+
+    assert JobService.fail_stale_jobs(stale_timeout=60) == 0
+    job.heartbeat -= 120
+    db.session.commit()
+    assert JobService.fail_stale_jobs(stale_timeout=60) == 1
+    assert job.status == FAILED
+
+    assert JobService.purge(retention=60) == 0
+    job.ended_at -= 120
+    db.session.commit()
+    assert JobService.purge(retention=60) == 1
+    assert Job.query.count() == 0
+
+
+def test_status_endpoint(app, db):  # noqa
+    project = create_project(db)
+    job = JobService.submit("test_count", project.id, "user_id", {"total": 1})
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "user_id"
+        session["_fresh"] = True
+
+    response = client.get("/api/projects/project/jobs/{}".format(job.uuid))
+    assert response.status_code == 200
+    assert response.json["status"] == QUEUED
+
+    response = client.delete("/api/projects/project/jobs/{}".format(job.uuid))
+    assert response.json["status"] == CANCELLED
+    assert client.get("/api/projects/project/jobs/unknown").status_code == 404
+
+
+def test_parser_ingestion_is_submitted_once(app, db, monkeypatch):  # noqa
+    from app.parser.service import ParserService
+
+    project = create_project(db)
+    model_info = {"model_id": "model", "project_name": "project"}
+    replies = {"ready": False}
+
+    def parse_status(parse_task_id):
+        if not replies["ready"]:
+            return {"status": "success", "data": {"ready": False}}
+        return {"status": "success", "data": {"ready": True, "model_info": dict(model_info), "parsed_samples": {"sample": "1\ta"}}}
+
+    monkeypatch.setattr("app.parser.service.ArboratorParserAPI.parse_status", parse_status)
+
+    def poll(parse_task_id="task"):
+        return ParserService.parse_status_in_background(project, "user_id", model_info, parse_task_id, "_suffix")
+
+    assert poll() == {"status": "success", "data": {"ready": False}}
+    assert Job.query.count() == 0
+
+    replies["ready"] = True
+    first = poll()
+    assert first["data"]["ready"] and "parsed_samples" not in first["data"]
+    assert poll()["data"]["jobId"] == first["data"]["jobId"]
+    assert Job.query.count() == 1
+    assert poll("other_task")["data"]["jobId"] != first["data"]["jobId"]
+
+    job = JobService.get_by_uuid(project.id, first["data"]["jobId"])
+    job.status = FAILED
+    db.session.commit()
+    assert poll()["data"]["jobId"] != first["data"]["jobId"]
+    assert Job.query.count() == 3
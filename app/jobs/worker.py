@@ -0,0 +1,116 @@
+"""Job workers: processes running the queued jobs (uploads, exports, github imports, validations...)
+
+They run next to the uwsgi workers and share the database with them:
+
+    python -m app.jobs.worker --env prod --processes 2
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+from flask import Flask
+from flask_login import login_user
+
+from app import db
+from app.user.service import UserService
+from .model import Job
+from .service import JobService
+
+
+class JobWorker:
+    def __init__(self, app: Flask):
+        self.app = app
+        self.poll_interval = app.config["JOB_POLL_INTERVAL"]
+        self.heartbeat_interval = app.config["JOB_HEARTBEAT_INTERVAL"]
+        self._last_maintenance = 0
+
+    def run_forever(self):
+        print("<JOBS> worker {} started".format(os.getpid()))
+        while True:
+            self.maintenance()
+            if not self.run_next():
+                time.sleep(self.poll_interval)
+
+    def run_pending(self) -> int:
+        """Run the queued jobs until there is none left
+
+        Returns:
+            int: number of jobs run
+        """
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
+
+    def run_next(self) -> bool:
+        """Run the oldest queued job
+
+        Returns:
+            bool: False if there was no job to run
+        """
+        with self.app.app_context():
+            job = JobService.claim_next(os.getpid())
+            if job is None:
+                return False
+            job_id = job.id
+
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(job_id, stopped), daemon=True)
+        heartbeat.start()
+        try:
+            # the handlers reuse the services of the endpoints, they run in a request of the submitting user
+            with self.app.test_request_context():
+                job = db.session.get(Job, job_id)
+                user = UserService.get_by_id(job.user_id)
+                if user is not None:
+                    login_user(user)
+                JobService.run(job)
+        finally:
+            stopped.set()
+            heartbeat.join()
+        return True
+
+    def maintenance(self):
+        """Fail the jobs of dead workers and delete the old ones, at most once a minute"""
+        if time.monotonic() - self._last_maintenance < 60:
+            return
+        self._last_maintenance = time.monotonic()
+        with self.app.app_context():
+            JobService.fail_stale_jobs(self.app.config["JOB_STALE_TIMEOUT"])
+            JobService.purge(self.app.config["JOB_RETENTION"])
+
+    def _beat(self, job_id: int, stopped: threading.Event):
+        while not stopped.wait(self.heartbeat_interval):
+            with self.app.app_context():
+                JobService.beat(job_id)
+
+
+def run_worker(env: str):
+    from app import create_app
+
+    JobWorker(create_app(env)).run_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--env", default=os.getenv("FLASK_ENV") or "test", help="dev | prod | test")
+    parser.add_argument("--processes", type=int, default=None, help="number of workers, JOB_WORKERS by default")
+    args = parser.parse_args()
+
+    from app.config import config_by_name
+
+    processes = args.processes or config_by_name[args.env].JOB_WORKERS
+    if processes == 1:
+        run_worker(args.env)
+        return
+    workers = [multiprocessing.Process(target=run_worker, args=(args.env,), name="job worker") for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
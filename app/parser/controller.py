@@ -1,15 +1,16 @@
-import os
 from typing import TypedDict, List, Union
 
 from flask import request, abort
 from flask_restx import Namespace, Resource
+from flask_login import current_user
 
+from app import grew_config
 from app.utils.grew_utils import GrewService
-from app.config import Config
-from ..samples.service import add_or_keep_timestamps, add_or_replace_userid
+from app.jobs.service import JobService
 from ..projects.service import ProjectService, ProjectAccessService
 from ..user.service import EmailService
 from ..utils.arborator_parser_utils import ArboratorParserAPI, ModelInfo_t
+from .service import ParserService
 
 api = Namespace("Parser", description="Endpoints for dealing with the parser")  # noqa
 
@@ -74,7 +75,9 @@ class ParserTrainStartResource(Resource):
         if project_name == "undefined":
             return {"status": "failure", "error": "NOT VALID PROJECT NAME"}
 
-        train_samples = GrewService.get_samples_with_string_contents_as_dict(project_name, train_samples_names, train_user)
+        train_samples = GrewService.get_samples_with_string_contents_as_dict(
+            project_name, train_samples_names, train_user, max_workers=grew_config.samples_fetch_workers
+        )
 
         return ArboratorParserAPI.train_start(project_name, train_samples, max_epoch, base_model)
 
@@ -113,7 +116,9 @@ class ParserParseStartResource(Resource):
         if project_name == "undefined":
             return {"status": "failure", "error": "NOT VALID PROJECT NAME"}
 
-        to_parse_samples = GrewService.get_samples_with_string_contents_as_dict(project_name, to_parse_samples_names, parsing_user)
+        to_parse_samples = GrewService.get_samples_with_string_contents_as_dict(
+            project_name, to_parse_samples_names, parsing_user, max_workers=grew_config.samples_fetch_workers
+        )
 
         return ArboratorParserAPI.parse_start(model_info, to_parse_samples, parsing_settings)
 
@@ -121,7 +126,9 @@ class ParserParseStartResource(Resource):
 @api.route("/parse/status")
 class ParserParseStatus(Resource):
     def post(self):
-        """Get parsing status, this request is also send every 10s after start parsing"""
+        """Get parsing status, this request is also send every 10s after start parsing.
+        With ?background=true the parsed samples are saved by a job once the parsing is ready, its id is
+        given in data.jobId (the same job for all the requests of a parsing task)"""
         params = request.get_json(force=True)
         print("<PARSER> parse/status request :", params)
 
@@ -133,35 +140,8 @@ class ParserParseStatus(Resource):
         if project_name == "undefined":
             return {"status": "NOT VALID PROJECT NAME"}
 
-        parse_status_reply = ArboratorParserAPI.parse_status(parse_task_id)
-        if parse_status_reply["status"] == "failure":
-            return parse_status_reply
-
-        data = parse_status_reply["data"]
-        if data.get("ready") and data.get("parsed_samples"):
-            task_model_info = data["model_info"]
-            task_parsed_samples = data["parsed_samples"]
-
-            if task_model_info["model_id"] == model_info["model_id"] and task_model_info["project_name"] == model_info["project_name"]:
-
-                for sample_name, sample_content in task_parsed_samples.items():
-                    path_file = os.path.join(Config.UPLOAD_FOLDER, sample_name)
-                    print('upload parsed\n', path_file)
-                    with open(path_file,'w') as f:
-                        f.write(sample_content)
-
-                    add_or_keep_timestamps(path_file, when="long_ago")
-                    add_or_replace_userid(path_file, "parser" + parser_suffix)
-                    with open(path_file, "rb") as file_to_save:
-                        print('save files')
-                        GrewService.save_sample(project_name, sample_name, file_to_save)
-                    os.remove(path_file)
-                    
-            del data["parsed_samples"]
-
-        return {"status": "success", "data": data}
-
-
-
-
+        if JobService.is_background_request():
+            project = ProjectService.get_by_name(project_name)
+            return ParserService.parse_status_in_background(project, current_user.id, model_info, parse_task_id, parser_suffix)
 
+        return ParserService.parse_status(project_name, model_info, parse_task_id, parser_suffix)
@@ -0,0 +1,106 @@
+import os
+
+from app.config import Config
+from app.jobs.service import JobContext, JobService, job_handler
+from app.utils.grew_utils import GrewService
+from ..samples.service import ConlluTransformer
+from ..utils.arborator_parser_utils import ArboratorParserAPI
+
+
+class ParserService:
+
+    @staticmethod
+    def parse_status(project_name, model_info, parse_task_id, parser_suffix, on_sample=None):
+        """Get the status of a parsing task and save the parsed samples once it is ready
+
+        Args:
+            project_name (str)
+            model_info (ModelInfo_t)
+            parse_task_id (str)
+            parser_suffix (str): the parsed trees are saved under the user "parser" + parser_suffix
+            on_sample (Callable[[int, int], None], optional): called with the number of saved samples and the total
+
+        Returns:
+            {"status": "success", "data": parse status without the parsed samples} | failure reply of the parser
+        """
+        parse_status_reply = ArboratorParserAPI.parse_status(parse_task_id)
+        if parse_status_reply["status"] == "failure":
+            return parse_status_reply
+
+        data = parse_status_reply["data"]
+        if data.get("ready") and data.get("parsed_samples"):
+            task_parsed_samples = data["parsed_samples"]
+
+            if ParserService.is_task_of_model(data, model_info):
+
+                for index, (sample_name, sample_content) in enumerate(task_parsed_samples.items(), start=1):
+                    path_file = os.path.join(Config.UPLOAD_FOLDER, sample_name)
+                    print('upload parsed\n', path_file)
+                    transformer = ConlluTransformer(sample_name, user_id="parser" + parser_suffix, timestamp="long_ago")
+                    transformer.write(sample_content, path_file)
+                    with open(path_file, "rb") as file_to_save:
+                        print('save files')
+                        GrewService.save_sample(project_name, sample_name, file_to_save)
+                    os.remove(path_file)
+                    if on_sample:
+                        on_sample(index, len(task_parsed_samples))
+                    
+            del data["parsed_samples"]
+
+        return {"status": "success", "data": data}
+
+    @staticmethod
+    def parse_status_in_background(project, user_id, model_info, parse_task_id, parser_suffix):
+        """Same as parse_status, but once the parsing is ready the parsed samples are saved by a parser_ingestion
+        job. The job is submitted once per parsing task, the next status requests give the same job
+
+        Args:
+            project (Project)
+            user_id (str): user submitting the job
+            model_info (ModelInfo_t)
+            parse_task_id (str)
+            parser_suffix (str)
+
+        Returns:
+            {"status": "success", "data": parse status without the parsed samples, with the jobId once it is ready}
+            | failure reply of the parser
+        """
+        parse_status_reply = ArboratorParserAPI.parse_status(parse_task_id)
+        if parse_status_reply["status"] == "failure":
+            return parse_status_reply
+
+        data = parse_status_reply["data"]
+        if data.get("ready") and data.get("parsed_samples"):
+            if ParserService.is_task_of_model(data, model_info):
+                job = JobService.find_submitted(project.id, "parser_ingestion", {"parse_task_id": parse_task_id})
+                if job is None:
+                    job_params = {
+                        "project_name": project.project_name,
+                        "model_info": model_info,
+                        "parse_task_id": parse_task_id,
+                        "parser_suffix": parser_suffix,
+                    }
+                    job = JobService.submit("parser_ingestion", project.id, user_id, job_params)
+                data["jobId"] = job.uuid
+            del data["parsed_samples"]
+
+        return {"status": "success", "data": data}
+
+    @staticmethod
+    def is_task_of_model(data, model_info) -> bool:
+        """Was the parsing task run with the model of the request"""
+        task_model_info = data["model_info"]
+        return task_model_info["model_id"] == model_info["model_id"] and task_model_info["project_name"] == model_info["project_name"]
+
+
+@job_handler("parser_ingestion")
+def run_parser_ingestion_job(context: JobContext):
+    """Background version of the parse status endpoint, the parsed samples are saved by the job"""
+    params = context.params
+    return ParserService.parse_status(
+        params["project_name"],
+        params["model_info"],
+        params["parse_task_id"],
+        params["parser_suffix"],
+        on_sample=lambda done, total: context.update(progress=done, total=total),
+    )
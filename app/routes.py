@@ -12,6 +12,7 @@ def register_routes(api, app, root="api"):
     from app.klang import register_routes as attach_klang
     from app.parser import register_routes as attach_parser
     from app.stats import register_routes as attach_stats
+    from app.jobs import register_routes as attach_jobs
 
     # Add routes
     attach_user(api, app, root)
@@ -27,3 +28,4 @@ def register_routes(api, app, root="api"):
     attach_klang(api, app, root)
     attach_parser(api, app, root)
     attach_stats(api, app, root)
+    attach_jobs(api, app, root)
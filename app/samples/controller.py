@@ -1,15 +1,17 @@
+import itertools
 import json
-import re
 from typing import List
 
 from flask.helpers import send_file
 from flask_accepts.decorators.decorators import responds
-from flask import Response, request
+from flask import Response, abort, request
 from flask_restx import Namespace, Resource 
 from flask_login import current_user
-from werkzeug.utils import secure_filename
 
+from app import grew_config
+from app.jobs.service import JobService
 from app.projects.service import ProjectAccessService, ProjectService, LastAccessService
+from app.utils.export_archive import ExportFormat
 from app.utils.grew_utils import GrewService, SampleExportService, grew_request
 from app.shared.service import SharedService
 
@@ -18,6 +20,7 @@ from .service import (
     SampleBlindAnnotationLevelService,
     SampleUploadService,
     SampleTokenizeService,
+    ChunkedUploadService,
 )
 from .interface import SampleInterface
 from .schema import SampleSchema
@@ -80,9 +83,11 @@ class SampleResource(Resource):
             - files(List[File])
             - rtl(bool): right to lef script
             - samples_without_sent_ids(List[str])
+            - background (query string): run the upload as a job, the reply is { "status": "OK", "data": { "jobId" } }
 
         Returns:
-            - { "status": ok, "response": list of detected annotation tag in the uploaded samples}
+            - { "status": ok, "response": list of detected annotation tag in the uploaded samples and the result of every file}
+            The request fails only when none of the files could be uploaded
         """
         
         project = ProjectService.get_by_name(project_name)
@@ -99,28 +104,31 @@ class SampleResource(Resource):
         if samples_without_sent_ids:
             samples_without_sent_ids = json.loads(samples_without_sent_ids)
 
+        if files and JobService.is_background_request():
+            params = {
+                "project_name": project_name,
+                "rtl": rtl,
+                "username": username,
+                "samples_without_sent_ids": samples_without_sent_ids,
+            }
+            job = JobService.submit("upload", project.id, current_user.id, params, files=files)
+            return { "status": "OK", "data": { "jobId": job.uuid } }, 202
+
         if files:
-            reextensions = re.compile(r"\.(conll(u|\d+)?|txt|tsv|csv)$")
             grew_samples = GrewService.get_samples(project_name)
             existing_samples = [sa["name"] for sa in grew_samples]
-            sample_names = []
             
-            for file in files:
-                
-                filename = secure_filename(file.filename)
-                sample_name = reextensions.sub("", filename)
-                sample_names.append(sample_name)
-                
-                SampleUploadService.upload(
-                    file,
-                    project_name,
-                    filename, 
-                    sample_name,
-                    rtl,
-                    existing_samples=existing_samples,
-                    new_username=username,
-                    samples_without_sent_ids=samples_without_sent_ids
-                )
+            results = SampleUploadService.upload(
+                files,
+                project_name,
+                rtl,
+                existing_samples=existing_samples,
+                new_username=username,
+                samples_without_sent_ids=samples_without_sent_ids
+            )
+            sample_names = [result["sample_name"] for result in results if result["status"] == "OK"]
+            if not sample_names:
+                abort(results[0]["code"], results[0]["message"])
             
             pos_list, relation_list, feat_list, misc_list = GrewService.get_config_from_samples(project_name, sample_names)
             
@@ -128,7 +136,8 @@ class SampleResource(Resource):
                 "pos": pos_list,
                 "relations": relation_list,
                 "feats": feat_list,
-                "misc": misc_list
+                "misc": misc_list,
+                "samples": results,
             }
             
             LastAccessService.update_last_access_per_user_and_project(current_user.id, project_name, "write")
@@ -159,6 +168,130 @@ class SampleResource(Resource):
         LastAccessService.update_last_access_per_user_and_project(current_user.id, project_name, "write")
         return { "status": "OK" }
 
+@api.route("/<string:project_name>/samples/uploads")
+class ChunkedUploadResource(Resource):
+    "Resumable upload of a large sample, sent in chunks"
+
+    def post(self, project_name: str):
+        """Start a chunked upload
+
+        Args:
+            - project_name(str)
+            - fileName(str)
+            - userId(str): username used to the uploaded trees
+            - rtl(bool): right to left script
+            - withoutSentIds(bool): the file doesn't contain sent_ids
+
+        Returns:
+            - { "status": ok, "data": state of the upload with its upload_id }
+        """
+        project = ProjectService.get_by_name(project_name)
+        ProjectService.check_if_project_exist(project)
+        ProjectAccessService.check_admin_access(project.id)
+        ProjectService.check_if_freezed(project)
+
+        args = request.get_json(force=True)
+        state = ChunkedUploadService.create(
+            project_name,
+            current_user.id,
+            args.get("fileName"),
+            args.get("userId"),
+            args.get("rtl"),
+            new_sent_ids=args.get("withoutSentIds") == True,
+        )
+        return { "status": "OK", "data": state }
+
+
+def get_chunked_upload(project_name: str, upload_id: str):
+    """State of an upload of the project started by the current user"""
+    project = ProjectService.get_by_name(project_name)
+    ProjectService.check_if_project_exist(project)
+    state = ChunkedUploadService.get_state(upload_id)
+    if state["project_name"] != project_name or state["user_id"] != current_user.id:
+        abort(404, "There is no such upload, it may have expired")
+    return project, state
+
+
+@api.route("/<string:project_name>/samples/uploads/<string:upload_id>")
+class ChunkedUploadStateResource(Resource):
+
+    def get(self, project_name: str, upload_id: str):
+        """State of an upload, next_index is the chunk to send when an upload is resumed
+
+        Args:
+            project_name (str)
+            upload_id (str)
+        """
+        _, state = get_chunked_upload(project_name, upload_id)
+        return { "status": "OK", "data": state }
+
+    def delete(self, project_name: str, upload_id: str):
+        """Abandon an upload
+
+        Args:
+            project_name (str)
+            upload_id (str)
+        """
+        get_chunked_upload(project_name, upload_id)
+        ChunkedUploadService.delete(upload_id)
+        return { "status": "OK" }
+
+
+@api.route("/<string:project_name>/samples/uploads/<string:upload_id>/chunks/<int:index>")
+class ChunkedUploadChunkResource(Resource):
+
+    def put(self, project_name: str, upload_id: str, index: int):
+        """Send a chunk of the file, the chunks are sent in order from 0 and a chunk can be sent again.
+        The complete sentences of the chunk are checked at once, a format error fails the upload
+
+        Args:
+            - project_name(str)
+            - upload_id(str)
+            - index(int)
+            - body: the bytes of the chunk
+            - X-Chunk-Checksum (header): sha256 of the chunk
+
+        Returns:
+            - { "status": ok, "data": state of the upload }, 413 if the chunk is bigger than
+              Config.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+        """
+        get_chunked_upload(project_name, upload_id)
+        data = ChunkedUploadService.read_chunk(request.stream, request.content_length)
+        state = ChunkedUploadService.add_chunk(upload_id, index, data, request.headers.get("X-Chunk-Checksum"))
+        return { "status": "OK", "data": state }
+
+
+@api.route("/<string:project_name>/samples/uploads/<string:upload_id>/complete")
+class ChunkedUploadCompleteResource(Resource):
+
+    def post(self, project_name: str, upload_id: str):
+        """All the chunks were sent, save the sample
+
+        Args:
+            project_name (str)
+            upload_id (str)
+
+        Returns:
+            - { "status": ok, "response": list of detected annotation tag in the uploaded sample and its result}
+        """
+        project, _ = get_chunked_upload(project_name, upload_id)
+        ProjectAccessService.check_admin_access(project.id)
+        ProjectService.check_if_freezed(project)
+
+        existing_samples = [sa["name"] for sa in GrewService.get_samples(project_name)]
+        result = ChunkedUploadService.complete(upload_id, existing_samples=existing_samples)
+        pos_list, relation_list, feat_list, misc_list = GrewService.get_config_from_samples(project_name, [result["sample_name"]])
+        response = {
+            "pos": pos_list,
+            "relations": relation_list,
+            "feats": feat_list,
+            "misc": misc_list,
+            "samples": [result],
+        }
+        LastAccessService.update_last_access_per_user_and_project(current_user.id, project_name, "write")
+        return { "status": "OK", "data": response }
+
+
 @api.route("/<string:project_name>/samples/<string:sample_name>/sample-name")
 class SampleNameResource(Resource):
     
@@ -272,25 +405,29 @@ class ExportSampleResource(Resource):
             project_name (str)
             sample_names (List[str])
             users (List[str]): the trees of user that will be exported
+            format (str, optional): zip (default) | tar
+            compression (str, optional): deflate (default) | stored for zip, gzip (default) | xz | zstd | none for tar
+            compressionLevel (int, optional): 0-9 (1-22 for zstd), low levels are faster
+            background (query string): run the export as a job, the archive is then downloaded from the job file endpoint
         Returns:
-            zip file as an attachement
+            archive as an attachement
         """
         args = request.get_json()
         sample_names = args.get("sampleNames")
         users = args.get("users")
-        sample_names, samples_with_string_content = GrewService.get_samples_with_string_contents(project_name, sample_names)
-
-        memory_file = SampleExportService.content_files_to_zip(
-            sample_names, samples_with_string_content, users
-        )
-
-        resp = Response(
-            memory_file,
-            status=200,
-            mimetype="application/zip",
-            headers={
-                "Content-Disposition": "attachment;filename=dump.{}.zip".format(project_name)
-            },
+        try:
+            export_format = ExportFormat.from_args(args)
+        except ValueError as e:
+            abort(400, str(e))
+        if JobService.is_background_request():
+            project = ProjectService.get_by_name(project_name)
+            params = { "project_name": project_name, "sample_names": sample_names, "users": users, **export_format.to_args() }
+            job = JobService.submit("export", project.id, current_user.id, params)
+            return { "status": "OK", "data": { "jobId": job.uuid } }, 202
+
+        samples_members = SampleExportService.iter_samples_members(
+            project_name, sample_names, users, max_workers=grew_config.samples_fetch_workers
         )
-        return resp
+        chunks = SampleExportService.iter_archive(itertools.chain.from_iterable(samples_members), export_format)
+        return SampleExportService.archive_response(chunks, "dump.{}".format(project_name), export_format)
 
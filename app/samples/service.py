@@ -1,77 +1,316 @@
+import codecs
+import copy
+import fcntl
+import hashlib
+import io
+import itertools
+import json
 import os
 import re
-from typing import List, Literal, Dict
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 from datetime import datetime
 from collections import Counter
 
-from conllup.conllup import sentenceConllToJson, readConlluFile, sentenceJsonToConll
+from conllup.conllup import sentenceConllToJson, readConlluFile, sentenceJsonToConll, findConllFormatErrors
 from flask import abort
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException
 
-from app import db
+from app import db, grew_config
 from app.config import Config
-from app.projects.service import ProjectService
-from app.utils.grew_utils import GrewService
+from app.jobs.service import JobContext, job_handler
+from app.projects.service import LastAccessService, ProjectService
+from app.utils.concurrency import imap_in_threads
+from app.utils.export_archive import ExportFormat
+from app.utils.grew_utils import GrewService, SampleExportService
+from app.utils.tokenizer import get_tokenizer
 from app.github.service import GithubCommitStatusService, GithubRepositoryService
 
 from .model import SampleBlindAnnotationLevel
 
 BASE_TREE = "base_tree"
+UPLOAD_EXTENSIONS = re.compile(r"\.(conll(u|\d+)?|txt|tsv|csv)$")
+CHUNKED_UPLOAD_FOLDER = os.path.join(Config.UPLOAD_FOLDER, "chunked")
+CONLL_SENTENCE_BOUNDARY = re.compile(rb"\n\r?\n")
 
 
 class SampleUploadService:
     @staticmethod
     def upload(
-        fileobject: FileStorage,
+        fileobjects: List[FileStorage],
         project_name: str,
-        filename, 
-        sample_name,
         rtl: bool,
         existing_samples=[],
         new_username='',
         samples_without_sent_ids=[],
-    ):	
-        """uplaod new sample
+        on_result: Callable[[int, Dict], None] = None,
+    ) -> List[Dict]:
+        """upload new samples, a file that can't be uploaded doesn't stop the others. The files are checked
+        and rewritten by Config.UPLOAD_WORKERS threads and each rewritten file is created and saved in grew
+        right away, with at most grew_config.samples_save_workers grew calls in flight
 
         Args:
-            fileobject (FileStorage): 
+            fileobjects (List[FileStorage]): 
             project_name (str):
-            filename (str): 
-            sample_name (str): filename without the extension
-            rtl (bool): _description_
+            rtl (bool): right to left script
             existing_samples (list[str]): existing sample
             new_username (str): the custom username used of the uploaded trees, or the same as the username
             samples_without_sent_ids (list[str]): list of samples that doesn't contain sent_ids Defaults to [].
+            on_result (Callable[[int, dict], None], optional): called with the number of processed files and the
+                result of the last one, in the calling thread
+
+        Returns:
+            List[dict]: {"file_name", "sample_name", "status": "OK" | "FAILED", "code", "message"} of every file, in order
         """
         project = ProjectService.get_by_name(project_name)
-        path_file = os.path.join(Config.UPLOAD_FOLDER, filename)
+        uploads = []
+        for index, fileobject in enumerate(fileobjects):
+            filename = secure_filename(fileobject.filename)
+            sample_name = UPLOAD_EXTENSIONS.sub("", filename)
+            # a unique path, files of the same name can be uploaded together or by concurrent requests
+            fd, path_file = tempfile.mkstemp(dir=Config.UPLOAD_FOLDER, suffix="_" + filename)
+            os.close(fd)
+            error = None
+            try:
+                fileobject.save(path_file)
+            except OSError as e:
+                error = (500, "The file could not be stored: {}".format(e))
+            transformer = ConlluTransformer(
+                sample_name,
+                user_id=new_username,
+                rtl=rtl == True,
+                new_sent_ids=bool(samples_without_sent_ids and sample_name in samples_without_sent_ids),
+                check_duplicate_sent_ids=True,
+                check_user_ids=True,
+            )
+            uploads.append({"index": index, "file_name": filename, "sample_name": sample_name, "path_file": path_file, "transformer": transformer, "error": error})
+
+        def save_sample(transformed):
+            upload, error = transformed
+            try:
+                if error is None:
+                    if upload["sample_name"] not in existing_samples:
+                        GrewService.create_samples(project_name, [upload["sample_name"]])
+                    with open(upload["path_file"], "rb") as file_to_save:
+                        GrewService.save_sample(project_name, upload["sample_name"], file_to_save)
+            except HTTPException as e:
+                error = (e.code, e.description)
+            except OSError as e:
+                error = (500, "The file could not be read: {}".format(e))
+            finally:
+                if os.path.exists(upload["path_file"]):
+                    os.remove(upload["path_file"])
+            result = {"file_name": upload["file_name"], "sample_name": upload["sample_name"], "status": "OK"}
+            if error:
+                result.update(status="FAILED", code=error[0], message=error[1])
+            return upload["index"], result
+
+        saved = []
+        try:
+            for index, result in imap_in_threads(save_sample, _iter_transformed_uploads(uploads), grew_config.samples_save_workers):
+                saved.append((index, result))
+                if on_result:
+                    on_result(len(saved), result)
+        finally:
+            # the files left when on_result interrupts the upload
+            for upload in uploads:
+                if os.path.exists(upload["path_file"]):
+                    os.remove(upload["path_file"])
+        results = [result for _, result in sorted(saved, key=lambda indexed_result: indexed_result[0])]
+
+        if GithubRepositoryService.get_by_project_id(project.id):
+            for result in results:
+                if result["status"] == "OK":
+                    GithubCommitStatusService.create(project.id, result["sample_name"])
+                    if new_username == 'validated':
+                        GithubCommitStatusService.update_changes(project.id, result["sample_name"])
+        return results
+
+class ChunkedUploadService:
+    """
+        Resumable upload of a large sample: the file is sent in numbered chunks, each with its sha256 checksum.
+        The complete sentences of every chunk are checked and rewritten as soon as the chunk arrives, so only the
+        rewritten file and the incomplete last sentence are kept on disk. The state is stored in the upload folder
+        since the chunks of an upload can be received by different worker processes.
+    """
+    @staticmethod
+    def create(project_name: str, user_id: str, file_name: str, username: str, rtl: bool, new_sent_ids: bool = False) -> Dict:
+        """Start a chunked upload
 
-        fileobject.save(path_file)
+        Args:
+            project_name (str)
+            user_id (str): the user uploading the file
+            file_name (str)
+            username (str): the username used for the uploaded trees
+            rtl (bool): right to left script
+            new_sent_ids (bool, optional): the file doesn't contain sent_ids
 
-        if samples_without_sent_ids and sample_name in samples_without_sent_ids: 
-            add_new_sent_ids(path_file, sample_name) 
-        
-        check_duplicate_sent_id(path_file, sample_name)
-        check_if_file_has_user_ids(path_file, sample_name)
+        Returns:
+            dict: state of the upload
+        """
+        ChunkedUploadService.delete_expired()
+        file_name = secure_filename(file_name)
+        state = {
+            "upload_id": str(uuid.uuid4()),
+            "project_name": project_name,
+            "user_id": user_id,
+            "file_name": file_name,
+            "sample_name": UPLOAD_EXTENSIONS.sub("", file_name),
+            "username": username,
+            "rtl": rtl == True,
+            "new_sent_ids": new_sent_ids,
+            "timestamp": str(datetime.timestamp(datetime.now()) * 1000),
+            "next_index": 0,
+            "checksums": [],
+            "received_bytes": 0,
+            "output_size": 0,
+            "line": 1,
+            "sentences": 0,
+            "error": None,
+            "updated_at": time.time(),
+        }
+        os.makedirs(_chunked_upload_folder(state["upload_id"]))
+        _save_chunked_upload_state(state)
+        return state
 
-        add_or_replace_userid(path_file, new_username)
-        add_or_keep_timestamps(path_file)
-        
-        if rtl == True:
-            add_rtl_meta_data(path_file)
+    @staticmethod
+    def get_state(upload_id: str) -> Dict:
+        """Get the state of an upload, e.g. to know the next chunk to send after an interruption
 
-        if sample_name not in existing_samples: 
-            GrewService.create_samples(project_name, [sample_name])
+        Args:
+            upload_id (str)
+
+        Returns:
+            dict
+        """
+        return _read_chunked_upload_state(upload_id)
+
+    @staticmethod
+    def read_chunk(stream: IO[bytes], content_length: Optional[int]) -> bytes:
+        """Read the body of a chunk request, aborts with 413 if it is bigger than Config.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+
+        Args:
+            stream (IO[bytes]): request.stream
+            content_length (int | None): None if the request is sent with chunked transfer encoding
+
+        Returns:
+            bytes
+        """
+        max_size = Config.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+        if content_length is not None and content_length > max_size:
+            abort(413, "A chunk can't be bigger than {} bytes".format(max_size))
+        pieces = []
+        size = 0
+        while size <= max_size:
+            piece = stream.read(max_size + 1 - size)
+            if not piece:
+                break
+            pieces.append(piece)
+            size += len(piece)
+        if size > max_size:
+            abort(413, "A chunk can't be bigger than {} bytes".format(max_size))
+        return b"".join(pieces)
+
+    @staticmethod
+    def add_chunk(upload_id: str, index: int, data: bytes, checksum: str) -> Dict:
+        """Receive a chunk and transform the sentences it completes. A chunk already received is acknowledged
+        again so that a client can resend the chunk whose reply was lost
+
+        Args:
+            upload_id (str)
+            index (int): number of the chunk, from 0
+            data (bytes)
+            checksum (str): sha256 of data, hex encoded
+
+        Returns:
+            dict: state of the upload
+        """
+        with _locked_chunked_upload(upload_id) as state:
+            _abort_if_failed(state)
+            data_checksum = hashlib.sha256(data).hexdigest()
+            if (checksum or "").lower() != data_checksum:
+                abort(400, "Checksum mismatch for chunk {}, it must be sent again".format(index))
+            if index < state["next_index"]:
+                if state["checksums"][index] != data_checksum:
+                    abort(409, "Chunk {} was already received with another content".format(index))
+                return state
+            if index > state["next_index"]:
+                abort(409, "Chunk {} is expected".format(state["next_index"]))
+
+            pending = _read_chunked_upload_tail(state) + data
+            boundaries = [match.end() for match in CONLL_SENTENCE_BOUNDARY.finditer(pending)]
+            complete_size = boundaries[-1] if boundaries else 0
+            # the tail is read again with every chunk, it can't grow without end
+            if len(pending) - complete_size > Config.CHUNKED_UPLOAD_MAX_SENTENCE_SIZE:
+                _fail_chunked_upload(state, 400, "`{}` has a sentence bigger than {} bytes, the sentences must be separated by an empty line".format(
+                    state["file_name"], Config.CHUNKED_UPLOAD_MAX_SENTENCE_SIZE
+                ))
+            _transform_chunked_upload_part(state, pending[:complete_size])
+
+            state["next_index"] += 1
+            state["checksums"].append(data_checksum)
+            state["received_bytes"] += len(data)
+            _write_chunked_upload_tail(state, pending[complete_size:])
+            _save_chunked_upload_state(state)
+            return state
+
+    @staticmethod
+    def complete(upload_id: str, existing_samples: List[str] = []) -> Dict:
+        """Transform the last sentence and save the sample in grew
 
-        with open(path_file, "rb") as file_to_save:
-            GrewService.save_sample(project_name, sample_name, file_to_save)
+        Args:
+            upload_id (str)
+            existing_samples (List[str], optional)
+
+        Returns:
+            dict: {"file_name", "sample_name", "status"} as the results of SampleUploadService.upload
+        """
+        with _locked_chunked_upload(upload_id) as state:
+            _abort_if_failed(state)
+            if state["received_bytes"] == 0:
+                abort(406, "You provided an empty conllu `{}`".format(state["file_name"]))
+            _transform_chunked_upload_part(state, _read_chunked_upload_tail(state))
+
+            project_name, sample_name = state["project_name"], state["sample_name"]
+            if sample_name not in existing_samples:
+                GrewService.create_samples(project_name, [sample_name])
+            with open(_chunked_upload_output(state), "rb") as file_to_save:
+                GrewService.save_sample(project_name, sample_name, file_to_save)
+
+            project = ProjectService.get_by_name(project_name)
             if GithubRepositoryService.get_by_project_id(project.id):
                 GithubCommitStatusService.create(project.id, sample_name)
-                if new_username == 'validated':
+                if state["username"] == 'validated':
                     GithubCommitStatusService.update_changes(project.id, sample_name)
-        
-        os.remove(path_file)
+        ChunkedUploadService.delete(upload_id)
+        return {"file_name": state["file_name"], "sample_name": sample_name, "status": "OK"}
+
+    @staticmethod
+    def delete(upload_id: str):
+        """Abandon an upload and delete its files
+
+        Args:
+            upload_id (str)
+        """
+        shutil.rmtree(_chunked_upload_folder(upload_id), ignore_errors=True)
+
+    @staticmethod
+    def delete_expired():
+        """Delete the uploads without new chunk for Config.CHUNKED_UPLOAD_EXPIRY seconds"""
+        if not os.path.isdir(CHUNKED_UPLOAD_FOLDER):
+            return
+        for upload_id in os.listdir(CHUNKED_UPLOAD_FOLDER):
+            state_path = os.path.join(_chunked_upload_folder(upload_id), "state.json")
+            if not os.path.exists(state_path) or os.path.getmtime(state_path) < time.time() - Config.CHUNKED_UPLOAD_EXPIRY:
+                ChunkedUploadService.delete(upload_id)
+
 
 class SampleTokenizeService:
 
@@ -92,42 +331,27 @@ class SampleTokenizeService:
         samples_names = [sample["name"] for sample in existing_samples]
         project = ProjectService.get_by_name(project_name)
         if sample_name not in samples_names:
-            GrewService.create_samples(project_name, [sample_name])
             index = 0
         else: 
             index = [sample["number_sentences"] for sample in existing_samples if sample_name == sample["name"]][0]
-        conll= str()
+
+        # the conll is generated while it is sent to grew, with the metadata the uploaded files get
+        metadata = conll_metadata(username, rtl == True)
         if lang:
-            list_tokens = tokenize_plain_text(text=text, lang=lang)
-            conll = conllize_plain_text(sent2toks=list_tokens,sample_name=sample_name, start=index)
-        else: 
-            sentences = split_sentences(text, option)
-            for i in range(len(sentences)):
-                if (sentences[i]):
-                    index += 1
-                    conll += conllize_sentence(sentences[i], sample_name, index, option)
-                    
-
-        file_name = sample_name + ".conllu"
-        path_file = os.path.join(Config.UPLOAD_FOLDER, file_name)
-        
-        with open(path_file, "w") as file:
-            file.write(conll)
-            
-        add_or_replace_userid(path_file, username)
-        add_or_keep_timestamps(path_file)
-        
-        if rtl == True:
-            add_rtl_meta_data(path_file)
-
-        with open(path_file, "rb") as file_to_save:
-            GrewService.save_sample(project_name, sample_name, file_to_save)
-            if GithubRepositoryService.get_by_project_id(project.id):
-                GithubCommitStatusService.create(project.id, sample_name)
-                if username == "validated":
-                    GithubCommitStatusService.update_changes(project.id, sample_name)
-        
-        os.remove(path_file)    
+            conll_lines = iter_conll_plain_text(get_tokenizer(lang).tokenize(text), sample_name, index, metadata)
+        else:
+            conll_lines = iter_conll_sentences(split_sentences(text, option), sample_name, index, option, metadata)
+        first_line = next(conll_lines, None)
+        if first_line is None:
+            abort(406, "You provided an empty conllu `{}`".format(sample_name + ".conllu"))
+
+        if sample_name not in samples_names:
+            GrewService.create_samples(project_name, [sample_name])
+        GrewService.save_sample(project_name, sample_name, itertools.chain([first_line], conll_lines))
+        if GithubRepositoryService.get_by_project_id(project.id):
+            GithubCommitStatusService.create(project.id, sample_name)
+            if username == "validated":
+                GithubCommitStatusService.update_changes(project.id, sample_name)
 
 class SampleBlindAnnotationLevelService:
     
@@ -315,6 +539,71 @@ class SampleEvaluationService:
         else: 
             abort(400, 'There is no available trees for evaluation')
 
+@job_handler("upload")
+def run_upload_job(context: JobContext):
+    """Background version of the upload endpoint, the partial result lists the files already processed"""
+    params = context.params
+    project_name = params["project_name"]
+    existing_samples = [sample["name"] for sample in GrewService.get_samples(project_name)]
+    fileobjects = [
+        FileStorage(open(os.path.join(context.workdir, file["path"]), "rb"), filename=file["filename"])
+        for file in params["files"]
+    ]
+    context.update(total=len(fileobjects))
+    processed = []
+
+    def report(done, result):
+        processed.append(result)
+        context.update(progress=done, result={"samples": processed})
+
+    try:
+        results = SampleUploadService.upload(
+            fileobjects,
+            project_name,
+            params["rtl"],
+            existing_samples=existing_samples,
+            new_username=params["username"],
+            samples_without_sent_ids=params.get("samples_without_sent_ids") or [],
+            on_result=report,
+        )
+    finally:
+        for fileobject in fileobjects:
+            fileobject.close()
+            os.remove(fileobject.stream.name)
+
+    sample_names = [result["sample_name"] for result in results if result["status"] == "OK"]
+    if not sample_names:
+        abort(results[0]["code"], results[0]["message"])
+    pos_list, relation_list, feat_list, misc_list = GrewService.get_config_from_samples(project_name, sample_names)
+    LastAccessService.update_last_access_per_user_and_project(context.job.user_id, project_name, "write")
+    return {"pos": pos_list, "relations": relation_list, "feats": feat_list, "misc": misc_list, "samples": results}
+
+
+@job_handler("export")
+def run_export_job(context: JobContext):
+    """Background version of the export endpoint, the zip is downloaded from the job file endpoint"""
+    params = context.params
+    project_name = params["project_name"]
+    sample_names = params["sample_names"]
+    context.update(total=len(sample_names) + 1)
+
+    export_format = ExportFormat.from_args(params)
+    file_name = export_format.file_name("dump.{}".format(project_name))
+    samples_members = SampleExportService.iter_samples_members(
+        project_name, sample_names, params["users"], grew_config.samples_fetch_workers
+    )
+
+    def members():
+        for index, sample_members in enumerate(samples_members, start=1):
+            yield from sample_members
+            context.update(progress=index)
+
+    with open(os.path.join(context.workdir, file_name), "wb") as zip_file:
+        for chunk in SampleExportService.iter_archive(members(), export_format):
+            zip_file.write(chunk)
+    context.update(progress=len(sample_names) + 1)
+    return {"file": file_name}
+
 #
 #
 #############    Helpers Function    #############
@@ -349,31 +638,366 @@ def write_conllu_file_wrapper(path_file: str, sentences_json: List[Dict]):
             sentence_conll = sentenceJsonToConll(sentence_json)
             outfile.write(sentence_conll + "\n")
 
+class ConlluTransformer:
+    """
+        Checks and metadata rewrites of a sample done in a single pass: the conll is read sentence by sentence,
+        every sentence is parsed and serialized once whatever the number of rewrites, and the result is written once.
+        Used for the uploaded files, the tokenized texts, the github imports and the parsed samples.
+    """
+    READ_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        sample_name: str = "",
+        user_id: Optional[str] = None,
+        timestamp: Optional[Literal["now", "long_ago"]] = "now",
+        rtl: bool = False,
+        new_sent_ids: Union[bool, Literal["if_missing"]] = False,
+        check_duplicate_sent_ids: bool = False,
+        check_user_ids: bool = False,
+    ):
+        """
+        Args:
+            sample_name (str, optional): used for the new sent_ids and the error messages
+            user_id (str, optional): replace the user_id of the trees
+            timestamp (now | long_ago, optional): added to the trees without timestamp, None to keep them as they are
+            rtl (bool, optional): add the rtl metadata
+            new_sent_ids (bool | if_missing, optional): number the sentences sample_name__1, sample_name__2...,
+                if_missing does it only when a sentence of the file has no sent_id
+            check_duplicate_sent_ids (bool, optional): abort if a sent_id is used twice
+            check_user_ids (bool, optional): abort if a tree already has a user_id
+        """
+        self.sample_name = sample_name
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.rtl = rtl
+        self.new_sent_ids = new_sent_ids
+        self.check_duplicate_sent_ids = check_duplicate_sent_ids
+        self.check_user_ids = check_user_ids
+
+    def write(self, source: Union[str, IO], path_file: str, file_name: str = None):
+        """Transform the conll of source and write it in path_file, which can also be the file read
+
+        Args:
+            source (str | file object): conll content, text or binary file object (e.g. FileStorage.stream)
+            path_file (str)
+            file_name (str, optional): for the error messages, the name of path_file by default
+        """
+        file_name = file_name or os.path.basename(path_file)
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path_file) or ".", suffix=".conllu")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as outfile:
+                try:
+                    outfile.writelines(self.iter_sentences(source, file_name))
+                except _MissingSentId:
+                    source.seek(0)
+                    outfile.seek(0)
+                    outfile.truncate()
+                    renumbering = copy.copy(self)
+                    renumbering.new_sent_ids = True
+                    outfile.writelines(renumbering.iter_sentences(source, file_name))
+            os.replace(tmp_path, path_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def rewrite(self, path_file: str, file_name: str = None):
+        """Transform a conll file in place
+
+        Args:
+            path_file (str)
+            file_name (str, optional): see write
+        """
+        with open(path_file, "rb") as infile:
+            self.write(infile, path_file, file_name)
+
+    def iter_sentences(self, source: IO, file_name: str, state: Dict = None, first_line: int = 1) -> Iterator[str]:
+        """Transformed sentences of source, each followed by an empty line
+
+        Args:
+            source (file object): text or binary
+            file_name (str): for the error messages
+            state (dict, optional): see new_state, to continue a transformation started on a previous part of the file
+            first_line (int, optional): number of the first line of source in the file
+
+        Yields:
+            str
+        """
+        state = state if state is not None else self.new_state()
+        for first_line, sentence_conll in _iter_sentence_blocks(_iter_lines(source, file_name), first_line):
+            if sentence_conll.strip():
+                yield self.transform_sentence(sentence_conll, first_line, file_name, state)
+
+    def new_state(self, sent_ids=None) -> Dict:
+        """What the transformation of a file keeps from one sentence to the next
+
+        Args:
+            sent_ids (set-like, optional): sent_ids already seen, a persistent set can be given for
+                a file transformed in several parts
+
+        Returns:
+            {"index": number of sentences, "timestamp": timestamp of the file, "sent_ids"}
+        """
+        timestamp_str = str(datetime.timestamp(datetime.now()) * 1000)
+        if self.timestamp == "long_ago":
+            timestamp_str = 0
+        return {"index": 0, "timestamp": timestamp_str, "sent_ids": set() if sent_ids is None else sent_ids}
+
+    def transform_sentence(self, sentence_conll: str, first_line: int, file_name: str, state: Dict) -> str:
+        """Check and rewrite one sentence
+
+        Args:
+            sentence_conll (str)
+            first_line (int): number of the first line of the sentence in the file, for the error messages
+            file_name (str)
+            state (dict): see new_state
+
+        Returns:
+            str: the sentence followed by an empty line
+        """
+        sentence_json = _parse_sentence(sentence_conll, first_line, file_name)
+        meta_json = sentence_json["metaJson"]
+        state["index"] += 1
+
+        if self.new_sent_ids == "if_missing" and "sent_id" not in meta_json:
+            raise _MissingSentId()
+        if self.new_sent_ids is True:
+            meta_json["sent_id"] = "{}__{}".format(self.sample_name, state["index"])
+        if self.check_duplicate_sent_ids and "sent_id" in meta_json:
+            if meta_json["sent_id"] in state["sent_ids"]:
+                abort(406, "{} has duplicated sent_ids".format(self.sample_name))
+            state["sent_ids"].add(meta_json["sent_id"])
+        if self.check_user_ids and meta_json.get("user_id"):
+            abort(406, "{} has sentences with user_id".format(self.sample_name))
+
+        if self.user_id is not None:
+            meta_json["user_id"] = self.user_id
+        if self.timestamp:
+            meta_json["timestamp"] = meta_json.get("timestamp", state["timestamp"])
+        if self.rtl:
+            meta_json["rtl"] = "yes"
+        return sentenceJsonToConll(sentence_json) + "\n"
+
+
+class _MissingSentId(Exception):
+    """A sentence has no sent_id, the file is transformed again with new sent_ids"""
+
+
+def _iter_lines(source: IO, file_name: str) -> Iterator[str]:
+    """Lines of a text or binary file object, without the line breaks"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    rest = ""
+    is_first_read = True
+    while True:
+        data = source.read(ConlluTransformer.READ_SIZE)
+        if is_first_read and not data:
+            print("debug_read_conll: empty conllu {}".format(file_name))
+            abort(406, "You provided an empty conllu `{}`".format(file_name))
+        is_first_read = False
+        text = data
+        if not isinstance(data, str):
+            try:
+                text = decoder.decode(data, final=not data)
+            except UnicodeDecodeError as e:
+                print("debug_read_conll: {}".format(str(e)))
+                abort(406, "{} is not encoded in utf-8".format(file_name))
+        lines = (rest + text).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+        if not data:
+            if rest:
+                yield rest.rstrip("\r")
+            return
+
+
+def _iter_sentence_blocks(lines: Iterable[str], start: int = 1) -> Iterator[Tuple[int, str]]:
+    """(number of the first line, conll) of the blocks separated by empty lines"""
+    block = []
+    first_line = start
+    for line_number, line in enumerate(lines, start=start):
+        if line:
+            if not block:
+                first_line = line_number
+            block.append(line)
+        elif block:
+            yield first_line, "\n".join(block)
+            block = []
+    if block:
+        yield first_line, "\n".join(block)
+
+
+def _transform_uploaded_file(upload: Dict) -> Tuple[Dict, Optional[Tuple[int, str]]]:
+    """Rewrite an uploaded file, the error is returned as (code, message) so that it is reported with the
+    file instead of stopping the others"""
+    try:
+        upload["transformer"].rewrite(upload["path_file"], upload["file_name"])
+    except HTTPException as e:
+        return upload, (e.code, e.description)
+    except OSError as e:
+        return upload, (500, "The file could not be rewritten: {}".format(e))
+    return upload, None
+
+
+def _iter_transformed_uploads(uploads: List[Dict]) -> Iterator[Tuple[Dict, Optional[Tuple[int, str]]]]:
+    """(upload, error) of the uploaded files, the ones that could not be stored first. The rewrite reads and
+    writes temporary files, it runs in threads of the worker rather than in forked processes"""
+    for upload in uploads:
+        # not stored
+        if upload["error"]:
+            yield upload, upload["error"]
+    uploads = [upload for upload in uploads if not upload["error"]]
+    yield from imap_in_threads(_transform_uploaded_file, uploads, Config.UPLOAD_WORKERS)
+
+
+def _chunked_upload_folder(upload_id: str) -> str:
+    return os.path.join(CHUNKED_UPLOAD_FOLDER, secure_filename(upload_id))
+
+
+def _chunked_upload_output(state: Dict) -> str:
+    return os.path.join(_chunked_upload_folder(state["upload_id"]), "output.conllu")
+
+
+def _read_chunked_upload_state(upload_id: str) -> Dict:
+    try:
+        with open(os.path.join(_chunked_upload_folder(upload_id), "state.json")) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        abort(404, "There is no such upload, it may have expired")
+
+
+def _save_chunked_upload_state(state: Dict):
+    state["updated_at"] = time.time()
+    state_path = os.path.join(_chunked_upload_folder(state["upload_id"]), "state.json")
+    with open(state_path + ".tmp", "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(state_path + ".tmp", state_path)
+
+
+@contextmanager
+def _locked_chunked_upload(upload_id: str) -> Iterator[Dict]:
+    """State of an upload, locked against the other requests of the same upload (e.g. a resent chunk)"""
+    _read_chunked_upload_state(upload_id)
+    with open(os.path.join(_chunked_upload_folder(upload_id), "lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield _read_chunked_upload_state(upload_id)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _abort_if_failed(state: Dict):
+    if state["error"]:
+        abort(state["error"]["code"], state["error"]["message"])
+
+
+def _fail_chunked_upload(state: Dict, code: int, message: str):
+    """Store the error in the state so that the next requests of the upload fail too, and abort"""
+    state["error"] = {"code": code, "message": message}
+    _save_chunked_upload_state(state)
+    abort(code, message)
+
+
+def _read_chunked_upload_tail(state: Dict) -> bytes:
+    """The incomplete sentence at the end of the chunks received so far"""
+    tail_path = os.path.join(_chunked_upload_folder(state["upload_id"]), "tail.{}".format(state["next_index"]))
+    if not os.path.exists(tail_path):
+        return b""
+    with open(tail_path, "rb") as tail_file:
+        return tail_file.read()
+
+
+def _write_chunked_upload_tail(state: Dict, tail: bytes):
+    # one tail file by chunk so that the state and its tail can't disagree if the process stops in between
+    folder = _chunked_upload_folder(state["upload_id"])
+    with open(os.path.join(folder, "tail.{}".format(state["next_index"])), "wb") as tail_file:
+        tail_file.write(tail)
+    previous_tail = os.path.join(folder, "tail.{}".format(state["next_index"] - 1))
+    if os.path.exists(previous_tail):
+        os.remove(previous_tail)
+
+
+class _SentIdsStore:
+    """sent_ids already received by a chunked upload, in a sqlite file shared by the worker processes.
+    The chunk of every sent_id is kept so that a chunk processed again replaces its own sent_ids"""
+
+    def __init__(self, path: str, chunk_index: int):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sent_ids (sent_id TEXT PRIMARY KEY, chunk INTEGER)")
+        self.connection.execute("DELETE FROM sent_ids WHERE chunk >= ?", (chunk_index,))
+        self.chunk_index = chunk_index
+
+    def __contains__(self, sent_id: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM sent_ids WHERE sent_id = ?", (sent_id,)).fetchone() is not None
+
+    def add(self, sent_id: str):
+        self.connection.execute("INSERT OR IGNORE INTO sent_ids VALUES (?, ?)", (sent_id, self.chunk_index))
+
+    def close(self, commit: bool):
+        if commit:
+            self.connection.commit()
+        self.connection.close()
+
+
+def _transform_chunked_upload_part(state: Dict, part: bytes):
+    """Transform complete sentences of an upload and append them to its output, a failure is stored in the state"""
+    if not part.strip():
+        return
+    transformer = ConlluTransformer(
+        state["sample_name"],
+        user_id=state["username"],
+        rtl=state["rtl"],
+        new_sent_ids=state["new_sent_ids"],
+        check_duplicate_sent_ids=True,
+        check_user_ids=True,
+    )
+    folder = _chunked_upload_folder(state["upload_id"])
+    sent_ids = _SentIdsStore(os.path.join(folder, "sent_ids.sqlite"), state["next_index"])
+    transform_state = {"index": state["sentences"], "timestamp": state["timestamp"], "sent_ids": sent_ids}
+    committed = False
+    try:
+        with open(_chunked_upload_output(state), "ab") as output:
+            # drops what a chunk interrupted before saving its state had written
+            output.truncate(state["output_size"])
+            for sentence in transformer.iter_sentences(io.BytesIO(part), state["file_name"], transform_state, state["line"]):
+                output.write(sentence.encode("utf-8"))
+            state["output_size"] = output.tell()
+        committed = True
+    except HTTPException as e:
+        state["error"] = {"code": e.code, "message": e.description}
+        _save_chunked_upload_state(state)
+        raise
+    finally:
+        sent_ids.close(committed)
+    state["sentences"] = transform_state["index"]
+    state["line"] += part.count(b"\n")
+
+
+def _parse_sentence(sentence_conll: str, first_line: int, file_name: str):
+    try:
+        return sentenceConllToJson(sentence_conll)
+    except Exception as e:
+        # the padding keeps the line numbers of the whole file in the error messages
+        errors = findConllFormatErrors("\n" * (first_line - 1) + sentence_conll)
+        error_text = "\n".join(errors) if errors else str(e)
+        message = "Parsing Errors with file `{}` :\n{}".format(file_name, error_text)
+        print('debug_read_conll: {}'.format(message))
+        abort(406, message)
+
 def add_or_keep_timestamps(path_file: str, when: Literal["now", "long_ago"] = "now"):
     """ adds a timestamp on the tree if there is not one """
-    sentences_json = read_conllu_file_wrapper(path_file, keepEmptyTrees=True)
-    timestamp_str = str(datetime.timestamp(datetime.now()) * 1000)
-    if when == "long_ago":
-        timestamp_str = 0
-    for sentence_json in sentences_json:
-        sentence_json["metaJson"]["timestamp"] = sentence_json["metaJson"].get("timestamp", timestamp_str)
-
-    write_conllu_file_wrapper(path_file, sentences_json)
+    ConlluTransformer(timestamp=when).rewrite(path_file)
 
 def add_or_replace_userid(path_file: str, new_user_id: str):
     """ adds a userid on the tree or replace it if already has one """
-    sentences_json = read_conllu_file_wrapper(path_file, keepEmptyTrees=True)
-    for sentence_json in sentences_json:
-        sentence_json["metaJson"]["user_id"] = new_user_id
-
-    write_conllu_file_wrapper(path_file, sentences_json)
+    ConlluTransformer(user_id=new_user_id, timestamp=None).rewrite(path_file)
     
 def add_rtl_meta_data(path_file: str):
     """Add metadata rtl to the sentences in order to display dependency tree in rtl mode"""
-    sentences_json = read_conllu_file_wrapper(path_file, keepEmptyTrees=True)
-    for sentence_json in sentences_json:
-        sentence_json["metaJson"]["rtl"] = "yes"   
-    write_conllu_file_wrapper(path_file, sentences_json)
+    ConlluTransformer(timestamp=None, rtl=True).rewrite(path_file)
 
 def check_duplicate_sent_id(path_file: str, sample_name: str):
     """Check if there is duplicated sent_id in the sample"""
@@ -401,22 +1025,11 @@ def check_sentences_without_sent_ids(path_file: str):
 
 def add_new_sent_ids(path_file: str, sample_name):
     """ adds sent_id for samples that don't have sent_ids"""
-    index = 0
-    sentences_json = read_conllu_file_wrapper(path_file,keepEmptyTrees= True)
-    for sentence_json in sentences_json:
-        index+=1
-        sentence_json["metaJson"]["sent_id"] = '{}__{}'.format(sample_name, index)
-    write_conllu_file_wrapper(path_file, sentences_json)
+    ConlluTransformer(sample_name, timestamp=None, new_sent_ids=True).rewrite(path_file)
     
 
 ###########################"tokenizer Kim's script" ###########################
 
-re_url = re.compile(r'''(https?://|\w+@)?[\w\d\%\.]*\w\w\.\w\w[\w\d~/\%\#]*(\?[\w\d~/\%\#]+)*''', re.U+re.M+re.I)
-# combinations of numbers:
-re_spacenum = re.compile(r'\d+[ ,.]+[0-9 ,.]*\d+')
-# regex to match escapes \number\ used for special words:
-rerematch = re.compile(r'\\\d+\\')
-
 def tokenize_plain_text( text,
               lang,
               sent_ends='.;!?\\n',
@@ -460,136 +1073,108 @@ def tokenize_plain_text( text,
 		This should be a unique symbol not appearing anywhere naturally in the text as it will be removed from the text.
 		for example use sent_not_cut="§§§"
 	"""
-     whole_words = whole_words.strip().split()
-     special_suffix = special_suffix.strip()
-     num_dot = (escape+'{}'+escape).format('NUMBERDOT')
-     space_after_esc = (escape+'{}'+escape).format('NOSPACEAFTER')
-     if lang == 'fr':
-        glue_left="'~"
-        glue_right=""
-     else:
-        glue_left=""
-        glue_right="'"
-     ind = 0
-     ntext = text
-     for word in whole_words: 
-        ntext = ntext.replace(word,'\\{ind}\\'.format(ind=ind))
-        ind +=1
-     if special_suffix:
-        respecial_suffix = re.compile(r'({})\b'.format('|'.join(special_suffix.split())))
-        for m in respecial_suffix.finditer(ntext):
-             ntext = ntext.replace(m.group(0),'\\{ind}\\'.format(ind=ind))
-             whole_words += [m.group(0)]
-             ind +=1
-     if keep_url:
-        for murl in re_url.finditer(ntext):
-            ntext = ntext.replace(murl.group(0),'\\{ind}\\'.format(ind=ind))
-            whole_words += [murl.group(0)]
-            ind +=1
-     if combine_numbers:
-        for mnum in re_spacenum.finditer(ntext):
-            ntext = ntext.replace(mnum.group(0),'\\{ind}\\'.format(ind=ind))
-            whole_words += [mnum.group(0)]
-            ind +=1
-
-	# replace "the 2. guy" by "the 2___NUMDOT___ guy":
-     re_num_dot = re.compile(r'\b(\d+)\.(?! [0-9A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ])') # num followed by . not followed by upper case
-     ntext = re_num_dot.sub(r'\1'+num_dot, ntext)
-	# now we split into sentences:
-     if sent_cut: 
-        sents = ntext.split(sent_cut)
-     else:
-        if new_sent_upper:
-            sent_ends_nopoint = re.sub(r'[{new_sent_upper}]+'.format(new_sent_upper=new_sent_upper),'', sent_ends)
-            if sent_not_cut:
-                re_sent_bounds = re.compile(
-					'(([{sent_ends_nopoint}]+(?!{sent_not_cut})\s*)|([{sent_ends}]+(?!{sent_not_cut})\s*(?=[0-9\\\A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ])))'.format(
-								sent_ends_nopoint=sent_ends_nopoint, 
-								sent_ends=new_sent_upper.replace('.','\.'),
-								sent_not_cut=sent_not_cut), re.U+re.M)
-            else:
-                re_sent_bounds = re.compile(
-					'(([{sent_ends_nopoint}]+\s*)|([{sent_ends}]+\s*(?=[0-9\\\A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ])))'.format(
-								sent_ends_nopoint=sent_ends_nopoint, 
-								sent_ends=new_sent_upper.replace('.','\.'),
-								sent_not_cut=sent_not_cut), re.U+re.M)
-        else:
-            if sent_not_cut:
-                re_sent_bounds = re.compile(
-					'([{sent_ends}](?!{sent_not_cut})+\s*)'.format(sent_ends=sent_ends, 
-						    sent_not_cut=sent_not_cut), re.U+re.M)
-            else:
-                re_sent_bounds = re.compile(
-					'([{sent_ends}]+\s*)'.format(sent_ends=sent_ends), re.U+re.M)
-        doubsents = re_sent_bounds.split(ntext)+['']
-        sents = []
-        for i in range(0, len(doubsents), 2):
-            if doubsents[i] and doubsents[i+1] is not None:
-                sents += [(doubsents[i].replace(sent_not_cut,'') + (doubsents[i+1] if i+1 < len(doubsents) else '')).strip()]
-	
-	### now we got the sents list, making the actual tokens
-     retok = re.compile("(?!(\\\\d+\\\)|([\\\{} ]+))(\W+)(?!\d)".format(re.escape((char_in_word+glue_left+glue_right).replace('-','\-'))))
-     reglue_left = re.compile(r'([{}])'.format(glue_left)) if glue_left else None
-     reglue_right = re.compile(r'([{}])'.format(glue_right)) if glue_right else None
-     stoks = {}
-     def simplerematchreplace(matchobj): # used to reconstruct the sentence
-        return whole_words[int(matchobj.group(0)[1:-1])]
-     def rematchreplace(matchobj): # used to build the correct tokens
-        if special_suffix and respecial_suffix.match(whole_words[int(matchobj.group(0)[1:-1])]):
-            return space_after_esc+whole_words[int(matchobj.group(0)[1:-1])]
-        return whole_words[int(matchobj.group(0)[1:-1])]
-     for si,s in enumerate(sents):
-        rs = rerematch.sub(simplerematchreplace,s.replace(num_dot,'.'))
-        if glue_left: s = reglue_left.sub(r'\1 ', s)
-        if glue_right: s = reglue_right.sub(r' \1', s)
-        s = retok.sub(r'{}\3 '.format(space_after_esc), s) # adding the additional spaces
-        toks = []
-        spaceafters = []
-        for t in s.split():
-            t = t.replace(num_dot,'.')
-            ts = rerematch.sub(rematchreplace,t) if rerematch.search(t) else t
-            tsl = [tt for tt in ts.split(space_after_esc) if tt] 
-            toks+= tsl
-            spaceafters += [ii==len(tsl)-1 for ii,tt in enumerate(tsl)]
-        stoks[(si,rs)] = list(zip(toks,spaceafters)) # 'si' makes keys unique and allows duplicate sentences
-     return stoks
-
-def conllize_plain_text(sent2toks, sample_name, start):
-    conlls=[]
-    for (si,s),toksas in sent2toks.items():
-        conllines=[
-            '# sent_id = {id}__{ind}'.format(id=sample_name,ind=start+1),
-            '# text = {s}'.format(s=s)
-        ]
-        for i,(tok,sa) in enumerate(toksas):
-            li = '{ind}\t{tok}\t_\t_\t_\t_\t_\t_\t_\t{spac}\t'.format(ind=i+1,tok=tok,spac='_' if sa else 'SpaceAfter=No')
-            conllines+=[li]
-        conlls+=['\n'.join(conllines)]
-        start+=1
-    return '\n\n'.join(conlls)+'\n'
-
-def split_sentences(text, option):
-    if option == 'horizontal':
-        return text.split("\n")
-    else:
-        sentences = []
-        for sentence in text.split('\n\n'):
-            sentences.append(sentence)
-        return sentences
-
-def conllize_sentence(sentence_tokens, sample_name, index, option):
-    sentence_tokens = sentence_tokens.replace("\t", ' ')
-    sent_id = '# sent_id = {}__{}\n'.format(sample_name, index)
-    text = '# text = '
-    sentence = str()
-    conll = str()
-    i = 1
-    delimiter = " " if option == 'horizontal' else "\n" 
-    for token in sentence_tokens.rstrip().split(delimiter):
-        text += "{} ".format(token)
-        sentence += '{}\t{}\t_\t_\t_\t_\t_\t_\t_\t_\t\n'.format(i,token)
-        i += 1
-    conll += sent_id
-    conll += text +"\n"
-    conll += sentence + "\n"
-    return conll
+     tokenizer = get_tokenizer(
+        lang,
+        sent_ends=sent_ends,
+        new_sent_upper=new_sent_upper,
+        char_in_word=char_in_word,
+        whole_words=whole_words,
+        special_suffix=special_suffix,
+        keep_url=keep_url,
+        combine_numbers=combine_numbers,
+        sent_cut=sent_cut,
+        escape=escape,
+        sent_not_cut=sent_not_cut,
+     )
+     # 'si' makes keys unique and allows duplicate sentences
+     return {(si, rs): toks for si, (rs, toks) in enumerate(tokenizer.tokenize(text))}
+
+def conll_metadata(user_id: Optional[str], rtl: bool, timestamp: Optional[str] = None) -> List[str]:
+    """Metadata lines added to every generated sentence, the same as ConlluTransformer adds to the uploaded files
+
+    Args:
+        user_id (str | None)
+        rtl (bool)
+        timestamp (str, optional): now by default
+
+    Returns:
+        List[str]
+    """
+    lines = []
+    if user_id is not None:
+        lines.append("# user_id = {}\n".format(user_id))
+    lines.append("# timestamp = {}\n".format(timestamp or str(datetime.timestamp(datetime.now()) * 1000)))
+    if rtl:
+        lines.append("# rtl = yes\n")
+    return lines
+
+
+def iter_conll_plain_text(sentences: Iterable[Tuple[str, List[Tuple[str, bool]]]], sample_name: str, start: int, metadata: List[str] = []) -> Iterator[str]:
+    """CoNLL-U lines of the sentences of PlainTextTokenizer.tokenize, the sentences without token are skipped
+
+    Args:
+        sentences (Iterable[(text, [(token, space after)])])
+        sample_name (str)
+        start (int): number of sentences already in the sample
+        metadata (List[str], optional): see conll_metadata
+
+    Yields:
+        str
+    """
+    index = start
+    for text, tokens in sentences:
+        if not tokens:
+            continue
+        index += 1
+        yield '# sent_id = {}__{}\n'.format(sample_name, index)
+        yield from _text_metadata(text)
+        yield from metadata
+        for i, (token, space_after) in enumerate(tokens, start=1):
+            yield '{}\t{}\t_\t_\t_\t_\t_\t_\t_\t{}\n'.format(i, token, '_' if space_after else 'SpaceAfter=No')
+        yield '\n'
+
+
+def _text_metadata(text: str) -> List[str]:
+    text = text.rstrip()
+    return ['# text = {}\n'.format(text)] if text else []
+
+
+def split_sentences(text: str, option: str) -> Iterator[str]:
+    """Sentences of a pretokenized text: a sentence by line (horizontal) or separated by an empty line (vertical)"""
+    separator = "\n" if option == 'horizontal' else "\n\n"
+    position = 0
+    while True:
+        found = text.find(separator, position)
+        if found < 0:
+            yield text[position:]
+            return
+        yield text[position:found]
+        position = found + len(separator)
+
+
+def iter_conll_sentences(sentences: Iterable[str], sample_name: str, start: int, option: str, metadata: List[str] = []) -> Iterator[str]:
+    """CoNLL-U lines of pretokenized sentences, the empty sentences are skipped
+
+    Args:
+        sentences (Iterable[str]): see split_sentences
+        sample_name (str)
+        start (int): number of sentences already in the sample
+        option (str): horizontal (tokens separated by spaces) | vertical (a token by line)
+        metadata (List[str], optional): see conll_metadata
+
+    Yields:
+        str
+    """
+    delimiter = " " if option == 'horizontal' else "\n"
+    index = start
+    for sentence_tokens in sentences:
+        if not sentence_tokens:
+            continue
+        index += 1
+        tokens = sentence_tokens.replace("\t", ' ').rstrip().split(delimiter)
+        yield '# sent_id = {}__{}\n'.format(sample_name, index)
+        yield from _text_metadata(" ".join(tokens))
+        yield from metadata
+        for i, token in enumerate(tokens, start=1):
+            yield '{}\t{}\t_\t_\t_\t_\t_\t_\t_\t_\n'.format(i, token)
+        yield '\n'
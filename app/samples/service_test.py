@@ -1,4 +1,25 @@
-from app.samples.service import SampleEvaluationService
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+from conllup.conllup import readConlluFile
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest, Conflict, NotAcceptable, RequestEntityTooLarge
+
+from app import grew_config
+from app.config import Config
+from app.samples.service import (
+    ChunkedUploadService,
+    ConlluTransformer,
+    SampleEvaluationService,
+    SampleTokenizeService,
+    SampleUploadService,
+    add_new_sent_ids,
+    add_or_keep_timestamps,
+    add_or_replace_userid,
+)
+from app.test.fake_grew import FakeGrewServer
 from app.utils.grew_utils import GrewService
 
 project_name_test = "tdd_1"
@@ -14,4 +35,195 @@ def test_evaluations_json_to_tsv():
     evaluations = SampleEvaluationService.evaluate_sample(sample_trees)
 
     evaluations_tsv = SampleEvaluationService.evaluations_json_to_tsv(evaluations)
-    assert evaluations_tsv
\ No newline at end of file
+    assert evaluations_tsv
+
+CONLL = (
+    "# sent_id = s1\n# text = le chat\n1\tle\tle\tDET\t_\t_\t2\tdet\t_\t_\n2\tchat\tchat\tNOUN\t_\t_\t0\troot\t_\t_\n\n"
+    "# text = dort\n# timestamp = 1000\n1\tdort\tdormir\tVERB\t_\t_\t0\troot\t_\t_\n"
+)
+
+
+def read_metas(path_file):
+    return [sentence["metaJson"] for sentence in readConlluFile(str(path_file), keepEmptyTrees=True)]
+
+
+def test_conllu_transformer_single_pass(tmp_path):
+    path_file = tmp_path / "sample.conllu"
+    transformer = ConlluTransformer("sample", user_id="annotator", rtl=True, new_sent_ids=True)
+    transformer.write(io.BytesIO(CONLL.encode("utf-8")), str(path_file))
+
+    metas = read_metas(path_file)
+    assert [meta["sent_id"] for meta in metas] == ["sample__1", "sample__2"]
+    assert all(meta["user_id"] == "annotator" and meta["rtl"] == "yes" for meta in metas)
+    assert metas[1]["timestamp"] == "1000"
+    assert metas[0]["timestamp"] != "1000"
+    assert list(tmp_path.iterdir()) == [path_file]
+
+
+def test_conllu_transformer_same_output_as_helpers(tmp_path):
+    path_file = tmp_path / "sample.conllu"
+    path_file.write_text(CONLL)
+    add_new_sent_ids(str(path_file), "sample")
+    add_or_replace_userid(str(path_file), "annotator")
+    add_or_keep_timestamps(str(path_file), when="long_ago")
+
+    transformed_file = tmp_path / "transformed.conllu"
+    transformer = ConlluTransformer("sample", user_id="annotator", timestamp="long_ago", new_sent_ids=True)
+    transformer.write(CONLL, str(transformed_file))
+    assert transformed_file.read_text() == path_file.read_text()
+
+
+def test_conllu_transformer_new_sent_ids_if_missing(tmp_path):
+    path_file = tmp_path / "sample.conllu"
+    path_file.write_text(CONLL)
+    ConlluTransformer("sample", new_sent_ids="if_missing").rewrite(str(path_file))
+    assert [meta["sent_id"] for meta in read_metas(path_file)] == ["sample__1", "sample__2"]
+
+    ConlluTransformer("other", new_sent_ids="if_missing").rewrite(str(path_file))
+    assert [meta["sent_id"] for meta in read_metas(path_file)] == ["sample__1", "sample__2"]
+
+
+@pytest.mark.parametrize("conll, kwargs, message", [
+    (CONLL.replace("# text = dort", "# sent_id = s1"), {"check_duplicate_sent_ids": True}, "sample has duplicated sent_ids"),
+    (CONLL.replace("# text = dort", "# user_id = someone"), {"check_user_ids": True}, "sample has sentences with user_id"),
+    ("", {}, "empty conllu"),
+    (CONLL.replace("VERB\t_\t_\t0\troot\t_\t_", "VERB"), {}, "line = 8"),
+])
+def test_conllu_transformer_errors(tmp_path, conll, kwargs, message):
+    path_file = tmp_path / "sample.conllu"
+    with pytest.raises(NotAcceptable) as error:
+        ConlluTransformer("sample", **kwargs).write(conll, str(path_file))
+    assert message in error.value.description
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.fixture
+def grew_server(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(Config, "UPLOAD_WORKERS", 2)
+    monkeypatch.setattr("app.samples.service.ProjectService.get_by_name", lambda project_name: SimpleNamespace(id=1))
+    monkeypatch.setattr("app.samples.service.GithubRepositoryService.get_by_project_id", lambda project_id: None)
+    with FakeGrewServer() as server:
+        monkeypatch.setattr(grew_config, "server", server.url)
+        GrewService.create_project("project")
+        yield server
+
+
+def test_upload_reports_every_file(grew_server, tmp_path):
+    files = [
+        FileStorage(io.BytesIO(CONLL.encode("utf-8")), filename="first.conllu"),
+        FileStorage(io.BytesIO(CONLL.replace("# text = dort", "# user_id = someone").encode("utf-8")), filename="second.conllu"),
+        FileStorage(io.BytesIO(CONLL.encode("utf-8")), filename="third.conll"),
+    ]
+    results = SampleUploadService.upload(files, "project", False, new_username="annotator", samples_without_sent_ids=["third"])
+
+    assert [(result["sample_name"], result["status"]) for result in results] == [("first", "OK"), ("second", "FAILED"), ("third", "OK")]
+    assert results[1]["code"] == 406
+    assert results[1]["message"] == "second has sentences with user_id"
+    assert sorted(sample["name"] for sample in GrewService.get_samples("project")) == ["first", "third"]
+    assert list(GrewService.get_sample_trees("project", "third")) == ["third__1", "third__2"]
+    assert not list(tmp_path.iterdir())
+
+
+
+def test_upload_files_of_the_same_name(grew_server, tmp_path, monkeypatch):
+    files = [
+        FileStorage(io.BytesIO(CONLL.encode("utf-8")), filename="same.conllu"),
+        FileStorage(io.BytesIO(CONLL.replace("dort", "mange").encode("utf-8")), filename="same.conllu"),
+        FileStorage(io.BytesIO(CONLL.encode("utf-8")), filename="unstored.conllu"),
+    ]
+    save = FileStorage.save
+
+    def failing_save(fileobject, dst):
+        if fileobject.filename == "unstored.conllu":
+            raise OSError("No space left on device")
+        return save(fileobject, dst)
+
+    monkeypatch.setattr(FileStorage, "save", failing_save)
+    results = SampleUploadService.upload(files, "project", False, new_username="annotator", existing_samples=["same"])
+
+    assert [(result["sample_name"], result["status"]) for result in results] == [("same", "OK"), ("same", "OK"), ("unstored", "FAILED")]
+    assert results[2]["code"] == 500 and "No space left on device" in results[2]["message"]
+    assert not list(tmp_path.iterdir())
+
+def send_chunks(upload_id, content, chunk_size):
+    for index, begin in enumerate(range(0, len(content), chunk_size)):
+        chunk = content[begin:begin + chunk_size]
+        state = ChunkedUploadService.add_chunk(upload_id, index, chunk, hashlib.sha256(chunk).hexdigest())
+    return state
+
+
+def test_chunked_upload(grew_server, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.samples.service.CHUNKED_UPLOAD_FOLDER", str(tmp_path / "chunked"))
+    content = (CONLL + "\n" + CONLL).encode("utf-8")
+    state = ChunkedUploadService.create("project", "user", "big.conllu", "annotator", False, new_sent_ids=True)
+
+    # 7 bytes chunks, the sentences are transformed as soon as their last line arrives
+    state = send_chunks(state["upload_id"], content[:100], 7)
+    assert state["sentences"] == 1
+    with pytest.raises(BadRequest):
+        ChunkedUploadService.add_chunk(state["upload_id"], state["next_index"], b"x", "0" * 64)
+    with pytest.raises(Conflict):
+        ChunkedUploadService.add_chunk(state["upload_id"], state["next_index"] + 1, b"x", hashlib.sha256(b"x").hexdigest())
+    # the reply of the last chunk was lost, it is sent again
+    last_chunk = content[98:100]
+    assert ChunkedUploadService.add_chunk(state["upload_id"], state["next_index"] - 1, last_chunk, hashlib.sha256(last_chunk).hexdigest()) == state
+
+    rest = content[100:]
+    state = ChunkedUploadService.add_chunk(state["upload_id"], state["next_index"], rest, hashlib.sha256(rest).hexdigest())
+    # the last sentence has no empty line after it, it is transformed by complete
+    assert state["sentences"] == 3
+    result = ChunkedUploadService.complete(state["upload_id"])
+
+    assert result == {"file_name": "big.conllu", "sample_name": "big", "status": "OK"}
+    assert list(GrewService.get_sample_trees("project", "big")) == ["big__1", "big__2", "big__3", "big__4"]
+    assert not (tmp_path / "chunked" / state["upload_id"]).exists()
+
+
+def test_chunked_upload_error_fails_upload(grew_server, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.samples.service.CHUNKED_UPLOAD_FOLDER", str(tmp_path / "chunked"))
+    content = (CONLL + "\n" + CONLL.replace("# text = dort", "# sent_id = s1")).encode("utf-8")
+    state = ChunkedUploadService.create("project", "user", "big.conllu", "annotator", False)
+
+    with pytest.raises(NotAcceptable) as error:
+        send_chunks(state["upload_id"], content, 50)
+    assert error.value.description == "big has duplicated sent_ids"
+    with pytest.raises(NotAcceptable):
+        ChunkedUploadService.complete(state["upload_id"])
+
+
+def test_chunked_upload_limits(grew_server, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.samples.service.CHUNKED_UPLOAD_FOLDER", str(tmp_path / "chunked"))
+    monkeypatch.setattr(Config, "CHUNKED_UPLOAD_MAX_CHUNK_SIZE", 60)
+    monkeypatch.setattr(Config, "CHUNKED_UPLOAD_MAX_SENTENCE_SIZE", 100)
+    assert ChunkedUploadService.read_chunk(io.BytesIO(b"x" * 60), None) == b"x" * 60
+    with pytest.raises(RequestEntityTooLarge):
+        ChunkedUploadService.read_chunk(io.BytesIO(b"x" * 61), None)
+    with pytest.raises(RequestEntityTooLarge):
+        ChunkedUploadService.read_chunk(io.BytesIO(b""), 61)
+
+    # a file without empty lines would be kept whole in the tail
+    content = CONLL.replace("\n\n", "\n").encode("utf-8") * 2
+    state = ChunkedUploadService.create("project", "user", "big.conllu", "annotator", False)
+    with pytest.raises(BadRequest) as error:
+        send_chunks(state["upload_id"], content, 60)
+    assert "bigger than 100 bytes" in error.value.description
+    with pytest.raises(BadRequest):
+        ChunkedUploadService.complete(state["upload_id"])
+
+
+def test_tokenize_streams_the_conll_to_grew(grew_server):
+    text = "Le chat dort. Il mange, dit-il.\n\nLa maison est grande !"
+    SampleTokenizeService.tokenize(text, "plain_text", "fr", "project", "book", "annotator", True)
+    SampleTokenizeService.tokenize("un deux\n\ntrois", "horizontal", None, "project", "book", "annotator", False)
+
+    trees = GrewService.get_sample_trees("project", "book")
+    assert list(trees) == ["book__1", "book__2", "book__3", "book__4", "book__5"]
+    conll = trees["book__2"]["annotator"]
+    assert "# text = Il mange, dit-il.\n# user_id = annotator\n# timestamp = " in conll
+    assert "# rtl = yes" in conll
+    assert "1\tIl\t_\t_\t_\t_\t_\t_\t_\t_" in conll
+    assert "2\tdeux" in trees["book__4"]["annotator"]
+    with pytest.raises(NotAcceptable):
+        SampleTokenizeService.tokenize("\n\n", "vertical", None, "project", "empty", "annotator", False)
+    assert "empty" not in [sample["name"] for sample in GrewService.get_samples("project")]
@@ -22,8 +22,7 @@ class StaticsProjectResource(Resource):
     def get(self, project_name):
         """Get project statistics"""
         project_stats: StatProjectInterface = {}
-        grew_projects = GrewService.get_projects()
-        project = [project for project in grew_projects if project["name"] == project_name][0]
+        project = GrewService.get_project(project_name)
         
         project_stats["users"] = project["users"]
         project_stats["samples_number"] = project["number_samples"]
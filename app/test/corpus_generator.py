@@ -0,0 +1,296 @@
+"""
+    Deterministic generator of synthetic CoNLL-U corpora for tests and benchmarks. The sentences
+    have multi word tokens, empty nodes (with the enhanced DEPS), the metadata used by arborator
+    (sent_id, text, user_id, timestamp, tags) and several annotators whose trees differ slightly.
+    The same seed always gives the same corpus, whatever its size.
+
+    python -m app.test.corpus_generator --tokens 1000000 --users 3 --enhanced -o corpus.conllu
+    python -m app.test.corpus_generator --samples 20 --sentences 500 --format grew -o corpus.json
+"""
+import argparse
+import json
+import random
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+# (form, lemma, upos, feats) by part of speech
+LEXICON = {
+    "DET": [("le", "le", "Definite=Def|Gender=Masc|Number=Sing|PronType=Art"),
+            ("la", "le", "Definite=Def|Gender=Fem|Number=Sing|PronType=Art"),
+            ("les", "le", "Definite=Def|Number=Plur|PronType=Art"),
+            ("un", "un", "Definite=Ind|Gender=Masc|Number=Sing|PronType=Art"),
+            ("une", "un", "Definite=Ind|Gender=Fem|Number=Sing|PronType=Art")],
+    "NOUN": [("chat", "chat", "Gender=Masc|Number=Sing"), ("maison", "maison", "Gender=Fem|Number=Sing"),
+             ("enfants", "enfant", "Gender=Masc|Number=Plur"), ("jardin", "jardin", "Gender=Masc|Number=Sing"),
+             ("ville", "ville", "Gender=Fem|Number=Sing"), ("livres", "livre", "Gender=Masc|Number=Plur"),
+             ("arbre", "arbre", "Gender=Masc|Number=Sing"), ("rivière", "rivière", "Gender=Fem|Number=Sing")],
+    "PROPN": [("Paris", "Paris", "_"), ("Marie", "Marie", "_"), ("Orléans", "Orléans", "_")],
+    "ADJ": [("petit", "petit", "Gender=Masc|Number=Sing"), ("grande", "grand", "Gender=Fem|Number=Sing"),
+            ("vieux", "vieux", "Gender=Masc"), ("belles", "beau", "Gender=Fem|Number=Plur")],
+    "VERB": [("dort", "dormir", "Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin"),
+             ("mange", "manger", "Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin"),
+             ("regardent", "regarder", "Mood=Ind|Number=Plur|Person=3|Tense=Pres|VerbForm=Fin"),
+             ("voit", "voir", "Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin"),
+             ("parlait", "parler", "Mood=Ind|Number=Sing|Person=3|Tense=Imp|VerbForm=Fin")],
+    "ADV": [("souvent", "souvent", "_"), ("très", "très", "_"), ("hier", "hier", "_")],
+    "PRON": [("il", "il", "Gender=Masc|Number=Sing|Person=3|PronType=Prs"),
+             ("elle", "elle", "Gender=Fem|Number=Sing|Person=3|PronType=Prs")],
+    "CCONJ": [("et", "et", "_"), ("mais", "mais", "_")],
+    "ADP": [("dans", "dans", "_"), ("sur", "sur", "_"), ("avec", "avec", "_")],
+}
+# relation of a dependent by part of speech
+RELATIONS = {
+    "DET": ["det"], "NOUN": ["nsubj", "obj", "obl"], "PROPN": ["nsubj", "obl"], "ADJ": ["amod"],
+    "VERB": ["conj", "ccomp"], "ADV": ["advmod"], "PRON": ["nsubj"], "CCONJ": ["cc"], "ADP": ["case"],
+}
+# the phrases a sentence is built from, in upos
+PHRASES = [
+    ["DET", "NOUN"], ["DET", "ADJ", "NOUN"], ["DET", "NOUN", "ADJ"], ["PROPN"], ["PRON"],
+    ["ADP", "DET", "NOUN"], ["ADV"], ["CCONJ", "DET", "NOUN"],
+]
+# contractions written as multi word tokens: (surface form, preposition)
+CONTRACTIONS = [("du", "de"), ("au", "à"), ("des", "de"), ("aux", "à")]
+TAGS = ["to_check", "difficult", "ellipsis", "reviewed"]
+BASE_TIMESTAMP = 1600000000000
+
+
+class CorpusGenerator:
+    """
+        Generates sentences annotated by several users. Every sentence is drawn from its own
+        random generator seeded with (seed, sent_id) so the output only depends on the seed and
+        on the ids, not on the order of generation
+
+    Args:
+        seed (int)
+        users (int | List[str]): number of annotators (user_0, user_1...) or their ids
+        enhanced (bool): fill the DEPS column and add empty nodes
+        mwt_rate (float): probability of a contracted preposition (multi word token) by phrase
+        empty_node_rate (float): probability of an empty node by sentence, only with enhanced
+        disagreement_rate (float): probability that an annotator changes the relation of a token
+        tags_rate (float): probability of a `# tags` metadata
+    """
+    def __init__(self, seed: int = 0, users=2, enhanced: bool = False, mwt_rate: float = 0.1,
+                 empty_node_rate: float = 0.05, disagreement_rate: float = 0.05, tags_rate: float = 0.1):
+        self.seed = seed
+        self.users = ["user_{}".format(index) for index in range(users)] if isinstance(users, int) else list(users)
+        self.enhanced = enhanced
+        self.mwt_rate = mwt_rate
+        self.empty_node_rate = empty_node_rate
+        self.disagreement_rate = disagreement_rate
+        self.tags_rate = tags_rate
+
+    def _random(self, *key) -> random.Random:
+        return random.Random(":".join(str(part) for part in (self.seed,) + key))
+
+    def _build_tokens(self, rng: random.Random):
+        """Words of a sentence as dicts, plus the multi word tokens as (first id, last id, form)"""
+        words, mwts = [], []
+        verb_position = rng.randint(1, 2)
+        phrases = [rng.choice(PHRASES) for _ in range(rng.randint(2, 6))]
+        phrases.insert(min(verb_position, len(phrases)), ["VERB"])
+        verb_id = None
+        for phrase in phrases:
+            phrase_start = len(words)
+            use_contraction = phrase[0] == "ADP" and rng.random() < self.mwt_rate * 4
+            for upos in phrase:
+                form, lemma, feats = rng.choice(LEXICON[upos])
+                words.append({"id": len(words) + 1, "form": form, "lemma": lemma, "upos": upos, "feats": feats, "misc": "_"})
+            if use_contraction:
+                surface, preposition = rng.choice(CONTRACTIONS)
+                words[phrase_start].update(form=preposition, lemma=preposition)
+                words[phrase_start + 1].update(form="le", lemma="le", feats="Definite=Def|Gender=Masc|Number=Sing|PronType=Art")
+                mwts.append((phrase_start + 1, phrase_start + 2, surface))
+            # heads inside the phrase point to its noun (or its single word)
+            heads = [word for word in words[phrase_start:] if word["upos"] in ("NOUN", "PROPN", "PRON", "VERB", "ADV")]
+            phrase_head = heads[-1] if heads else words[phrase_start]
+            for word in words[phrase_start:]:
+                if word is not phrase_head:
+                    word["head"] = phrase_head["id"]
+                    word["deprel"] = RELATIONS[word["upos"]][0]
+            phrase_head["head"] = None
+            if phrase == ["VERB"]:
+                verb_id = phrase_head["id"]
+        for word in words:
+            if word.get("head", 0) is None:
+                if word["id"] == verb_id:
+                    word["head"], word["deprel"] = 0, "root"
+                else:
+                    word["head"], word["deprel"] = verb_id, rng.choice(RELATIONS[word["upos"]])
+        words.append({"id": len(words) + 1, "form": ".", "lemma": ".", "upos": "PUNCT", "feats": "_",
+                      "misc": "_", "head": verb_id, "deprel": "punct"})
+        words[-2]["misc"] = "SpaceAfter=No"
+        return words, mwts
+
+    @staticmethod
+    def _text(words, mwts) -> str:
+        mwt_by_start = {start: (end, form) for start, end, form in mwts}
+        pieces, index = [], 0
+        while index < len(words):
+            word = words[index]
+            if word["id"] in mwt_by_start:
+                end, form = mwt_by_start[word["id"]]
+                index = end
+                last_word = words[end - 1]
+            else:
+                form, last_word = word["form"], word
+                index += 1
+            pieces.append(form + ("" if "SpaceAfter=No" in last_word["misc"] else " "))
+        return "".join(pieces).strip()
+
+    def _annotate(self, rng: random.Random, words):
+        """Copy of the words with the disagreements of an annotator"""
+        annotated = [dict(word) for word in words]
+        for word in annotated:
+            if word["deprel"] not in ("root", "punct") and rng.random() < self.disagreement_rate:
+                word["deprel"] = rng.choice(["obl", "dep", "nmod", "obj"])
+        return annotated
+
+    def _to_conll(self, sent_id, text, user_id, timestamp, tags, words, mwts, empty_node) -> str:
+        lines = ["# sent_id = {}".format(sent_id), "# text = {}".format(text)]
+        lines.append("# user_id = {}".format(user_id))
+        lines.append("# timestamp = {}".format(timestamp))
+        if tags:
+            lines.append("# tags = {}".format(", ".join(tags)))
+        mwt_by_start = {start: (end, form) for start, end, form in mwts}
+        extra_deps = {}
+        if empty_node:
+            extra_deps[empty_node["dependent"]] = "{}:nsubj".format(empty_node["id"])
+        for word in words:
+            if word["id"] in mwt_by_start:
+                end, form = mwt_by_start[word["id"]]
+                lines.append("\t".join(["{}-{}".format(word["id"], end), form] + ["_"] * 8))
+            deps = "_"
+            if self.enhanced:
+                deps = "{}:{}".format(word["head"], word["deprel"])
+                if word["id"] in extra_deps:
+                    deps = "|".join(sorted([deps, extra_deps[word["id"]]], key=lambda dep: float(dep.split(":")[0])))
+            lines.append("\t".join([
+                str(word["id"]), word["form"], word["lemma"], word["upos"], "_", word["feats"],
+                str(word["head"]), word["deprel"], deps, word["misc"],
+            ]))
+            if empty_node and word["id"] == empty_node["after"]:
+                lines.append("\t".join([
+                    empty_node["id"], empty_node["form"], empty_node["lemma"], "VERB", "_", "_",
+                    "_", "_", "{}:conj".format(empty_node["governor"]), "_",
+                ]))
+        return "\n".join(lines)
+
+    def sentence(self, sent_id: str) -> Dict[str, str]:
+        """Trees of a sentence by annotator
+
+        Args:
+            sent_id (str)
+
+        Returns:
+            {user_id: conll}
+        """
+        rng = self._random(sent_id)
+        words, mwts = self._build_tokens(rng)
+        text = self._text(words, mwts)
+        tags = rng.sample(TAGS, rng.randint(1, 2)) if rng.random() < self.tags_rate else []
+        empty_node = None
+        if self.enhanced and rng.random() < self.empty_node_rate:
+            verb = next(word for word in words if word["deprel"] == "root")
+            dependents = [word for word in words if word["upos"] in ("NOUN", "PROPN", "PRON")]
+            if dependents:
+                after = words[-2]["id"]
+                empty_node = {"id": "{}.1".format(after), "after": after, "form": verb["form"], "lemma": verb["lemma"],
+                              "governor": verb["id"], "dependent": rng.choice(dependents)["id"]}
+        timestamp = BASE_TIMESTAMP + rng.randint(0, 10 ** 9)
+        trees = {}
+        for user_index, user_id in enumerate(self.users):
+            annotated = words if user_index == 0 else self._annotate(self._random(sent_id, user_id), words)
+            trees[user_id] = self._to_conll(sent_id, text, user_id, timestamp + user_index * 1000, tags, annotated, mwts, empty_node)
+        return trees
+
+    def iter_sentences(self, tokens: int = None, sentences: int = None, prefix: str = "sent") -> Iterator[Tuple[str, Dict[str, str]]]:
+        """Sentences until the number of tokens (of the first annotator) or of sentences is reached
+
+        Args:
+            tokens (int, optional)
+            sentences (int, optional)
+            prefix (str, optional): sent_ids are prefix_1, prefix_2...
+
+        Yields:
+            (sent_id, {user_id: conll})
+        """
+        generated_tokens, index = 0, 0
+        while (sentences is None or index < sentences) and (tokens is None or generated_tokens < tokens):
+            index += 1
+            sent_id = "{}_{}".format(prefix, index)
+            trees = self.sentence(sent_id)
+            generated_tokens += count_tokens(trees[self.users[0]])
+            yield sent_id, trees
+
+    def iter_conllu(self, tokens: int = None, sentences: int = None, prefix: str = "sent", users: List[str] = None) -> Iterator[str]:
+        """Lines of a conllu file (trees separated by an empty line), generated lazily
+
+        Args:
+            tokens (int, optional)
+            sentences (int, optional)
+            prefix (str, optional)
+            users (List[str], optional): annotators written in the file, all of them by default
+
+        Yields:
+            str: a tree followed by an empty line
+        """
+        for _, trees in self.iter_sentences(tokens, sentences, prefix):
+            for user_id in users or self.users:
+                yield trees[user_id] + "\n\n"
+
+    def conllu(self, tokens: int = None, sentences: int = None, prefix: str = "sent", users: List[str] = None) -> str:
+        return "".join(self.iter_conllu(tokens, sentences, prefix, users))
+
+    def grew_corpus(self, projects: int = 1, samples: int = 1, sentences: int = 10):
+        """Corpus in the format of the fake grew server
+
+        Args:
+            projects (int, optional)
+            samples (int, optional): samples by project
+            sentences (int, optional): sentences by sample
+
+        Returns:
+            {project_id: {sample_id: {sent_id: {user_id: conll}}}}
+        """
+        return {
+            "project_{}".format(project): {
+                "sample_{}".format(sample): dict(self.iter_sentences(sentences=sentences, prefix="sample_{}".format(sample)))
+                for sample in range(samples)
+            }
+            for project in range(projects)
+        }
+
+
+def count_tokens(conll: str) -> int:
+    """Number of syntactic words of a tree (multi word token ranges and empty nodes excluded)"""
+    return sum(1 for line in conll.split("\n") if line and line[0].isdigit() and line.split("\t", 1)[0].isdigit())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokens", type=int, help="size of the conllu output in tokens")
+    parser.add_argument("--sentences", type=int, help="number of sentences (by sample with --format grew)")
+    parser.add_argument("--samples", type=int, default=1, help="number of samples with --format grew")
+    parser.add_argument("--users", type=int, default=1, help="annotators by sentence")
+    parser.add_argument("--enhanced", action="store_true", help="fill DEPS and add empty nodes")
+    parser.add_argument("--format", choices=["conllu", "grew"], default="conllu")
+    parser.add_argument("-o", "--output", help="output file, stdout by default")
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(seed=args.seed, users=args.users, enhanced=args.enhanced)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.format == "grew":
+            json.dump(generator.grew_corpus(samples=args.samples, sentences=args.sentences or 100), output, ensure_ascii=False)
+        else:
+            if args.tokens is None and args.sentences is None:
+                parser.error("--tokens or --sentences is required")
+            output.writelines(generator.iter_conllu(tokens=args.tokens, sentences=args.sentences))
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
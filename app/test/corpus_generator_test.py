@@ -0,0 +1,50 @@
+from conllup.conllup import readConlluFile, sentenceConllToJson
+
+from app.test.corpus_generator import CorpusGenerator, count_tokens
+
+
+def test_same_seed_same_corpus():
+    assert CorpusGenerator(seed=3, users=2).conllu(sentences=20) == CorpusGenerator(seed=3, users=2).conllu(sentences=20)
+    assert CorpusGenerator(seed=3).conllu(sentences=20) != CorpusGenerator(seed=4).conllu(sentences=20)
+    # a sentence only depends on the seed and on its id
+    assert CorpusGenerator(seed=3).sentence("sent_7") == dict(CorpusGenerator(seed=3).iter_sentences(sentences=7))["sent_7"]
+
+
+def test_size_in_tokens():
+    conlls = [trees["user_0"] for _, trees in CorpusGenerator(seed=1, users=1).iter_sentences(tokens=1000)]
+    number_tokens = sum(count_tokens(conll) for conll in conlls)
+    assert 1000 <= number_tokens < 1000 + count_tokens(conlls[-1])
+
+
+def test_trees_are_valid_and_cover_the_conllu_features():
+    generator = CorpusGenerator(seed=5, users=3, enhanced=True, empty_node_rate=0.3, tags_rate=0.5)
+    has_mwt = has_empty_node = has_tags = False
+    for sent_id, trees in generator.iter_sentences(sentences=200):
+        assert set(trees) == {"user_0", "user_1", "user_2"}
+        for user_id, conll in trees.items():
+            sentence_json = sentenceConllToJson(conll)
+            meta = sentence_json["metaJson"]
+            assert meta["sent_id"] == sent_id
+            assert meta["user_id"] == user_id
+            assert "timestamp" in meta and "text" in meta
+            has_tags = has_tags or "tags" in meta
+            nodes = sentence_json["treeJson"]["nodesJson"]
+            has_mwt = has_mwt or bool(sentence_json["treeJson"]["groupsJson"])
+            has_empty_node = has_empty_node or bool(sentence_json["treeJson"]["enhancedNodesJson"])
+            heads = {token_id: node["HEAD"] for token_id, node in nodes.items()}
+            assert list(heads.values()).count(0) == 1
+            for token_id in heads:
+                # every token reaches the root without cycle
+                seen, current = set(), token_id
+                while heads[current] != 0:
+                    assert current not in seen
+                    seen.add(current)
+                    current = str(heads[current])
+            assert all(node["DEPS"] for node in nodes.values())
+    assert has_mwt and has_empty_node and has_tags
+
+
+def test_conllu_output_is_readable(tmp_path):
+    path = tmp_path / "corpus.conllu"
+    path.write_text(CorpusGenerator(seed=2, users=2, enhanced=True).conllu(sentences=10), encoding="utf-8")
+    assert len(readConlluFile(str(path))) == 20
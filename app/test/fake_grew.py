@@ -0,0 +1,420 @@
+"""
+    In memory stand-in of the grew server, it implements the grew functions called by
+    app/utils/grew_utils.py with the same reply format ({"status": "OK", "data": ...}).
+    Searches are approximated: only the [feature=value] clauses and the -[relation]-> edges
+    of the request are matched, token by token.
+
+    python -m app.test.fake_grew --port 8888 --latency 0.02 --corpus corpus.json
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+CONLL_COLUMNS = {"form": 1, "lemma": 2, "upos": 3, "xpos": 4, "deprel": 7}
+CLAUSE_REGEX = re.compile(r"(\w+)\s*=\s*\"?([^,\]\"\s]+)\"?")
+EDGE_REGEX = re.compile(r"-\[([^\]]+)\]->")
+
+
+def sentence_meta(conll: str):
+    meta = {}
+    for line in conll.split("\n"):
+        if line.startswith("# ") and " = " in line:
+            key, value = line[2:].split(" = ", 1)
+            meta[key.strip()] = value
+    return meta
+
+
+def sentence_tokens(conll: str):
+    """Token lines of a conll split in columns, multi word tokens and empty nodes are skipped"""
+    tokens = []
+    for line in conll.split("\n"):
+        if line and not line.startswith("#"):
+            columns = line.split("\t")
+            if columns[0].isdigit() and len(columns) >= 10:
+                tokens.append(columns)
+    return tokens
+
+
+def split_conll_file(content: str):
+    return [conll.strip("\n") for conll in content.split("\n\n") if conll.strip()]
+
+
+class FakeGrewCorpus:
+    """Projects of the fake grew server: {project_id: {sample_id: {sent_id: {user_id: conll}}}}"""
+    def __init__(self, projects=None):
+        self.lock = threading.RLock()
+        self.projects = projects if projects is not None else {}
+        self.configs = {}
+
+    def project(self, project_id):
+        if project_id not in self.projects:
+            raise KeyError("project `{}` not found".format(project_id))
+        return self.projects[project_id]
+
+    def sample(self, project_id, sample_id):
+        project = self.project(project_id)
+        if sample_id not in project:
+            raise KeyError("sample `{}` not found in project `{}`".format(sample_id, project_id))
+        return project[sample_id]
+
+    def selected_samples(self, project_id, sample_ids):
+        project = self.project(project_id)
+        return [(sample_id, project[sample_id]) for sample_id in (sample_ids or list(project)) if sample_id in project]
+
+    def sample_stats(self, sample_id, sentences):
+        tree_by_user = Counter(user_id for trees in sentences.values() for user_id in trees)
+        number_tokens = sum(len(sentence_tokens(next(iter(trees.values())))) for trees in sentences.values() if trees)
+        return {
+            "name": sample_id,
+            "number_sentences": len(sentences),
+            "number_tokens": number_tokens,
+            "number_trees": sum(tree_by_user.values()),
+            "tree_by_user": dict(tree_by_user),
+        }
+
+    def project_stats(self, project_id):
+        samples = [self.sample_stats(sample_id, sentences) for sample_id, sentences in self.project(project_id).items()]
+        return {
+            "name": project_id,
+            "number_samples": len(samples),
+            "number_sentences": sum(sample["number_sentences"] for sample in samples),
+            "number_tokens": sum(sample["number_tokens"] for sample in samples),
+            "number_trees": sum(sample["number_trees"] for sample in samples),
+            "users": sorted({user_id for sample in samples for user_id in sample["tree_by_user"]}),
+        }
+
+    def save_conlls(self, project_id, sample_id, content, pivot_sent_id=None):
+        """Store the trees of a conll file under the user_id of their metadata (default if there is none)"""
+        sample = self.project(project_id).setdefault(sample_id, {})
+        new_trees = {}
+        for conll in split_conll_file(content):
+            meta = sentence_meta(conll)
+            new_trees.setdefault(meta.get("sent_id", str(len(sample) + len(new_trees))), {})[meta.get("user_id", "default")] = conll
+        if pivot_sent_id is None:
+            for sent_id, trees in new_trees.items():
+                sample.setdefault(sent_id, {}).update(trees)
+            return
+        reordered = {}
+        for sent_id, trees in sample.items():
+            reordered[sent_id] = trees
+            if sent_id == pivot_sent_id:
+                reordered.update(new_trees)
+        sample.clear()
+        sample.update(reordered)
+
+
+def select_users(trees, user_ids):
+    """Trees of a sentence visible with the grew user_ids parameter ("all" or {"one": [...]})"""
+    if user_ids == "all":
+        return list(trees.items())
+    for user_id in user_ids.get("one", []):
+        if user_id == "__last__" and trees:
+            last_user = max(trees, key=lambda user: float(sentence_meta(trees[user]).get("timestamp", 0)))
+            return [(last_user, trees[last_user])]
+        if user_id in trees:
+            return [(user_id, trees[user_id])]
+    return []
+
+
+def match_tokens(conll, grew_request):
+    """Ids of the tokens matching the clauses of the request, an approximation of the grew matching"""
+    clauses = [(key, value) for key, value in CLAUSE_REGEX.findall(grew_request) if key in CONLL_COLUMNS]
+    relations = EDGE_REGEX.findall(grew_request)
+    matches = []
+    for columns in sentence_tokens(conll):
+        if all(columns[CONLL_COLUMNS[key]] == value for key, value in clauses) and (
+            not relations or columns[7] in relations
+        ):
+            matches.append(columns[0])
+    return matches
+
+
+def create_fake_grew_app(latency=0.0, corpus=None):
+    """Fake grew server
+
+    Args:
+        latency (float | dict, optional): artificial delay in seconds added to every reply,
+            or {fct_name: delay} with an optional "default" key
+        corpus (dict | FakeGrewCorpus, optional): {project_id: {sample_id: {sent_id: {user_id: conll}}}}
+
+    Returns:
+        Flask
+    """
+    app = Flask("fake_grew")
+    store = corpus if isinstance(corpus, FakeGrewCorpus) else FakeGrewCorpus(corpus)
+    latencies = latency if isinstance(latency, dict) else {"default": latency}
+    app.config["corpus"] = store
+    app.config["calls"] = Counter()
+    functions = {}
+
+    def grew_function(fct):
+        functions[fct.__name__] = fct
+        return fct
+
+    @app.route("/<string:fct_name>", methods=["POST"])
+    def dispatch(fct_name):
+        app.config["calls"][fct_name] += 1
+        delay = latencies.get(fct_name, latencies.get("default", 0))
+        if delay:
+            time.sleep(delay)
+        if fct_name not in functions:
+            return "<html><body><p>Unknown grew function {}</p></body></html>".format(fct_name), 404
+        try:
+            with store.lock:
+                data = functions[fct_name](request.form)
+        except KeyError as e:
+            return jsonify({"status": "ERROR", "message": str(e.args[0])})
+        return jsonify({"status": "OK", "data": data})
+
+    def json_param(form, key, default):
+        return json.loads(form[key]) if form.get(key) else default
+
+    @grew_function
+    def getProjects(form):
+        return [store.project_stats(project_id) for project_id in store.projects]
+
+    @grew_function
+    def getUserProjects(form):
+        return [
+            store.project_stats(project_id) for project_id in store.projects
+            if form.get("user_id") in store.project_stats(project_id)["users"]
+        ]
+
+    @grew_function
+    def newProject(form):
+        store.projects.setdefault(form["project_id"], {})
+
+    @grew_function
+    def eraseProject(form):
+        store.projects.pop(form["project_id"], None)
+
+    @grew_function
+    def renameProject(form):
+        store.projects[form["new_project_id"]] = store.projects.pop(form["project_id"])
+
+    @grew_function
+    def getProjectConfig(form):
+        store.project(form["project_id"])
+        config = store.configs.get(form["project_id"])
+        return [config] if config else []
+
+    @grew_function
+    def updateProjectConfig(form):
+        store.project(form["project_id"])
+        store.configs[form["project_id"]] = json.loads(form["config"])
+
+    @grew_function
+    def getSamples(form):
+        return [store.sample_stats(sample_id, sentences) for sample_id, sentences in store.project(form["project_id"]).items()]
+
+    @grew_function
+    def newSamples(form):
+        project = store.project(form["project_id"])
+        for sample_id in json_param(form, "sample_ids", []):
+            project.setdefault(sample_id, {})
+
+    @grew_function
+    def eraseSamples(form):
+        project = store.project(form["project_id"])
+        for sample_id in json_param(form, "sample_ids", []):
+            project.pop(sample_id, None)
+
+    @grew_function
+    def renameSample(form):
+        project = store.project(form["project_id"])
+        project[form["new_sample_id"]] = project.pop(form["sample_id"])
+
+    @grew_function
+    def getConll(form):
+        sample = store.sample(form["project_id"], form["sample_id"])
+        if form.get("sent_id"):
+            return sample.get(form["sent_id"], {})
+        return sample
+
+    @grew_function
+    def saveConll(form):
+        store.save_conlls(form["project_id"], form["sample_id"], request.files["conll_file"].read().decode("utf-8"))
+
+    @grew_function
+    def insertConll(form):
+        store.sample(form["project_id"], form["sample_id"])
+        content = request.files["conll_file"].read().decode("utf-8")
+        store.save_conlls(form["project_id"], form["sample_id"], content, pivot_sent_id=form["pivot_sent_id"])
+
+    @grew_function
+    def saveGraph(form):
+        sample = store.sample(form["project_id"], form["sample_id"])
+        conll = form["conll_graph"].strip("\n")
+        sample.setdefault(sentence_meta(conll)["sent_id"], {})[form["user_id"]] = conll
+
+    @grew_function
+    def eraseGraphs(form):
+        sample = store.sample(form["project_id"], form["sample_id"])
+        for sent_id in json_param(form, "sent_ids", []):
+            sample.get(sent_id, {}).pop(form.get("user_id"), None)
+
+    @grew_function
+    def eraseSentence(form):
+        store.sample(form["project_id"], form["sample_id"]).pop(form["sent_id"], None)
+
+    def iter_visible_trees(form):
+        user_ids = json_param(form, "user_ids", "all")
+        for sample_id, sentences in store.selected_samples(form["project_id"], json_param(form, "sample_ids", [])):
+            for sent_id, trees in sentences.items():
+                for user_id, conll in select_users(trees, user_ids):
+                    yield sample_id, sent_id, user_id, conll
+
+    @grew_function
+    def searchRequestInGraphs(form):
+        results = []
+        for sample_id, sent_id, user_id, conll in iter_visible_trees(form):
+            for token_id in match_tokens(conll, form["request"]):
+                results.append({
+                    "sample_id": sample_id,
+                    "sent_id": sent_id,
+                    "user_id": user_id,
+                    "conll": conll,
+                    "nodes": {"X": token_id},
+                    "edges": {},
+                })
+        return results
+
+    @grew_function
+    def tryPackage(form):
+        results = []
+        for sample_id, sent_id, user_id, conll in iter_visible_trees(form):
+            token_ids = match_tokens(conll, form["package"])
+            if token_ids:
+                results.append({
+                    "sample_id": sample_id,
+                    "sent_id": sent_id,
+                    "user_id": user_id,
+                    "conll": conll,
+                    "modified_nodes": token_ids,
+                    "modified_edges": [],
+                })
+        return results
+
+    @grew_function
+    def relationTables(form):
+        table = defaultdict(lambda: defaultdict(Counter))
+        for _, _, _, conll in iter_visible_trees(form):
+            tokens = sentence_tokens(conll)
+            upos = {columns[0]: columns[3] for columns in tokens}
+            for columns in tokens:
+                table[columns[7]][upos.get(columns[6], "_")][columns[3]] += 1
+        return {relation: {gov: dict(deps) for gov, deps in govs.items()} for relation, govs in table.items()}
+
+    @grew_function
+    def getLexicon(form):
+        features = json_param(form, "features", ["form", "lemma", "upos"])
+        counts = Counter()
+        for _, _, _, conll in iter_visible_trees(form):
+            for columns in sentence_tokens(conll):
+                counts[tuple(columns[CONLL_COLUMNS[feature]] if feature in CONLL_COLUMNS else "_" for feature in features)] += 1
+        prune = int(form["prune"]) if form.get("prune") else 0
+        return [
+            {"feats": dict(zip(features, values)), "freq": freq}
+            for values, freq in counts.most_common() if freq > prune
+        ]
+
+    def samples_tokens(form):
+        for _, sentences in store.selected_samples(form["project_id"], json_param(form, "sample_ids", [])):
+            for trees in sentences.values():
+                for conll in trees.values():
+                    yield from sentence_tokens(conll)
+
+    @grew_function
+    def getPOS(form):
+        return sorted({columns[3] for columns in samples_tokens(form)})
+
+    @grew_function
+    def getRelations(form):
+        return sorted({columns[7] for columns in samples_tokens(form)})
+
+    @grew_function
+    def getFeatures(form):
+        feats, misc = set(), set()
+        for columns in samples_tokens(form):
+            feats.update(feat.split("=")[0] for feat in columns[5].split("|") if feat != "_")
+            misc.update(feat.split("=")[0] for feat in columns[9].split("|") if feat != "_")
+        return {"FEATS": sorted(feats), "MISC": sorted(misc)}
+
+    return app
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class FakeGrewServer:
+    """Run the fake grew server on a free local port in a background thread
+
+        with FakeGrewServer(latency=0.01) as server:
+            grew_config.server = server.url
+    """
+    def __init__(self, latency=0.0, corpus=None, port: int = 0):
+        self.app = create_fake_grew_app(latency=latency, corpus=corpus)
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self._server.server_port)
+
+    @property
+    def corpus(self) -> FakeGrewCorpus:
+        return self.app.config["corpus"]
+
+    @property
+    def calls(self) -> Counter:
+        """Number of calls received by grew function"""
+        return self.app.config["calls"]
+
+    def start(self):
+        self._server = make_server("127.0.0.1", self.port, self.app, threaded=True, request_handler=_QuietRequestHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial delay of every reply in seconds")
+    parser.add_argument("--corpus", help="json file {project_id: {sample_id: {sent_id: {user_id: conll}}}}")
+    args = parser.parse_args()
+
+    corpus = None
+    if args.corpus:
+        with open(args.corpus) as corpus_file:
+            corpus = json.load(corpus_file)
+    server = FakeGrewServer(latency=args.latency, corpus=corpus, port=args.port).start()
+    print("fake grew server listening on {} (GREW_SERVER of the backend)".format(server.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+from app import grew_config
+from app.test.fake_grew import FakeGrewServer
+from app.utils.grew_utils import GrewService, TagsetService, grew_request
+
+CONLL = """# sent_id = {sent_id}
+# user_id = {user_id}
+# text = le chat dort
+1\tle\tle\tDET\t_\tDefinite=Def\t2\tdet\t_\t_
+2\tchat\tchat\tNOUN\t_\tNumber=Sing\t3\tsubj\t_\tGloss=cat
+3\tdort\tdormir\tVERB\t_\t_\t0\troot\t_\t_"""
+
+
+@pytest.fixture
+def server():
+    saved_server = grew_config.server
+    with FakeGrewServer() as fake_server:
+        grew_config.server = fake_server.url
+        GrewService.create_project("project")
+        content = "\n\n".join(CONLL.format(sent_id="s{}".format(i), user_id="alice") for i in range(3))
+        GrewService.save_sample("project", "sample", io.BytesIO(content.encode("utf-8")))
+        yield fake_server
+    grew_config.server = saved_server
+
+
+def test_projects_and_samples(server):
+    project = GrewService.get_project("project")
+    assert project["number_samples"] == 1
+    assert project["number_sentences"] == 3
+    assert project["users"] == ["alice"]
+    sample = GrewService.get_samples("project")[0]
+    assert sample["tree_by_user"] == {"alice": 3}
+    assert sample["number_tokens"] == 9
+
+
+def test_save_graph_and_get_conll(server):
+    grew_request("saveGraph", data={
+        "project_id": "project",
+        "sample_id": "sample",
+        "user_id": "bob",
+        "conll_graph": CONLL.format(sent_id="s1", user_id="bob"),
+    })
+    trees = GrewService.get_sample_trees("project", "sample")
+    assert list(trees) == ["s0", "s1", "s2"]
+    assert set(trees["s1"]) == {"alice", "bob"}
+
+
+def test_search_and_tagsets(server):
+    matches = list(GrewService.search_request_in_graphs("project", 'pattern { X [upos=NOUN] }', [], "all", ""))
+    assert [(match["sent_id"], match["nodes"]) for match in matches] == [("s0", {"X": "2"}), ("s1", {"X": "2"}), ("s2", {"X": "2"})]
+    tagsets = TagsetService.fetch_tagsets("project", ["sample"])
+    assert (tagsets["feats"], tagsets["misc"]) == (["Definite", "Number"], ["Gloss"])
+    relation_table = GrewService.get_relation_table("project", [], "all", "")["data"]
+    assert relation_table["subj"] == {"VERB": {"NOUN": 3}}
+
+
+def test_unknown_project_replies_an_error(server):
+    reply = server.app.test_client().post("/getSamples", data={"project_id": "unknown"}).get_json()
+    assert reply["status"] == "ERROR"
+    assert server.calls["saveConll"] == 1
@@ -6,6 +6,7 @@ from conllup.processing import changeMetaFieldInSentenceConllu
 from conllup.conllup import sentenceConllToJson, sentenceJsonToConll
 
 from app.config import Config
+from app.jobs.service import JobService
 from app.projects.service import LastAccessService, ProjectAccessService, ProjectService
 from app.user.service import UserService
 from app.samples.service import SampleBlindAnnotationLevelService
@@ -158,21 +159,16 @@ class ValidateSampleTrees(Resource):
             sample_name (str)
         Returns: 
             { message: {"user_1": {"sent_id": message, ....}}}
+            or { "status": "OK", "data": { "jobId" } } when called with ?background=true
         """
         project = ProjectService.get_by_name(project_name)
-        trees = GrewService.get_samples_with_string_contents(project_name, [sample_name])[1][0]
-        mapped_languages = TreeValidationService.extract_ud_languages()
-        user_trees_errors = {}
-        if project.config == 'ud':
-            for user, tree_conll in trees.items():
-                if user != 'last':
-                    if project.language in mapped_languages.keys():
-                        lang_code = mapped_languages[project.language]
-                        validation_results = validate_ud(lang_code, 5, tree_conll)[0]
-                    else:
-                        validation_results = validate_ud(None, 3, tree_conll)[0]   
-                    user_trees_errors[user] = TreeValidationService.parse_validation_results(validation_results)
-            
+        if JobService.is_background_request():
+            params = { "project_name": project_name, "sample_name": sample_name }
+            job = JobService.submit("validation", project.id, current_user.id, params)
+            return { "status": "OK", "data": { "jobId": job.uuid } }, 202
+
+        user_trees_errors = TreeValidationService.validate_sample(project, sample_name)
+        if user_trees_errors is not None:
             return { "message": user_trees_errors }
                        
 @api.route("/<string:project_name>/tree/validate")
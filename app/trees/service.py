@@ -8,7 +8,10 @@ from conllup.conllup import sentenceConllToJson, sentenceJsonToConll
 from conllup.processing import constructTextFromTreeJson, emptySentenceConllu
 
 from app.config import Config
+from app.jobs.service import JobContext, job_handler
+from app.projects.service import ProjectService
 from app.utils.grew_utils import GrewService, grew_request
+from app.utils.ud_validator.validate import validate_ud
 BASE_TREE = "base_tree"
 VALIDATED = "validated"
 
@@ -270,4 +273,46 @@ class TreeValidationService:
                     break
 
         return error_messages
-            
\ No newline at end of file
+
+    @staticmethod
+    def validate_sample(project, sample_name, on_user=None):
+        """Validate the trees of every user of a sample, only for the ud projects
+
+        Args:
+            project (Project)
+            sample_name (str)
+            on_user (Callable[[int, int, dict], None], optional): called with the number of validated users,
+                the total and the errors found so far
+
+        Returns:
+            { "user_1": {"sent_id": message, ....}} | None if the project is not a ud project
+        """
+        if project.config != 'ud':
+            return None
+        trees = GrewService.get_samples_with_string_contents(project.project_name, [sample_name])[1][0]
+        mapped_languages = TreeValidationService.extract_ud_languages()
+        users = [user for user in trees.keys() if user != 'last']
+        user_trees_errors = {}
+        for index, user in enumerate(users, start=1):
+            tree_conll = trees[user]
+            if project.language in mapped_languages.keys():
+                lang_code = mapped_languages[project.language]
+                validation_results = validate_ud(lang_code, 5, tree_conll)[0]
+            else:
+                validation_results = validate_ud(None, 3, tree_conll)[0]
+            user_trees_errors[user] = TreeValidationService.parse_validation_results(validation_results)
+            if on_user:
+                on_user(index, len(users), user_trees_errors)
+        return user_trees_errors
+
+
+@job_handler("validation")
+def run_validation_job(context: JobContext):
+    """Background version of the sample validation endpoint, the partial result has the users already validated"""
+    project = ProjectService.get_by_name(context.params["project_name"])
+    user_trees_errors = TreeValidationService.validate_sample(
+        project,
+        context.params["sample_name"],
+        on_user=lambda done, total, errors: context.update(progress=done, total=total, result={"message": errors}),
+    )
+    return {"message": user_trees_errors}
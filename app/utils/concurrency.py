@@ -0,0 +1,137 @@
+import copy
+import json
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from flask import current_app, has_app_context
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _in_app_context(fct: Callable[[T], R]) -> Callable[[T], R]:
+    """Wrap fct so that it runs in the app context of the caller, worker threads don't inherit it"""
+    if not has_app_context():
+        return fct
+    app = current_app._get_current_object()
+
+    def run(item):
+        with app.app_context():
+            return fct(item)
+    return run
+
+
+def imap_in_threads(fct: Callable[[T], R], items: Iterable[T], max_workers: int = 1) -> Iterator[R]:
+    """
+        Lazily apply fct to items with at most max_workers calls in flight,
+        the results are yielded in the order of the items
+
+    Args:
+        fct (Callable[[T], R])
+        items (Iterable[T])
+        max_workers (int, optional): 1 runs everything in the calling thread
+
+    Yields:
+        R
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield fct(item)
+        return
+
+    run = _in_app_context(fct)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(run, item))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def map_in_threads(fct: Callable[[T], R], items: Iterable[T], max_workers: int = 1) -> list:
+    """Same as imap_in_threads but returns the list of results"""
+    return list(imap_in_threads(fct, items, max_workers))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+        Coalesce identical calls running at the same time in the process: the first caller
+        runs the call and the ones arriving while it is in flight wait for its result.
+        Every caller gets its own copy of the result so they can modify it freely.
+        The calls of other processes (e.g. the other uwsgi workers) are not seen
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counters = defaultdict(lambda: {"sent": 0, "coalesced": 0})
+
+    def do(self, name: str, params: dict, fct: Callable[[], R]) -> R:
+        """Run fct, or wait for the identical call (same name and params) already in flight
+
+        Args:
+            name (str)
+            params (dict)
+            fct (Callable[[], R])
+
+        Returns:
+            R
+        """
+        key = (name, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+            self._counters[name]["sent" if is_leader else "coalesced"] += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fct()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                has_followers = flight.followers > 0
+            flight.done.set()
+        return copy.deepcopy(flight.result) if has_followers else flight.result
+
+    def forget(self):
+        """Let the next calls start a new flight instead of joining the ones in progress,
+        used after a write so that nobody gets a result read before it"""
+        with self._lock:
+            self._flights.clear()
+
+    def stats(self):
+        """Sent and coalesced counters of the current process by call name
+
+        Returns:
+            {name: {"sent": int, "coalesced": int}}
+        """
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._counters.items()}
@@ -0,0 +1,112 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask, current_app
+
+from app.utils.concurrency import SingleFlight, imap_in_threads, map_in_threads
+
+
+def test_results_keep_the_order_of_items():
+    def slow_square(number):
+        time.sleep(0.01 * (5 - number))
+        return number * number
+    assert map_in_threads(slow_square, range(5), max_workers=3) == [0, 1, 4, 9, 16]
+
+
+def test_in_flight_calls_are_bounded():
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def track(item):
+        with lock:
+            in_flight.append(item)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(item)
+        return item
+
+    assert map_in_threads(track, range(20), max_workers=4) == list(range(20))
+    assert max(peak) <= 4
+
+
+def test_workers_run_in_the_app_context_of_the_caller():
+    app = Flask("concurrency_test")
+    with app.app_context():
+        names = map_in_threads(lambda _: current_app.name, range(3), max_workers=2)
+    assert names == ["concurrency_test"] * 3
+
+
+def test_single_worker_is_lazy():
+    consumed = []
+
+    def items():
+        for item in range(3):
+            consumed.append(item)
+            yield item
+
+    results = imap_in_threads(lambda item: item, items(), max_workers=1)
+    assert next(results) == 0
+    assert consumed == [0]
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {"data": [1, 2]}
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(single_flight.do, "getConll", {"sample_id": "s"}, fetch)
+        started.wait()
+        followers = [executor.submit(single_flight.do, "getConll", {"sample_id": "s"}, fetch) for _ in range(4)]
+        while single_flight.stats()["getConll"]["coalesced"] < 4:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert len(calls) == 1
+    assert all(result == {"data": [1, 2]} for result in results)
+    # every caller gets its own copy
+    assert len({id(result) for result in results}) == 5
+    assert single_flight.stats() == {"getConll": {"sent": 1, "coalesced": 4}}
+
+
+def test_single_flight_shares_errors_and_runs_again_after():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise ValueError("grew down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "getProjects", {}, failing)
+        started.wait()
+        follower = executor.submit(single_flight.do, "getProjects", {}, failing)
+        while single_flight.stats()["getProjects"]["coalesced"] < 1:
+            time.sleep(0.001)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert single_flight.do("getProjects", {}, lambda: "ok") == "ok"
+
+
+def test_single_flight_different_params_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert single_flight.do("getSamples", {"project_id": "a"}, lambda: "a") == "a"
+    assert single_flight.do("getSamples", {"project_id": "b"}, lambda: "b") == "b"
+    assert single_flight.stats() == {"getSamples": {"sent": 2, "coalesced": 0}}
@@ -0,0 +1,367 @@
+"""
+    Archives of the exports, built while they are sent (see SampleExportService.iter_archive).
+
+    A zip member is compressed on its own, stored or with deflate at a chosen level. A tar archive is
+    compressed with gzip, xz or zstd (when the zstandard package is installed) as a series of independent
+    frames, one for each member, which every decompressor reads as a single stream. Either way the members
+    are compressed in parallel by a pool of threads (zlib, lzma and zstandard release the GIL) and written
+    in order. At most `workers` compressed members are waiting to be written, each of them keeps at most
+    MEMBER_MEMORY_SIZE bytes in memory: the compressed data of a bigger member goes to a temporary file,
+    so a large sample is still sent without being held in memory.
+"""
+import io
+import lzma
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from app.utils.concurrency import imap_in_threads
+from app.utils.export_cache import CachedMember
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# size of the pieces of the export archives sent to the client
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+TAR_RECORD_SIZE = tarfile.RECORDSIZE
+# compressed bytes of a member kept in memory while it waits to be written, the rest goes to a temporary file
+MEMBER_MEMORY_SIZE = 8 * 1024 * 1024
+# zlib.Z_DEFAULT_COMPRESSION, the level of the entries of the export cache
+DEFAULT_DEFLATE_LEVEL = 6
+
+# content of a member: the text, a cached compressed file, or a function returning one of them
+MemberContent = Union[Iterable[str], CachedMember, Callable[[], Union[Iterable[str], CachedMember]]]
+
+ZIP_COMPRESSIONS = ("deflate", "stored")
+TAR_COMPRESSIONS = ("gzip", "xz", "zstd", "none")
+# (min, max, default) by compression
+COMPRESSION_LEVELS = {"deflate": (0, 9, 6), "gzip": (0, 9, 6), "xz": (0, 9, 6), "zstd": (1, 22, 3)}
+EXTENSIONS = {"deflate": "zip", "stored": "zip", "gzip": "tar.gz", "xz": "tar.xz", "zstd": "tar.zst", "none": "tar"}
+MIMETYPES = {
+    "deflate": "application/zip",
+    "stored": "application/zip",
+    "gzip": "application/gzip",
+    "xz": "application/x-xz",
+    "zstd": "application/zstd",
+    "none": "application/x-tar",
+}
+
+
+class ExportFormat:
+    """How an export is archived and compressed
+
+    Args:
+        archive (str, optional): zip | tar
+        compression (str, optional): deflate (default) | stored for zip, gzip (default) | xz | zstd | none for tar
+        level (int, optional): compression level, 0-9 (1-22 for zstd), the default of the compression if None
+    """
+
+    def __init__(self, archive: str = "zip", compression: str = None, level: int = None):
+        if archive == "zip":
+            compression = compression or "deflate"
+            if compression not in ZIP_COMPRESSIONS:
+                raise ValueError("The zip compression must be one of {}".format(", ".join(ZIP_COMPRESSIONS)))
+        elif archive == "tar":
+            compression = compression or "gzip"
+            if compression not in TAR_COMPRESSIONS:
+                raise ValueError("The tar compression must be one of {}".format(", ".join(TAR_COMPRESSIONS)))
+            if compression == "zstd" and zstandard is None:
+                raise ValueError("zstd is not available on this server")
+        else:
+            raise ValueError("The export format must be zip or tar")
+
+        if compression in COMPRESSION_LEVELS:
+            min_level, max_level, default_level = COMPRESSION_LEVELS[compression]
+            if level is None:
+                level = default_level
+            if not isinstance(level, int) or not min_level <= level <= max_level:
+                raise ValueError("The {} level must be between {} and {}".format(compression, min_level, max_level))
+        else:
+            level = None
+        self.archive = archive
+        self.compression = compression
+        self.level = level
+
+    @classmethod
+    def from_args(cls, args: dict) -> "ExportFormat":
+        """Read the format of the export endpoints: format (zip | tar), compression and compressionLevel"""
+        return cls(args.get("format") or "zip", args.get("compression"), args.get("compressionLevel"))
+
+    def to_args(self) -> dict:
+        return {"format": self.archive, "compression": self.compression, "compressionLevel": self.level}
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.compression]
+
+    @property
+    def mimetype(self) -> str:
+        return MIMETYPES[self.compression]
+
+    @property
+    def uses_cached_deflate(self) -> bool:
+        """The raw deflate of the export cache can be copied as it is in the archive"""
+        return self.compression in ("deflate", "gzip") and self.level == DEFAULT_DEFLATE_LEVEL
+
+    def file_name(self, name: str) -> str:
+        return "{}.{}".format(name, self.extension)
+
+
+class CompressedMember:
+    """A member ready to be written: its compressed data, and for zip its crc and sizes"""
+
+    def __init__(self, path: str, file_size: int, crc: int, data: Iterable[bytes], compress_size: int,
+                 header: bytes = b"", tar_size: int = 0):
+        self.path = path
+        self.file_size = file_size
+        self.crc = crc
+        self.data = data
+        self.compress_size = compress_size
+        # tar: the compressed header written before data, and the size of the member in the uncompressed tar
+        self.header = header
+        self.tar_size = tar_size
+
+
+def iter_archive(members: Iterable[Tuple[str, MemberContent]], export_format: ExportFormat, workers: int = 1) -> Iterator[bytes]:
+    """Build an archive while it is sent, the members are compressed by workers threads. The memory in
+    flight is at most about workers * MEMBER_MEMORY_SIZE, bigger members are compressed to temporary files
+
+    Args:
+        members (Iterable[(path, MemberContent)])
+        export_format (ExportFormat)
+        workers (int, optional)
+
+    Yields:
+        bytes: pieces of about ARCHIVE_CHUNK_SIZE bytes
+    """
+    compress = _compress_zip_member if export_format.archive == "zip" else _compress_tar_member
+    compressed_members = imap_in_threads(lambda member: compress(member, export_format), members, workers)
+    if export_format.archive == "zip":
+        yield from _iter_zip(compressed_members, export_format)
+    else:
+        yield from _iter_tar(compressed_members, export_format)
+
+
+def _iter_content(content: MemberContent) -> Tuple[Optional[CachedMember], Iterable[bytes]]:
+    """The cached file of a member, or its encoded text if it is not cached"""
+    if callable(content):
+        content = content()
+    if isinstance(content, CachedMember):
+        return content, None
+    return None, (piece.encode("utf-8") for piece in content)
+
+
+def _new_compressor(export_format: ExportFormat):
+    """A compressor of the export format, with compress and flush like zlib"""
+    if export_format.compression == "deflate":
+        return zlib.compressobj(export_format.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if export_format.compression == "gzip":
+        return zlib.compressobj(export_format.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if export_format.compression == "xz":
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=export_format.level)
+    if export_format.compression == "zstd":
+        return zstandard.ZstdCompressor(level=export_format.level).compressobj()
+    return None
+
+
+def _compress(chunks: Iterable[bytes], compressor, spool: tempfile.SpooledTemporaryFile) -> Tuple[int, int, int]:
+    """Compress chunks into spool, returns the compressed size, and the crc and size of the content"""
+    crc = file_size = compress_size = 0
+    # the compressors are given big blocks, they only release the GIL while they work on one
+    for data in _iter_blocks(chunks):
+        crc = zlib.crc32(data, crc)
+        file_size += len(data)
+        compress_size += spool.write(compressor.compress(data) if compressor else data)
+    if compressor:
+        compress_size += spool.write(compressor.flush())
+    return compress_size, crc, file_size
+
+
+def _new_spool() -> tempfile.SpooledTemporaryFile:
+    return tempfile.SpooledTemporaryFile(max_size=MEMBER_MEMORY_SIZE)
+
+
+def _iter_spool(spool: tempfile.SpooledTemporaryFile) -> Iterator[bytes]:
+    """Read the compressed data of a member by pieces of ARCHIVE_CHUNK_SIZE, the spool is closed at the end"""
+    try:
+        spool.seek(0)
+        while True:
+            data = spool.read(ARCHIVE_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        spool.close()
+
+
+def _iter_blocks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    pending = _Chunks()
+    for data in chunks:
+        pending.append(data)
+        yield from pending.pop_full()
+    yield pending.pop()
+
+
+def _compress_zip_member(member: Tuple[str, MemberContent], export_format: ExportFormat) -> CompressedMember:
+    path, content = member
+    cached, chunks = _iter_content(content)
+    if cached is not None:
+        if export_format.uses_cached_deflate:
+            return CompressedMember(path, cached.file_size, cached.crc, cached.iter_compressed(), cached.compress_size)
+        chunks = cached.iter_content()
+    spool = _new_spool()
+    compress_size, crc, file_size = _compress(chunks, _new_compressor(export_format), spool)
+    return CompressedMember(path, file_size, crc, _iter_spool(spool), compress_size)
+
+
+def _compress_tar_member(member: Tuple[str, MemberContent], export_format: ExportFormat) -> CompressedMember:
+    path, content = member
+    cached, chunks = _iter_content(content)
+    if cached is not None and export_format.uses_cached_deflate:
+        # a gzip frame around the cached deflate, the padding of the tar block in its own frame
+        padding = _compress_frame(_tar_padding(cached.file_size), export_format)
+        data = _iter_gzip_frame(cached, padding)
+        return _tar_member(path, cached.file_size, cached.crc, data, export_format)
+    if cached is not None:
+        chunks = cached.iter_content()
+    compressor = _new_compressor(export_format)
+    spool = _new_spool()
+    _, crc, file_size = _compress(chunks, compressor, spool)
+    if compressor:
+        # the frame of the content is finished, the padding goes in another one
+        spool.write(_compress_frame(_tar_padding(file_size), export_format))
+    else:
+        spool.write(_tar_padding(file_size))
+    return _tar_member(path, file_size, crc, _iter_spool(spool), export_format)
+
+
+def _tar_member(path: str, file_size: int, crc: int, data: Iterable[bytes], export_format: ExportFormat) -> CompressedMember:
+    header = _tar_header(path, file_size)
+    tar_size = len(header) + file_size + len(_tar_padding(file_size))
+    return CompressedMember(path, file_size, crc, data, 0, _compress_frame(header, export_format), tar_size)
+
+
+def _compress_frame(data: bytes, export_format: ExportFormat) -> bytes:
+    if not data:
+        return b""
+    compressor = _new_compressor(export_format)
+    if compressor is None:
+        return data
+    return compressor.compress(data) + compressor.flush()
+
+
+def _iter_gzip_frame(cached: CachedMember, padding: bytes) -> Iterator[bytes]:
+    # magic, deflate, no flags, no mtime, no extra flags, unknown os
+    yield b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+    yield from cached.iter_compressed()
+    yield struct.pack("<II", cached.crc, cached.file_size & 0xFFFFFFFF)
+    if padding:
+        yield padding
+
+
+def _tar_header(path: str, size: int) -> bytes:
+    info = tarfile.TarInfo(path)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    return info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int) -> bytes:
+    return b"\0" * (-size % TAR_BLOCK_SIZE)
+
+
+def _iter_tar(compressed_members: Iterable[CompressedMember], export_format: ExportFormat) -> Iterator[bytes]:
+    pending = _Chunks()
+    # size of the uncompressed tar, the end of the archive is padded to a full record
+    tar_size = 0
+    for member in compressed_members:
+        pending.append(member.header)
+        tar_size += member.tar_size
+        yield from pending.pop_full()
+        for data in member.data:
+            pending.append(data)
+            yield from pending.pop_full()
+    end_blocks = 2 * TAR_BLOCK_SIZE
+    end_blocks += -(tar_size + end_blocks) % TAR_RECORD_SIZE
+    pending.append(_compress_frame(b"\0" * end_blocks, export_format))
+    yield pending.pop()
+
+
+def _iter_zip(compressed_members: Iterable[CompressedMember], export_format: ExportFormat) -> Iterator[bytes]:
+    stream = _ZipStream()
+    compress_type = zipfile.ZIP_STORED if export_format.compression == "stored" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(stream, "w") as zf:
+        for member in compressed_members:
+            data = zipfile.ZipInfo(member.path, date_time=time.localtime(time.time())[:6])
+            data.compress_type = compress_type
+            yield from _iter_zip_member(zf, stream, data, member)
+    yield stream.pop()
+
+
+def _iter_zip_member(zf: zipfile.ZipFile, stream: "_ZipStream", data: zipfile.ZipInfo, member: CompressedMember):
+    """Add a member already compressed to a zip being written, the way ZipFile.mkdir adds its entries.
+    Its crc and sizes are known so they are in its header"""
+    data.CRC = member.crc
+    data.file_size = member.file_size
+    data.compress_size = member.compress_size
+    data.header_offset = zf.fp.tell()
+    zf.filelist.append(data)
+    zf.NameToInfo[data.filename] = data
+    zip64 = max(member.file_size, member.compress_size) > zipfile.ZIP64_LIMIT
+    zf.fp.write(data.FileHeader(zip64))
+    for compressed in member.data:
+        zf.fp.write(compressed)
+        yield from stream.pop_full()
+    zf.start_dir = zf.fp.tell()
+
+
+class _Chunks:
+    """Bytes waiting to be sent, popped by pieces of ARCHIVE_CHUNK_SIZE"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def append(self, data: bytes):
+        if data:
+            self.chunks.append(bytes(data))
+            self.size += len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+    def pop_full(self) -> Iterator[bytes]:
+        if self.size >= ARCHIVE_CHUNK_SIZE:
+            yield self.pop()
+
+
+class _ZipStream(io.RawIOBase):
+    """Write only file keeping what zipfile writes until it is popped. It is not seekable, so zipfile
+    does not try to go back to the headers"""
+
+    def __init__(self):
+        self.pending = _Chunks()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(data)
+        return len(data)
+
+    def pop(self) -> bytes:
+        return self.pending.pop()
+
+    def pop_full(self) -> Iterator[bytes]:
+        return self.pending.pop_full()
@@ -0,0 +1,89 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from app.utils import export_archive
+from app.utils.export_archive import ExportFormat, iter_archive, zstandard
+from app.utils.export_cache import export_cache
+
+CONTENTS = {
+    "alice/sample_{}.conllu".format(index): ["# sent_id = s{}\n1\tmot{}\t_\t_\t_\t_\t0\troot\t_\t_\n\n".format(j, j * index) for j in range(300 * index)]
+    for index in range(4)
+}
+FORMATS = [
+    ("zip", "deflate", None),
+    ("zip", "deflate", 1),
+    ("zip", "stored", None),
+    ("tar", "gzip", None),
+    ("tar", "gzip", 9),
+    ("tar", "xz", 0),
+    ("tar", "none", None),
+]
+if zstandard is not None:
+    FORMATS.append(("tar", "zstd", None))
+
+
+def read_archive(data, export_format):
+    if export_format.archive == "zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            return {name: zf.read(name).decode() for name in zf.namelist()}
+    mode = {"gzip": "r:gz", "xz": "r:xz", "none": "r:"}.get(export_format.compression, "r|*")
+    if export_format.compression == "zstd":
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        mode = "r:"
+    with tarfile.open(fileobj=io.BytesIO(data), mode=mode) as tf:
+        return {member.name: tf.extractfile(member).read().decode() for member in tf.getmembers()}
+
+
+@pytest.mark.parametrize("archive, compression, level", FORMATS)
+@pytest.mark.parametrize("cached", [False, True])
+def test_archive_formats(archive, compression, level, cached, monkeypatch, tmp_path):
+    monkeypatch.setattr("app.utils.export_cache.EXPORT_CACHE_FOLDER", str(tmp_path))
+    monkeypatch.setattr("app.utils.export_archive.ARCHIVE_CHUNK_SIZE", 512)
+    export_format = ExportFormat(archive, compression, level)
+
+    def members():
+        for path, content in CONTENTS.items():
+            if cached:
+                yield path, export_cache.put(path.replace("/", "_"), iter(content))
+            else:
+                yield path, iter(content)
+
+    chunks = list(iter_archive(members(), export_format, workers=3))
+    assert len(chunks) > 1
+    expected = {path: "".join(content) for path, content in CONTENTS.items()}
+    assert read_archive(b"".join(chunks), export_format) == expected
+
+
+@pytest.mark.parametrize("archive", ["zip", "tar"])
+def test_big_members_are_kept_in_temporary_files(archive, monkeypatch):
+    monkeypatch.setattr("app.utils.export_archive.MEMBER_MEMORY_SIZE", 1024)
+    spools = []
+    new_spool = export_archive._new_spool
+
+    def spy():
+        spools.append(new_spool())
+        return spools[-1]
+    monkeypatch.setattr("app.utils.export_archive._new_spool", spy)
+    export_format = ExportFormat(archive, "stored" if archive == "zip" else "none")
+
+    chunks = list(iter_archive(((path, iter(content)) for path, content in CONTENTS.items()), export_format, workers=2))
+    expected = {path: "".join(content) for path, content in CONTENTS.items()}
+    assert read_archive(b"".join(chunks), export_format) == expected
+    # the empty sample stays in memory, the others went to disk
+    assert [spool._rolled for spool in spools] == [False, True, True, True]
+    assert all(spool.closed for spool in spools)
+
+
+def test_export_format_errors():
+    assert ExportFormat.from_args({}).file_name("dump.project") == "dump.project.zip"
+    assert ExportFormat.from_args({"format": "tar", "compression": "xz"}).mimetype == "application/x-xz"
+    with pytest.raises(ValueError):
+        ExportFormat("rar")
+    with pytest.raises(ValueError):
+        ExportFormat("zip", "xz")
+    with pytest.raises(ValueError):
+        ExportFormat("zip", "deflate", 12)
@@ -0,0 +1,207 @@
+"""
+    On disk cache of the files of the export zips (see SampleExportService in app/utils/grew_utils.py).
+
+    An entry is the file of a user in a sample, compressed with deflate as it is stored in the zips, for a
+    version of the sample: its write version in grew_cache when it is active, else a hash of its content.
+    A write on the sample gives it a new version so the old entries are never read again, they are evicted
+    with the least recently used ones when the cache gets bigger than Config.EXPORT_CACHE_SIZE.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from app.config import Config
+
+EXPORT_CACHE_FOLDER = os.path.join(Config.UPLOAD_FOLDER, "export_cache")
+# the content of the entries changes with this number
+EXPORT_CACHE_FORMAT = 1
+# header of an entry: does the user have the file in the export, crc32 and size of the uncompressed content
+ENTRY_HEADER = struct.Struct("<?IQ")
+READ_SIZE = 64 * 1024
+
+
+class CachedMember:
+    """A compressed file of the cache. It is opened when it is found, so its eviction does not break
+    the export that is sending it"""
+
+    def __init__(self, fileobject, present: bool, crc: int, file_size: int, compress_size: int):
+        self.fileobject = fileobject
+        self.present = present
+        self.crc = crc
+        self.file_size = file_size
+        self.compress_size = compress_size
+
+    def iter_compressed(self) -> Iterator[bytes]:
+        """The raw deflate data, the file is closed at the end"""
+        try:
+            while True:
+                data = self.fileobject.read(READ_SIZE)
+                if not data:
+                    return
+                yield data
+        finally:
+            self.close()
+
+    def iter_content(self) -> Iterator[bytes]:
+        """The uncompressed content, the file is closed at the end"""
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        for data in self.iter_compressed():
+            yield decompressor.decompress(data)
+        yield decompressor.flush()
+
+    def close(self):
+        self.fileobject.close()
+
+
+class ExportCache:
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return Config.EXPORT_CACHE_ENABLED
+
+    @staticmethod
+    def entry_key(project_name: str, sample_name: str, version: str, user: str, options: str) -> str:
+        """Key of the file of a user in a version of a sample
+
+        Args:
+            project_name (str)
+            sample_name (str)
+            version (str): write version of the sample in grew_cache or content_version
+            user (str)
+            options (str): how the trees are written (e.g. the stripped metadata)
+
+        Returns:
+            str
+        """
+        key = json.dumps([EXPORT_CACHE_FORMAT, project_name, sample_name, version, user, options])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def content_version(sample_data) -> str:
+        """Version of a sample from its content, when there is no write version
+
+        Args:
+            sample_data ({"sent_id_1":{"user_1":"conllstring"}})
+
+        Returns:
+            str
+        """
+        content = json.dumps(sample_data, sort_keys=True, ensure_ascii=False)
+        return "sha1:" + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def contains(key: str) -> bool:
+        return os.path.exists(_entry_path(key))
+
+    @staticmethod
+    def get(key: str) -> Optional[CachedMember]:
+        """Open an entry and mark it as used
+
+        Args:
+            key (str)
+
+        Returns:
+            CachedMember | None
+        """
+        path = _entry_path(key)
+        try:
+            fileobject = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            present, crc, file_size = ENTRY_HEADER.unpack(fileobject.read(ENTRY_HEADER.size))
+            compress_size = os.fstat(fileobject.fileno()).st_size - ENTRY_HEADER.size
+            os.utime(path)
+        except (struct.error, OSError):
+            fileobject.close()
+            return None
+        return CachedMember(fileobject, present, crc, file_size, compress_size)
+
+    @staticmethod
+    def put(key: str, content: Optional[Iterable[str]]) -> CachedMember:
+        """Compress a file in the cache, the content is read once and never kept in memory
+
+        Args:
+            key (str)
+            content (Iterable[str] | None): None if the user has no file in the export
+
+        Returns:
+            CachedMember: the new entry, opened
+        """
+        os.makedirs(EXPORT_CACHE_FOLDER, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=EXPORT_CACHE_FOLDER, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as entry_file:
+                entry_file.write(ENTRY_HEADER.pack(False, 0, 0))
+                crc = file_size = 0
+                compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+                for piece in content or []:
+                    data = piece.encode("utf-8")
+                    crc = zlib.crc32(data, crc)
+                    file_size += len(data)
+                    entry_file.write(compressor.compress(data))
+                entry_file.write(compressor.flush())
+                entry_file.seek(0)
+                entry_file.write(ENTRY_HEADER.pack(content is not None, crc, file_size))
+            fileobject = open(temporary_path, "rb")
+            os.replace(temporary_path, _entry_path(key))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        fileobject.seek(ENTRY_HEADER.size)
+        compress_size = os.fstat(fileobject.fileno()).st_size - ENTRY_HEADER.size
+        return CachedMember(fileobject, content is not None, crc, file_size, compress_size)
+
+    @staticmethod
+    def evict(max_size: int = None) -> int:
+        """Delete the least recently used entries until the cache fits in max_size bytes
+
+        Args:
+            max_size (int, optional): Config.EXPORT_CACHE_SIZE by default
+
+        Returns:
+            int: number of deleted entries
+        """
+        if max_size is None:
+            max_size = Config.EXPORT_CACHE_SIZE
+        if not os.path.isdir(EXPORT_CACHE_FOLDER):
+            return 0
+        entries = []
+        total_size = 0
+        with os.scandir(EXPORT_CACHE_FOLDER) as scanned:
+            for entry in scanned:
+                try:
+                    stat = entry.stat()
+                    # left by an export that was killed while it was writing the entry
+                    if entry.name.endswith(".tmp"):
+                        if stat.st_mtime < time.time() - 3600:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        deleted = 0
+        for _, size, path in sorted(entries):
+            if total_size <= max_size:
+                break
+            try:
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return deleted
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(EXPORT_CACHE_FOLDER, key)
+
+
+export_cache = ExportCache()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import defaultdict
+
+from flask import has_app_context
+
+from app import cache, grew_config
+
+# read only grew functions whose replies can be served from the cache
+CACHED_FUNCTIONS = {"getProjects", "getSamples", "getProjectConfig", "getPOS", "getRelations", "getFeatures"}
+
+# grew functions that modify a project, they invalidate the cached replies of the project
+MUTATING_FUNCTIONS = {
+    "saveGraph",
+    "saveConll",
+    "newSamples",
+    "eraseSamples",
+    "renameSample",
+    "renameProject",
+    "updateProjectConfig",
+    "insertConll",
+    "eraseSentence",
+    "eraseGraphs",
+    "newProject",
+    "eraseProject",
+}
+
+# getProjects lists every project so it is stamped with a version that changes on any write
+ALL_PROJECTS = "__all__"
+
+
+class GrewCache:
+    """
+        Read-through cache of grew replies stored in the flask_caching `cache` (shared by the workers).
+        Each entry is stamped with the write version of its project, a mutating call on the project
+        replaces the version so the old entries are never read again and expire on their own.
+        The samples have their own versions, only replaced by the writes on the sample (or on the whole project)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    @staticmethod
+    def is_active() -> bool:
+        return grew_config.cache_enabled and has_app_context()
+
+    @staticmethod
+    def _version_key(project_id: str) -> str:
+        return "grew_version:{}".format(project_id)
+
+    def get_version(self, project_id: str) -> str:
+        """Get the current write version of a project, a new one is created if there is none
+
+        Args:
+            project_id (str)
+
+        Returns:
+            str
+        """
+        version_key = self._version_key(project_id)
+        version = cache.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(version_key, version, timeout=0)
+        return version
+
+    def bump_version(self, project_id: str):
+        """Replace the write version of a project
+
+        Args:
+            project_id (str)
+        """
+        cache.set(self._version_key(project_id), uuid.uuid4().hex, timeout=0)
+
+    def get_sample_version(self, project_id: str, sample_id: str) -> str:
+        """Get the write version of a sample, it also changes on the writes that concern the whole project
+
+        Args:
+            project_id (str)
+            sample_id (str)
+
+        Returns:
+            str
+        """
+        return "{}-{}".format(
+            self.get_version(_project_scope(project_id)),
+            self.get_version(_sample_scope(project_id, sample_id)),
+        )
+
+    def _entry_key(self, fct_name: str, data: dict) -> str:
+        project_id = ALL_PROJECTS if fct_name == "getProjects" else data.get("project_id", ALL_PROJECTS)
+        params = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return "grew:{}:{}:{}:{}".format(fct_name, project_id, self.get_version(project_id), params)
+
+    def fetch(self, fct_name: str, data: dict, send):
+        """Get the grew reply from the cache or send the request and keep its reply
+
+        Args:
+            fct_name (str)
+            data (dict)
+            send (Callable[[], grew_response])
+
+        Returns:
+            grew_response
+        """
+        if fct_name not in CACHED_FUNCTIONS or not self.is_active():
+            return send()
+
+        key = self._entry_key(fct_name, data)
+        reply = cache.get(key)
+        if reply is not None:
+            self._count(fct_name, "hits")
+            return reply
+
+        self._count(fct_name, "misses")
+        reply = send()
+        if reply.get("status") == "OK":
+            cache.set(key, reply, timeout=grew_config.cache_timeout)
+        return reply
+
+    def invalidate(self, fct_name: str, data: dict):
+        """Invalidate the cached replies of the project touched by a mutating grew call
+
+        Args:
+            fct_name (str)
+            data (dict)
+        """
+        if fct_name not in MUTATING_FUNCTIONS or not self.is_active():
+            return
+        project_ids = [data[key] for key in ("project_id", "new_project_id") if data.get(key)]
+        for project_id in project_ids:
+            self.bump_version(project_id)
+        self.bump_version(ALL_PROJECTS)
+
+        sample_ids = _touched_samples(data)
+        for project_id in project_ids:
+            if sample_ids:
+                for sample_id in sample_ids:
+                    self.bump_version(_sample_scope(project_id, sample_id))
+            else:
+                self.bump_version(_project_scope(project_id))
+
+    def _count(self, fct_name: str, counter: str):
+        with self._lock:
+            self._counters[fct_name][counter] += 1
+
+    def stats(self):
+        """Hit and miss counters of the current worker by grew function
+
+        Returns:
+            {fct_name: {"hits": int, "misses": int}}
+        """
+        with self._lock:
+            return {fct_name: dict(counters) for fct_name, counters in self._counters.items()}
+
+
+def _project_scope(project_id: str) -> str:
+    return "{}/".format(project_id)
+
+
+def _sample_scope(project_id: str, sample_id: str) -> str:
+    return "{}/{}".format(project_id, sample_id)
+
+
+def _touched_samples(data: dict):
+    """Samples modified by a mutating call, an empty list means the whole project"""
+    sample_ids = [data[key] for key in ("sample_id", "new_sample_id") if data.get(key)]
+    if data.get("sample_ids"):
+        sample_ids += json.loads(data["sample_ids"])
+    return sample_ids
+
+
+grew_cache = GrewCache()
@@ -0,0 +1,90 @@
+import pytest
+from flask import Flask
+
+from app import cache
+from app.utils.grew_cache import GrewCache
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    with app.app_context():
+        yield
+        cache.clear()
+
+
+def make_sender(calls):
+    def send():
+        calls.append(1)
+        return {"status": "OK", "data": len(calls)}
+    return send
+
+
+def test_reads_are_served_from_cache(app_context):
+    grew_cache = GrewCache()
+    calls = []
+    data = {"project_id": "project_1"}
+    assert grew_cache.fetch("getSamples", data, make_sender(calls)) == {"status": "OK", "data": 1}
+    assert grew_cache.fetch("getSamples", data, make_sender(calls)) == {"status": "OK", "data": 1}
+    assert len(calls) == 1
+    assert grew_cache.stats()["getSamples"] == {"hits": 1, "misses": 1}
+
+
+def test_uncached_functions_are_always_sent(app_context):
+    grew_cache = GrewCache()
+    calls = []
+    grew_cache.fetch("getConll", {"project_id": "project_1"}, make_sender(calls))
+    grew_cache.fetch("getConll", {"project_id": "project_1"}, make_sender(calls))
+    assert len(calls) == 2
+
+
+def test_write_invalidates_only_its_project(app_context):
+    grew_cache = GrewCache()
+    calls_1, calls_2, calls_all = [], [], []
+    grew_cache.fetch("getSamples", {"project_id": "project_1"}, make_sender(calls_1))
+    grew_cache.fetch("getSamples", {"project_id": "project_2"}, make_sender(calls_2))
+    grew_cache.fetch("getProjects", {}, make_sender(calls_all))
+
+    grew_cache.invalidate("saveGraph", {"project_id": "project_1", "sample_id": "sample"})
+
+    grew_cache.fetch("getSamples", {"project_id": "project_1"}, make_sender(calls_1))
+    grew_cache.fetch("getSamples", {"project_id": "project_2"}, make_sender(calls_2))
+    grew_cache.fetch("getProjects", {}, make_sender(calls_all))
+    assert len(calls_1) == 2
+    assert len(calls_2) == 1
+    assert len(calls_all) == 2
+
+
+def test_rename_invalidates_new_project_name(app_context):
+    grew_cache = GrewCache()
+    calls = []
+    grew_cache.fetch("getSamples", {"project_id": "new_name"}, make_sender(calls))
+    grew_cache.invalidate("renameProject", {"project_id": "old_name", "new_project_id": "new_name"})
+    grew_cache.fetch("getSamples", {"project_id": "new_name"}, make_sender(calls))
+    assert len(calls) == 2
+
+
+def test_cache_is_bypassed_without_app_context():
+    grew_cache = GrewCache()
+    calls = []
+    grew_cache.fetch("getSamples", {"project_id": "project_1"}, make_sender(calls))
+    grew_cache.fetch("getSamples", {"project_id": "project_1"}, make_sender(calls))
+    assert len(calls) == 2
+
+
+def test_sample_versions_only_change_with_their_sample(app_context):
+    grew_cache = GrewCache()
+    version_1 = grew_cache.get_sample_version("project_1", "sample_1")
+    version_2 = grew_cache.get_sample_version("project_1", "sample_2")
+
+    grew_cache.invalidate("saveConll", {"project_id": "project_1", "sample_id": "sample_1"})
+    assert grew_cache.get_sample_version("project_1", "sample_1") != version_1
+    assert grew_cache.get_sample_version("project_1", "sample_2") == version_2
+
+    grew_cache.invalidate("eraseSamples", {"project_id": "project_1", "sample_ids": '["sample_2"]'})
+    version_2_erased = grew_cache.get_sample_version("project_1", "sample_2")
+    assert version_2_erased != version_2
+
+    grew_cache.invalidate("renameProject", {"project_id": "project_1", "new_project_id": "project_2"})
+    assert grew_cache.get_sample_version("project_1", "sample_2") != version_2_erased
@@ -0,0 +1,129 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+from app import cache, grew_config
+from app.utils.logging_utils import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# set in the shared cache while an alert is out, so that the other workers don't send theirs
+ALERT_KEY = "grew_circuit_breaker:alert"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class GrewCircuitBreaker:
+    """
+        Stop sending requests to the grew server after grew_config.breaker_failure_threshold
+        consecutive failures (connection errors, timeouts, 5xx replies). While the circuit is open
+        the calls fail immediately, after grew_config.breaker_reset_timeout seconds a single probe
+        request is let through (half open): it closes the circuit if it succeeds, reopens it otherwise.
+        The state is kept by worker process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._alerted = False
+
+    def before_call(self):
+        """Check that a request can be sent
+
+        Raises:
+            CircuitOpenError: while the circuit is open or another request is probing the server
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= grew_config.breaker_reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+        raise CircuitOpenError("The grew server is unavailable, retry in a few seconds")
+
+    def record_success(self):
+        with self._lock:
+            recovered = self.state != CLOSED
+            was_alerted = self._alerted
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+            self._alerted = False
+        if recovered:
+            logger.warning("Grew circuit breaker closed, the grew server answers again")
+        if was_alerted and has_app_context():
+            cache.delete(ALERT_KEY)
+
+    def record_failure(self, error_message: str):
+        """Count a failed request, open the circuit when the threshold is reached
+
+        Args:
+            error_message (str): sent in the alert e-mail if the circuit opens
+        """
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            opens = self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= grew_config.breaker_failure_threshold
+            )
+            if opens:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+        if opens:
+            logger.warning("Grew circuit breaker open after {} failures: {}".format(self.failures, error_message))
+            self.alert(error_message)
+
+    def alert(self, error_message: str):
+        """Send the alert e-mail to the super admins, at most once per outage. The mail is
+        sent in the background so that the request is not blocked by the mail server
+
+        Args:
+            error_message (str)
+        """
+        with self._lock:
+            if self._alerted:
+                return
+            self._alerted = True
+        if not has_app_context():
+            return
+        if not cache.add(ALERT_KEY, error_message, timeout=grew_config.breaker_alert_interval):
+            return
+        threading.Thread(
+            target=_send_alert_email,
+            args=(current_app._get_current_object(), error_message),
+            daemon=True,
+        ).start()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = 0.0
+            self._probe_in_flight = False
+            self._alerted = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def _send_alert_email(app, error_message):
+    from app.user.service import EmailService
+
+    with app.app_context():
+        try:
+            EmailService.send_alert_email("Grew server error", error_message)
+        except Exception as e:
+            logger.error("Grew alert e-mail could not be sent: {}".format(e))
+
+
+grew_circuit_breaker = GrewCircuitBreaker()
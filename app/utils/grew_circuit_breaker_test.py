@@ -0,0 +1,114 @@
+import pytest
+import requests
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+
+from app import cache, grew_config
+from app.utils import grew_circuit_breaker as breaker_module
+from app.utils.grew_circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, GrewCircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def restore_grew_config():
+    saved = dict(vars(grew_config))
+    grew_config.breaker_failure_threshold = 3
+    grew_config.breaker_reset_timeout = 30
+    yield
+    vars(grew_config).update(saved)
+
+
+@pytest.fixture
+def sent_alerts(monkeypatch):
+    alerts = []
+    monkeypatch.setattr(breaker_module, "_send_alert_email", lambda app, message: alerts.append(message))
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    with app.app_context():
+        yield alerts
+        cache.clear()
+
+
+def open_circuit(breaker):
+    for _ in range(grew_config.breaker_failure_threshold):
+        breaker.before_call()
+        breaker.record_failure("Connection refused")
+
+
+def test_opens_after_consecutive_failures(sent_alerts):
+    breaker = GrewCircuitBreaker()
+    breaker.record_failure("Connection refused")
+    breaker.record_failure("Connection refused")
+    breaker.record_success()
+    breaker.record_failure("Connection refused")
+    breaker.record_failure("Connection refused")
+    assert breaker.state == CLOSED
+
+    breaker.record_failure("Connection refused")
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_lets_a_single_probe_through(sent_alerts, monkeypatch):
+    breaker = GrewCircuitBreaker()
+    open_circuit(breaker)
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: breaker.opened_at + 31)
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit(sent_alerts, monkeypatch):
+    breaker = GrewCircuitBreaker()
+    open_circuit(breaker)
+    now = breaker.opened_at + 31
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: now)
+    breaker.before_call()
+    breaker.record_failure("Connection refused")
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_one_alert_per_outage(sent_alerts, monkeypatch):
+    breaker = GrewCircuitBreaker()
+    other_worker = GrewCircuitBreaker()
+    open_circuit(breaker)
+    breaker.alert("Internal server error")
+    open_circuit(other_worker)
+    assert sent_alerts == ["Connection refused"]
+
+    breaker.record_success()
+    open_circuit(breaker)
+    assert len(sent_alerts) == 2
+
+
+def test_grew_request_fails_fast_when_open(sent_alerts, monkeypatch):
+    from app.utils.grew_utils import grew_circuit_breaker, grew_request
+
+    calls = []
+
+    def refused(*args, **kwargs):
+        calls.append(1)
+        raise requests.ConnectionError()
+
+    monkeypatch.setattr("app.utils.grew_utils.grew_transport.post", refused)
+    grew_circuit_breaker.reset()
+    try:
+        for _ in range(grew_config.breaker_failure_threshold):
+            with pytest.raises(HTTPException) as error:
+                grew_request("saveGraph", {"project_id": "project"})
+            assert error.value.code == 500
+        with pytest.raises(HTTPException) as error:
+            grew_request("saveGraph", {"project_id": "project"})
+        assert error.value.code == 503
+        assert len(calls) == grew_config.breaker_failure_threshold
+        assert len(sent_alerts) == 1
+    finally:
+        grew_circuit_breaker.reset()
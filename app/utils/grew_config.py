@@ -1,9 +1,62 @@
 class GrewConfig:
     def __init__(self):
         self.server = None
+        self.pool_size = 10
+        self.connect_timeout = 3.05
+        self.read_timeout = 60
+        self.timeouts = {}
+        self.max_retries = 2
+        self.retry_backoff = 0.2
+        self.cache_enabled = True
+        self.cache_timeout = 300
+        self.tagset_cache_timeout = 86400
+        self.samples_fetch_workers = 4
+        self.samples_save_workers = 4
+        self.slow_call_threshold = 5
+        self.breaker_failure_threshold = 5
+        self.breaker_reset_timeout = 30
+        self.breaker_alert_interval = 3600
 
     def set_url(self, env):
         if env == "prod":
             self.server = "http://arborator-prod.grew.fr"
         else:  # if env is dev or test
-            self.server = "http://arborator-dev.grew.fr"
\ No newline at end of file
+            self.server = "http://arborator-dev.grew.fr"
+
+    def load_options(self, config):
+        """Read the grew client tuning (transport, cache, parallelism, monitoring, circuit breaker) from the flask config
+
+        Args:
+            config (flask.Config)
+        """
+        # points the backend to another grew server, e.g. the fake one of app/test/fake_grew.py for load tests
+        self.server = config.get("GREW_SERVER") or self.server
+        self.pool_size = config.get("GREW_POOL_SIZE", self.pool_size)
+        self.connect_timeout = config.get("GREW_CONNECT_TIMEOUT", self.connect_timeout)
+        self.read_timeout = config.get("GREW_READ_TIMEOUT", self.read_timeout)
+        self.timeouts = dict(config.get("GREW_TIMEOUTS", self.timeouts))
+        self.max_retries = config.get("GREW_MAX_RETRIES", self.max_retries)
+        self.retry_backoff = config.get("GREW_RETRY_BACKOFF", self.retry_backoff)
+        self.cache_enabled = config.get("GREW_CACHE_ENABLED", self.cache_enabled)
+        self.cache_timeout = config.get("GREW_CACHE_TIMEOUT", self.cache_timeout)
+        self.tagset_cache_timeout = config.get("GREW_TAGSET_CACHE_TIMEOUT", self.tagset_cache_timeout)
+        self.samples_fetch_workers = config.get("GREW_SAMPLES_FETCH_WORKERS", self.samples_fetch_workers)
+        self.samples_save_workers = config.get("GREW_SAMPLES_SAVE_WORKERS", self.samples_save_workers)
+        self.slow_call_threshold = config.get("GREW_SLOW_CALL_THRESHOLD", self.slow_call_threshold)
+        self.breaker_failure_threshold = config.get("GREW_BREAKER_FAILURE_THRESHOLD", self.breaker_failure_threshold)
+        self.breaker_reset_timeout = config.get("GREW_BREAKER_RESET_TIMEOUT", self.breaker_reset_timeout)
+        self.breaker_alert_interval = config.get("GREW_BREAKER_ALERT_INTERVAL", self.breaker_alert_interval)
+
+    def get_timeout(self, fct_name):
+        """Get the (connect, read) timeout of a grew function
+
+        Args:
+            fct_name (str)
+
+        Returns:
+            (float, float)
+        """
+        timeout = self.timeouts.get(fct_name, self.read_timeout)
+        if isinstance(timeout, (tuple, list)):
+            return tuple(timeout)
+        return (self.connect_timeout, timeout)
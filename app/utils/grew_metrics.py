@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from app import grew_config
+from app.utils.logging_utils import logger
+
+# upper bounds (in seconds) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class GrewCall:
+    """Measures of a single grew call, filled by the request functions"""
+    def __init__(self, fct_name: str):
+        self.fct_name = fct_name
+        self.request_bytes = 0
+        self.response_bytes = 0
+        # stays FAILED when the call ends with a transport error or an html error page
+        self.status = "FAILED"
+
+
+class _EndpointMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = defaultdict(int)
+
+    def add(self, call: GrewCall, duration: float):
+        self.calls += 1
+        self.latency_sum += duration
+        self.latency_max = max(self.latency_max, duration)
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.request_bytes += call.request_bytes
+        self.response_bytes += call.response_bytes
+        self.statuses[call.status] += 1
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["inf"]
+        return {
+            "calls": self.calls,
+            "latency": {
+                "sum": round(self.latency_sum, 6),
+                "mean": round(self.latency_sum / self.calls, 6) if self.calls else 0,
+                "max": round(self.latency_max, 6),
+                "buckets": dict(zip(bounds, self.latency_buckets)),
+            },
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "statuses": dict(self.statuses),
+        }
+
+
+class GrewMetrics:
+    """
+        Latency histogram, payload sizes and reply statuses of the grew calls by grew function.
+        The measures are kept in the memory of each worker process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(_EndpointMetrics)
+
+    @contextmanager
+    def track(self, fct_name: str):
+        """Measure the grew call run in the with block
+
+            with grew_metrics.track("getConll") as call:
+                call.response_bytes = ...
+
+        Args:
+            fct_name (str)
+
+        Yields:
+            GrewCall
+        """
+        call = GrewCall(fct_name)
+        begin = time.perf_counter()
+        try:
+            yield call
+        finally:
+            self.record(call, time.perf_counter() - begin)
+
+    def record(self, call: GrewCall, duration: float):
+        """Add a finished call to the metrics, calls slower than grew_config.slow_call_threshold are logged
+
+        Args:
+            call (GrewCall)
+            duration (float): in seconds
+        """
+        with self._lock:
+            self._endpoints[call.fct_name].add(call, duration)
+        if grew_config.slow_call_threshold and duration >= grew_config.slow_call_threshold:
+            logger.warning("Slow grew call {} : {:.3f} s, status {}, {} bytes sent, {} bytes received".format(
+                call.fct_name, duration, call.status, call.request_bytes, call.response_bytes
+            ))
+
+    def snapshot(self):
+        """Metrics of the current worker process
+
+        Returns:
+            {"pid": int, "endpoints": {fct_name: {...}}}
+        """
+        with self._lock:
+            endpoints = {fct_name: metrics.to_dict() for fct_name, metrics in self._endpoints.items()}
+        return {"pid": os.getpid(), "endpoints": endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def body_size(body) -> int:
+    """Size in bytes of a prepared request body"""
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # streamed body (MultipartStream), counted while it is sent
+    return getattr(body, "sent_bytes", 0)
+
+
+grew_metrics = GrewMetrics()
@@ -0,0 +1,75 @@
+import logging
+
+import pytest
+
+from app import grew_config
+from app.utils.grew_metrics import GrewCall, GrewMetrics
+
+
+@pytest.fixture(autouse=True)
+def restore_grew_config():
+    saved = dict(vars(grew_config))
+    yield
+    vars(grew_config).update(saved)
+
+
+def make_call(fct_name, status="OK", request_bytes=10, response_bytes=100):
+    call = GrewCall(fct_name)
+    call.status = status
+    call.request_bytes = request_bytes
+    call.response_bytes = response_bytes
+    return call
+
+
+def test_calls_are_aggregated_by_grew_function():
+    grew_metrics = GrewMetrics()
+    grew_metrics.record(make_call("getConll"), 0.02)
+    grew_metrics.record(make_call("getConll", status="ERROR"), 0.3)
+    grew_metrics.record(make_call("getProjects"), 400)
+
+    endpoints = grew_metrics.snapshot()["endpoints"]
+    get_conll = endpoints["getConll"]
+    assert get_conll["calls"] == 2
+    assert get_conll["request_bytes"] == 20
+    assert get_conll["response_bytes"] == 200
+    assert get_conll["statuses"] == {"OK": 1, "ERROR": 1}
+    assert get_conll["latency"]["max"] == 0.3
+    assert get_conll["latency"]["buckets"]["0.025"] == 1
+    assert get_conll["latency"]["buckets"]["0.5"] == 1
+    assert endpoints["getProjects"]["latency"]["buckets"]["inf"] == 1
+
+
+def test_failed_calls_are_counted():
+    grew_metrics = GrewMetrics()
+    with pytest.raises(ConnectionError):
+        with grew_metrics.track("saveGraph"):
+            raise ConnectionError()
+    assert grew_metrics.snapshot()["endpoints"]["saveGraph"]["statuses"] == {"FAILED": 1}
+
+
+def test_slow_calls_are_logged(caplog):
+    grew_config.slow_call_threshold = 1
+    grew_metrics = GrewMetrics()
+    with caplog.at_level(logging.WARNING, logger="arborator_app"):
+        grew_metrics.record(make_call("getConll"), 0.5)
+        grew_metrics.record(make_call("searchRequestInGraphs"), 2)
+    assert len(caplog.records) == 1
+    assert "searchRequestInGraphs" in caplog.records[0].getMessage()
+
+
+def test_grew_requests_are_measured():
+    from app.test.fake_grew import FakeGrewServer
+    from app.utils.grew_utils import GrewService, grew_metrics, grew_request
+
+    grew_metrics.reset()
+    corpus = {"project": {"sample": {"s1": {"user": "# sent_id = s1\n1\tmot\t_\t_\t_\t_\t0\troot\t_\t_"}}}}
+    with FakeGrewServer(corpus=corpus) as server:
+        grew_config.server = server.url
+        grew_request("getSamples", data={"project_id": "project"})
+        GrewService.get_sample_trees("project", "sample")
+
+    endpoints = grew_metrics.snapshot()["endpoints"]
+    assert endpoints["getSamples"]["statuses"] == {"OK": 1}
+    assert endpoints["getConll"]["calls"] == 1
+    assert endpoints["getConll"]["request_bytes"] > 0
+    assert endpoints["getConll"]["response_bytes"] > 0
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import grew_config
+
+# cheap idempotent reads, safe to send again when the first attempt fails
+RETRYABLE_FUNCTIONS = {
+    "getConll",
+    "getSamples",
+    "getProjects",
+    "getUserProjects",
+    "getProjectConfig",
+    "getPOS",
+    "getRelations",
+    "getFeatures",
+}
+RETRYABLE_STATUSES = {502, 503, 504}
+# size of the pieces of a streamed request body
+STREAM_BODY_CHUNK_SIZE = 64 * 1024
+
+
+class GrewTransport:
+    """
+        Keep-alive connection pool to the grew server. uwsgi forks the workers after
+        the app is imported so the session is (re)built lazily in every process
+        instead of sharing the sockets of the master process
+    """
+    def __init__(self):
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """Get the pooled session of the current worker process
+
+        Returns:
+            requests.Session
+        """
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    @staticmethod
+    def _build_session() -> requests.Session:
+        session = requests.Session()
+        # retries are handled in post() since only some grew functions can be replayed
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=grew_config.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        """Close the pooled connections of the current process"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+    def post(self, fct_name, data=None, files=None, stream=False, headers=None) -> requests.Response:
+        """Send a request to the grew server through the pooled session
+
+        Args:
+            fct_name (str)
+            data (dict | MultipartStream, optional)
+            files (dict, optional)
+            stream (bool, optional): don't read the body, it is consumed with response.iter_content()
+            headers (dict, optional)
+
+        Raises:
+            requests.ConnectionError | requests.Timeout: when the last attempt failed
+
+        Returns:
+            requests.Response
+        """
+        url = "%s/%s" % (grew_config.server, fct_name)
+        timeout = grew_config.get_timeout(fct_name)
+        attempts = 1 + (grew_config.max_retries if fct_name in RETRYABLE_FUNCTIONS else 0)
+
+        for attempt in range(attempts):
+            is_last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.post(url, data=data, files=files, timeout=timeout, stream=stream, headers=headers)
+            except (requests.ConnectionError, requests.Timeout):
+                if is_last_attempt:
+                    raise
+            else:
+                if is_last_attempt or response.status_code not in RETRYABLE_STATUSES:
+                    return response
+                response.close()
+            time.sleep(grew_config.retry_backoff * (2 ** attempt))
+
+
+class MultipartStream:
+    """
+        multipart/form-data body whose files are iterables of str or bytes, read while the request is sent
+        (chunked transfer encoding) so a generated file is never held in memory. It can be sent once.
+    """
+    def __init__(self, data: Dict[str, str], files: Dict[str, Iterable[Union[str, bytes]]]):
+        self.data = data
+        self.files = files
+        self.boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary={}".format(self.boundary)
+        self.sent_bytes = 0
+
+    def __iter__(self):
+        for chunk in self._iter_chunks():
+            self.sent_bytes += len(chunk)
+            yield chunk
+
+    def _iter_chunks(self):
+        for name, value in self.data.items():
+            yield self._part_header('name="{}"'.format(name)) + str(value).encode("utf-8") + b"\r\n"
+        for name, content in self.files.items():
+            yield self._part_header('name="{0}"; filename="{0}"'.format(name))
+            buffer = []
+            buffered = 0
+            for piece in content:
+                if isinstance(piece, str):
+                    piece = piece.encode("utf-8")
+                buffer.append(piece)
+                buffered += len(piece)
+                if buffered >= STREAM_BODY_CHUNK_SIZE:
+                    yield b"".join(buffer)
+                    buffer = []
+                    buffered = 0
+            yield b"".join(buffer) + b"\r\n"
+        yield "--{}--\r\n".format(self.boundary).encode("utf-8")
+
+    def _part_header(self, disposition: str) -> bytes:
+        return "--{}\r\nContent-Disposition: form-data; {}\r\n\r\n".format(self.boundary, disposition).encode("utf-8")
+
+
+grew_transport = GrewTransport()
@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from app import grew_config
+from app.test.fake_grew import FakeGrewServer
+from app.utils.grew_transport import GrewTransport
+
+
+@pytest.fixture(autouse=True)
+def restore_grew_config():
+    saved = dict(vars(grew_config))
+    yield
+    vars(grew_config).update(saved)
+
+
+def make_response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    return response
+
+
+def test_get_timeout():
+    grew_config.load_options({
+        "GREW_CONNECT_TIMEOUT": 2,
+        "GREW_READ_TIMEOUT": 30,
+        "GREW_TIMEOUTS": {"searchRequestInGraphs": 300, "saveConll": (5, 120)},
+    })
+    assert grew_config.get_timeout("getConll") == (2, 30)
+    assert grew_config.get_timeout("searchRequestInGraphs") == (2, 300)
+    assert grew_config.get_timeout("saveConll") == (5, 120)
+
+
+def test_session_is_reused():
+    transport = GrewTransport()
+    with FakeGrewServer(corpus={"project": {}}) as server:
+        grew_config.server = server.url
+        for _ in range(5):
+            assert transport.post("getProjects").json()["data"][0]["name"] == "project"
+        pools = transport.session.get_adapter(server.url).poolmanager.pools
+        pool = pools[next(iter(pools.keys()))]
+        assert pool.num_connections == 1
+        assert pool.num_requests == 5
+    transport.close()
+
+
+def test_read_calls_are_retried():
+    grew_config.load_options({"GREW_MAX_RETRIES": 2, "GREW_RETRY_BACKOFF": 0})
+    transport = GrewTransport()
+    with patch.object(requests.Session, "post", side_effect=[requests.ConnectionError(), make_response(503), make_response(200)]) as post:
+        assert transport.post("getConll").status_code == 200
+        assert post.call_count == 3
+
+
+def test_write_calls_are_not_retried():
+    grew_config.load_options({"GREW_MAX_RETRIES": 2, "GREW_RETRY_BACKOFF": 0})
+    transport = GrewTransport()
+    with patch.object(requests.Session, "post", side_effect=requests.ConnectionError()) as post:
+        with pytest.raises(requests.ConnectionError):
+            transport.post("saveGraph")
+        assert post.call_count == 1
@@ -1,64 +1,201 @@
+import base64
+import functools
+import hashlib
+import itertools
 import json
-from typing import Dict, List, TypedDict
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, TypedDict
 import re
-import io
-import time
-import zipfile
 from bs4 import BeautifulSoup
 
 import requests
-from flask import abort
+from flask import Response, abort, stream_with_context
 from flask_login import current_user
 import werkzeug
-from app import grew_config
-from app.user.service import EmailService
+from app import cache, grew_config
+from app.utils.concurrency import SingleFlight, imap_in_threads, map_in_threads
+from app.utils.grew_cache import MUTATING_FUNCTIONS, grew_cache
+from app.config import Config
+from app.utils.export_archive import ExportFormat, MemberContent, iter_archive
+from app.utils.export_cache import export_cache
+from app.utils.grew_circuit_breaker import CircuitOpenError, grew_circuit_breaker
+from app.utils.grew_metrics import body_size, grew_metrics
+from app.utils.grew_transport import MultipartStream, grew_transport
+from app.utils.json_stream import JsonStreamError, iter_json_object
+from app.utils.search_cache import CachedSearch, search_cache
 
 from conllup.conllup import sentenceConllToJson
 from conllup.processing import constructTextFromTreeJson
 
+# size of the socket reads when a grew reply is decoded on the fly
+STREAM_CHUNK_SIZE = 64 * 1024
+# metadata removed from the exported trees
+EXPORT_STRIPPED_METADATA = ("user_id", "timestamp", "validated_by")
+re_timestamp_value = re.compile(r"\d+(?:\.\d+)?")
+
+# read only grew functions, identical calls running at the same time in a worker share one request. Only
+# the threads of a process are coalesced: uwsgi (arborator-backend.ini) runs single threaded processes, so
+# two requests never share their calls, only the calls made by the thread pools of imap_in_threads can
+COALESCED_FUNCTIONS = {
+    "getConll",
+    "getSamples",
+    "getProjects",
+    "getUserProjects",
+    "getProjectConfig",
+    "getPOS",
+    "getRelations",
+    "getFeatures",
+}
+grew_single_flight = SingleFlight()
+
+
+def _send_grew_request(fct_name, data, files, stream=False) -> requests.Response:
+    """Post the grew request and abort on transport errors, the cache of the touched project is invalidated.
+    While the grew server is down the circuit breaker makes the request fail fast with 503"""
+    try:
+        grew_circuit_breaker.before_call()
+    except CircuitOpenError as e:
+        abort(503, {"message": "<Grew requests handler> : {}".format(e)})
 
-def grew_request(fct_name, data={}, files={}):
-    """Send grew request
-
-    Args:
-        fct_name (str)
-        data (dict, optional)
-        files (dict, optional)
-
-    Returns:
-        grew_response ({"status": "", "data": ..., "messages": ... })
-    """
     try:
-        response = requests.post("%s/%s" % (grew_config.server, fct_name), files=files, data=data)
+        if any(not hasattr(content, "read") for content in files.values()):
+            # generated files are streamed, see GrewService.save_sample
+            body = MultipartStream(data, files)
+            response = grew_transport.post(fct_name, data=body, stream=stream, headers={"Content-Type": body.content_type})
+        else:
+            response = grew_transport.post(fct_name, data=data, files=files, stream=stream)
+
+    except requests.Timeout:
+        error_message = "<Grew requests handler> : Timeout on {}".format(fct_name)
+        print(error_message)
+        grew_circuit_breaker.record_failure(error_message)
+        abort(504, {"message": error_message})
 
     except requests.ConnectionError:
         error_message = "<Grew requests handler> : Connection refused"
         print(error_message)
+        grew_circuit_breaker.record_failure(error_message)
         abort(500, {"message": error_message})
     
     except Exception as e:
         error_message = ("Grew requests handler> : Uncaught exception, please report {}".format(e))
         print(error_message)
+        grew_circuit_breaker.record_failure(error_message)
         abort(500, {"message": error_message})
-    try: 
-        response = json.loads(response.text)
-        if response.get("status") == "ERROR":
-            error_message = response.get("message")
-            print("GREW-ERROR : {}".format(error_message) )
-            abort(406, "GREW-ERROR : {}".format(error_message))
-            
-        elif response.get("status") == "WARNING":
-            warning_message = response.get("message")
-            print("Grew-Warning: {}".format(warning_message))    
-        return response
-    
-    except Exception as e:
-        if isinstance(e, werkzeug.exceptions.NotAcceptable): # to fix the problem of abort inside try-except block
-            raise
-        parsed_error_msg = BeautifulSoup(response.text, features="lxml").find('p').contents[0]
-        EmailService.send_alert_email('Grew server error', str(parsed_error_msg))
-        abort(500, str(parsed_error_msg))
+
+    if response.status_code >= 500:
+        grew_circuit_breaker.record_failure("<Grew requests handler> : {} replied {}".format(fct_name, response.status_code))
+    else:
+        grew_circuit_breaker.record_success()
+
+    grew_cache.invalidate(fct_name, data)
+    if fct_name in MUTATING_FUNCTIONS:
+        grew_single_flight.forget()
+    return response
+
+
+def _check_grew_status(response):
+    if response.get("status") == "ERROR":
+        error_message = response.get("message")
+        print("GREW-ERROR : {}".format(error_message) )
+        abort(406, "GREW-ERROR : {}".format(error_message))
         
+    elif response.get("status") == "WARNING":
+        warning_message = response.get("message")
+        print("Grew-Warning: {}".format(warning_message))    
+
+
+def _abort_grew_server_error(response_text):
+    parsed_error_msg = BeautifulSoup(response_text, features="lxml").find('p').contents[0]
+    grew_circuit_breaker.alert(str(parsed_error_msg))
+    abort(500, str(parsed_error_msg))
+
+
+def grew_request(fct_name, data={}, files={}):
+    """Send grew request, a read identical to one already in flight in the process waits for its reply
+    (the threads of imap_in_threads, the uwsgi workers do not share their calls)
+
+    Args:
+        fct_name (str)
+        data (dict, optional)
+        files (dict, optional)
+
+    Returns:
+        grew_response ({"status": "", "data": ..., "messages": ... })
+    """
+    if fct_name in COALESCED_FUNCTIONS and not files:
+        return grew_single_flight.do(fct_name, data, lambda: _grew_request(fct_name, data, files))
+    return _grew_request(fct_name, data, files)
+
+
+def _grew_request(fct_name, data, files):
+    with grew_metrics.track(fct_name) as call:
+        response = _send_grew_request(fct_name, data, files)
+        call.request_bytes = body_size(response.request.body)
+        call.response_bytes = len(response.content)
+        try: 
+            reply = json.loads(response.text)
+            call.status = reply.get("status")
+            _check_grew_status(reply)
+            return reply
+        
+        except Exception as e:
+            if isinstance(e, werkzeug.exceptions.NotAcceptable): # to fix the problem of abort inside try-except block
+                raise
+            call.status = "FAILED"
+            _abort_grew_server_error(response.text)
+
+
+def grew_request_stream(fct_name, data={}, files={}):
+    """Send grew request and decode the data of the reply while it is received, for the big
+    replies (getConll, searchRequestInGraphs, tryPackage) the full text is never held in memory
+
+    Args:
+        fct_name (str)
+        data (dict, optional)
+        files (dict, optional)
+
+    Yields:
+        the elements of the reply data if it is a list, (key, value) pairs if it is a dict
+    """
+    with grew_metrics.track(fct_name) as call:
+        response = _send_grew_request(fct_name, data, files, stream=True)
+        call.request_bytes = body_size(response.request.body)
+        with response:
+            chunks = _count_bytes(response.iter_content(STREAM_CHUNK_SIZE), call)
+            first_chunk = next(chunks, b"")
+            if not first_chunk.lstrip().startswith(b"{"):
+                # not a json reply, the grew server answered with an html error page
+                _abort_grew_server_error(first_chunk + b"".join(chunks))
+
+            header = {}
+            try:
+                yield from iter_json_object(itertools.chain([first_chunk], chunks), "data", header)
+            except (JsonStreamError, json.JSONDecodeError, requests.RequestException) as e:
+                error_message = "<Grew requests handler> : Invalid reply of {}: {}".format(fct_name, e)
+                print(error_message)
+                abort(500, {"message": error_message})
+            call.status = header.get("status")
+            _check_grew_status(header)
+
+
+def _count_bytes(chunks, call):
+    for chunk in chunks:
+        call.response_bytes += len(chunk)
+        yield chunk
+
+
+def cached_grew_request(fct_name, data={}):
+    """Same as grew_request but the replies of read only functions are served from the grew cache
+
+    Args:
+        fct_name (str)
+        data (dict, optional)
+
+    Returns:
+        grew_response ({"status": "", "data": ..., "messages": ... })
+    """
+    return grew_cache.fetch(fct_name, data, lambda: grew_request(fct_name, data=data))
+
 
 class GrewProjectInterface(TypedDict):
     name: str
@@ -81,13 +218,31 @@ class GrewService:
         Returns:
             Dict[str, Dict[str, str]]
         """
-        response = grew_request(
+        # same reply format as grew_request so that both can join the same getConll flight
+        response = grew_single_flight.do(
             "getConll",
-            data={"project_id": project_name, "sample_id": sample_name},
+            {"project_id": project_name, "sample_id": sample_name},
+            lambda: {"status": "OK", "data": dict(GrewService.iter_sample_trees(project_name, sample_name))},
         )
         grew_sample_trees: Dict[str, Dict[str, str]] = response.get("data", {})
         return grew_sample_trees
 
+    @staticmethod
+    def iter_sample_trees(project_name, sample_name):
+        """Get sample trees sentence by sentence while the getConll reply is received
+
+        Args:
+            project_name (str)
+            sample_name (str)
+
+        Yields:
+            (sent_id, {"user_id": "conll"})
+        """
+        return grew_request_stream(
+            "getConll",
+            data={"project_id": project_name, "sample_id": sample_name},
+        )
+
     @staticmethod
     def get_projects():
         """Get list of projects stored in grew server
@@ -95,9 +250,21 @@ class GrewService:
         Returns:
             grew_projects(List(GrewProjectInterface))
         """
-        reply = grew_request("getProjects")
+        reply = cached_grew_request("getProjects")
         grew_projects: List[GrewProjectInterface] = reply.get("data", [])
         return grew_projects
+
+    @staticmethod
+    def get_project(project_name: str):
+        """Get a single project from the (cached) list of grew projects
+
+        Args:
+            project_name (str)
+
+        Returns:
+            grew_project (GrewProjectInterface | None)
+        """
+        return next((project for project in GrewService.get_projects() if project["name"] == project_name), None)
     
     @staticmethod
     def get_user_projects(username):
@@ -158,7 +325,7 @@ class GrewService:
         Returns:
             conll_schema ({"annotationFeatures":  json dict})
         """
-        grew_reply = grew_request("getProjectConfig", data={"project_id": project_id})
+        grew_reply = cached_grew_request("getProjectConfig", data={"project_id": project_id})
         
         data = grew_reply.get("data")
         if data:
@@ -197,7 +364,7 @@ class GrewService:
         Returns:
             grew_samples (List[grew_sample])
         """
-        reply = grew_request(
+        reply = cached_grew_request(
             "getSamples", data={"project_id": project_id}
         )
         grew_samples = reply.get("data", [])
@@ -226,7 +393,7 @@ class GrewService:
         Args:
             project_id (str)
             sample_id (str)
-            conll_file (File)
+            conll_file (File | Iterable[str]): a file, or the lines of a generated conll which are streamed to grew
         """
         grew_request(
             "saveConll",
@@ -234,6 +401,49 @@ class GrewService:
             files={"conll_file": conll_file},
         )
 
+    @staticmethod
+    def get_modified_graphs(sample_trees) -> List[Tuple[str, str]]:
+        """Graphs changed by a rule in the rewrite results of a sample: the users of a tree with modified nodes
+        or edges in its packages (every user of the tree when the packages are not sent)
+
+        Args:
+            sample_trees ({sent_id: {"conlls": {user_id: conll}, "packages": {user_id: {"modified_nodes", "modified_edges"}}}})
+
+        Returns:
+            List[(user_id, conll)]
+        """
+        graphs = []
+        for tree in sample_trees.values():
+            packages = tree.get("packages")
+            for user_id, conll in tree["conlls"].items():
+                if packages is None or packages.get(user_id, {}).get("modified_nodes") or packages.get(user_id, {}).get("modified_edges"):
+                    graphs.append((user_id, conll))
+        return graphs
+
+    @staticmethod
+    def save_rule_results(project_id: str, samples: Iterable[Tuple[str, dict]], max_workers: int = 1) -> Iterator[Tuple[str, List[str]]]:
+        """Save the graphs changed by a rule, in a single saveConll per sample which only holds them (grew replaces
+        the graphs of the same sent_id and user and keeps the others). The samples are saved while the next ones
+        are read, with at most max_workers grew calls in flight
+
+        Args:
+            project_id (str)
+            samples (Iterable[(sample_name, sample_trees)]): see get_modified_graphs
+            max_workers (int, optional)
+
+        Yields:
+            (sample_name, List[user_id]): the users of the saved graphs
+        """
+        def save(sample):
+            sample_name, sample_trees = sample
+            graphs = GrewService.get_modified_graphs(sample_trees)
+            if graphs:
+                conll_lines = (conll.rstrip("\n") + "\n\n" for _, conll in graphs)
+                GrewService.save_sample(project_id, sample_name, conll_lines)
+            return sample_name, [user_id for user_id, _ in graphs]
+
+        return imap_in_threads(save, samples, max_workers)
+
     @staticmethod
     def delete_samples(project_id: str, sample_ids: List[str]) -> None:
         """delete sample of specific project
@@ -258,8 +468,8 @@ class GrewService:
             user_type (str)
             other_user (str)
 
-        Returns:
-            grew_search results ("sent_id": {
+        Yields:
+            grew_search results, decoded one by one from the reply ({
                 'sample_id':…,
                 'sent_id':…,
                 'conll':…,
@@ -275,8 +485,7 @@ class GrewService:
             "user_ids": json.dumps(user_ids),
             "sample_ids": json.dumps(sample_ids)
         }
-        reply = grew_request("searchRequestInGraphs", data=data)
-        return reply
+        return grew_request_stream("searchRequestInGraphs", data=data)
 
     @staticmethod
     def try_package(project_id: str, package: str, sample_ids: List[str], user_type: str, other_user: str):
@@ -289,6 +498,8 @@ class GrewService:
             user_type (str)
             other_user (str)
 
+        Yields:
+            try package results, decoded one by one from the reply
         """
         user_ids = GrewService.get_user_ids(user_type, other_user)
         data = {
@@ -297,8 +508,7 @@ class GrewService:
             "user_ids": json.dumps(user_ids),
             "sample_ids": json.dumps(sample_ids)
         }
-        reply = grew_request("tryPackage", data=data)
-        return reply
+        return grew_request_stream("tryPackage", data=data)
     
     @staticmethod
     def get_relation_table(project_id: str, sample_ids, user_type, other_user):
@@ -421,172 +631,472 @@ class GrewService:
         grew_request("eraseSentence", data=data)
         
     @staticmethod
-    def extract_tagset(project_id, sample_ids, grew_funct):
-        """Extract configuration tags based on conll 
+    def get_config_from_samples(project_name, sample_ids):
+        """Get all tags sets from list pf samples
+
         Args:
-            project_id (str)
-            sample_ids (List[str])
-            grew_funct (str): getPos | getRelations | getFeatures
+            project_name (str)
+            sample_ids (str)
 
         Returns:
-            _type_
+            post_list (List[str]), relation_list (List[str]), feat_list (List[str]), misc_list (List[str])
         """
-        data = {
-            "project_id": project_id,
-            "sample_ids": json.dumps(sample_ids)
-        }
-        response = grew_request(grew_funct, data=data)
-        return response["data"]
-    
+        tagsets = TagsetService.get_tagsets(project_name, sample_ids)
+        return tagsets["pos"], tagsets["relations"], tagsets["feats"], tagsets["misc"]
+
     @staticmethod
-    def get_config_from_samples(project_name, sample_ids):
-        """Get all tags sets from list pf samples
+    def get_samples_conll(project_name: str, sample_names: List[str], max_workers: int = 1):
+        """Get the getConll replies of several samples, in the order of sample_names
 
         Args:
             project_name (str)
-            sample_ids (str)
+            sample_names (List[str])
+            max_workers (int, optional): maximum number of getConll requests sent in parallel
 
         Returns:
-            post_list (List[str]), relation_list (List[str]), feat_list (List[str]), misc_list (List[str])
+            Iterator[grew_response]
+        """
+        def get_sample_conll(sample_name):
+            return {"status": "OK", "data": GrewService.get_sample_trees(project_name, sample_name)}
+        return imap_in_threads(get_sample_conll, sample_names, max_workers)
+
+    @staticmethod
+    def get_sample_content(sample_data) -> Dict[str, str]:
+        """Build the content of a sample by user (plus the most recent trees under 'last')
+
+        Args:
+            sample_data ({"sent_id_1":{"user_1":"conllstring"}})
+
+        Returns:
+            sample_content {'user_id': content_string }
         """
-        pos_list = GrewService.extract_tagset(project_name, sample_ids, "getPOS")
-        relation_list = GrewService.extract_tagset(project_name, sample_ids, "getRelations")
-        features = GrewService.extract_tagset(project_name, sample_ids, "getFeatures") 
-        feat_list = features['FEATS']
-        misc_list = features['MISC']
-        return pos_list, relation_list, feat_list, misc_list
+        sample_content: Dict[str, List[str]] = {}
+        last_trees = []
+        for trees in SampleExportService.read_sample_trees(sample_data):
+            for user_id, tree in trees.items():
+                sample_content.setdefault(user_id, []).append(tree.stripped)
+            if trees:
+                last_trees.append(trees[SampleExportService.get_last_user(trees)].stripped)
+
+        # gluing back the trees
+        sample_content = {user_id: "".join(conlls) for user_id, conlls in sample_content.items()}
+        sample_content["last"] = "".join(last_trees)
+        return sample_content
 
     @staticmethod
-    def get_samples_with_string_contents(project_name: str, sample_names: List[str]):
+    def get_samples_with_string_contents(project_name: str, sample_names: List[str], max_workers: int = 1):
         """Get string content od samples based on each user 
 
         Args:
             project_name (str)
             sample_names (List[str])
+            max_workers (int, optional): maximum number of samples fetched in parallel
 
         Returns:
             samples_names (List[str]), sample_content_files [{'user_id': content_string }] 
         """
         sample_content_files = list()
-        for sample_name in sample_names:
-            reply = grew_request(
-                "getConll",
-                data={"project_id": project_name, "sample_id": sample_name},
-            )
+        for reply in GrewService.get_samples_conll(project_name, sample_names, max_workers):
             if reply.get("status") == "OK":
-                # {"sent_id_1":{"conlls":{"user_1":"conllstring"}}}
-                sample_tree = SampleExportService.serve_sample_trees(reply.get("data", {}))
-                sample_tree_nots_noui = SampleExportService.serve_sample_trees(reply.get("data", {}), timestamps=False, user_ids=False, validated_by=False)
-                sample_content = SampleExportService.sample_tree_to_content_file(sample_tree_nots_noui)
-                for sent_id in sample_tree:
-                    last = SampleExportService.get_last_user(
-                        sample_tree[sent_id]["conlls"]
-                    )
-                    sample_content["last"] = sample_content.get("last", []) + [
-                        sample_tree_nots_noui[sent_id]["conlls"][last]
-                    ]
-
-                # gluing back the trees
-                sample_content["last"] = "".join(sample_content.get("last", ""))
-                sample_content_files.append(sample_content)
-
+                sample_content_files.append(GrewService.get_sample_content(reply.get("data", {})))
             else:
                 print("Error: {}".format(reply.get("message")))
         return sample_names, sample_content_files
     
     @staticmethod
-    def get_samples_with_string_contents_as_dict(project_name: str, sample_names: List[str], user: str) -> Dict[str, str]:
+    def get_samples_with_string_contents_as_dict(project_name: str, sample_names: List[str], user: str, max_workers: int = 1) -> Dict[str, str]:
         """Same as previous function but just for specific user
 
         Args:
             project_name (str)
             sample_names (List[str])
             user (str)
+            max_workers (int, optional): maximum number of samples fetched in parallel
 
         Returns:
             Dict[str, str]
         """
         samples_dict_for_user: Dict[str, str] = {}
-        for sample_name in sample_names:
-            reply = grew_request(
-                "getConll",
-                data={"project_id": project_name, "sample_id": sample_name},
-            )
+        replies = GrewService.get_samples_conll(project_name, sample_names, max_workers)
+        for sample_name, reply in zip(sample_names, replies):
             if reply.get("status") == "OK":
-
-                # {"sent_id_1":{"conlls":{"user_1":"conllstring"}}}
-                sample_tree = SampleExportService.serve_sample_trees(reply.get("data", {}))
-                sample_tree_nots_noui = SampleExportService.serve_sample_trees(reply.get("data", {}), timestamps=False, user_ids=False, validated_by=False)
-                sample_content = SampleExportService.sample_tree_to_content_file(sample_tree_nots_noui)
-                for sent_id in sample_tree:
-                    last = SampleExportService.get_last_user(
-                        sample_tree[sent_id]["conlls"]
-                    )
-                    sample_content["last"] = sample_content.get("last", []) + [
-                        sample_tree_nots_noui[sent_id]["conlls"][last]
-                    ]
-
-                # gluing back the trees
-                sample_content["last"] = "".join(sample_content.get("last", ""))
-                samples_dict_for_user[sample_name] =sample_content.get(user, "")
-
+                sample_content = GrewService.get_sample_content(reply.get("data", {}))
+                samples_dict_for_user[sample_name] = sample_content.get(user, "")
             else:
                 print("Error: {}".format(reply.get("message")))
         return samples_dict_for_user
-    
-    @staticmethod
-    def format_trees_new(m, trees, is_package: bool = False):
+
+
+class SearchResultsBuilder:
+    """
+        Results of a grew search (or of a try package) as they are sent to the front:
+        {sample_name: {sent_id: {"sentence": text, "sent_id": sent_id, "conlls": {user_id: conll},
+        "matches": {user_id: [{"nodes", "edges"}]} (or "packages": {user_id: {"modified_nodes", "modified_edges"}})}}}
+
+        The text of a sentence is read from its `# text` metadata, the tree is only parsed when there is none,
+        and the matches are appended in place.
+
+    Args:
+        is_package (bool, optional): try package results
+    """
+    def __init__(self, is_package: bool = False):
+        self.is_package = is_package
+        self.trees = {}
+
+    def add(self, result) -> dict:
+        """Add a grew result (a match in a tree of a user)
+
+        Args:
+            result (grew_search_result)
+
+        Returns:
+            dict: the result of its sentence
         """
-            m is the query result from grew
-            list of trees
-            returns something like {'WAZL_15_MC-Abi_MG': {'WAZL_15_MC-Abi_MG__8': {'sentence': '# kalapotedly < you see < # ehn ...', 'conlls': {'kimgerdes': ...
+        sample_trees = self.trees.setdefault(result["sample_id"], {})
+        sentence = sample_trees.get(result["sent_id"])
+        if sentence is None:
+            sentence = sample_trees[result["sent_id"]] = self.new_sentence(result)
+        self.add_to_sentence(sentence, result)
+        return sentence
+
+    def build(self, results: Iterable[dict]) -> dict:
+        """Add every result
+
+        Args:
+            results (Iterable[grew_search_result])
+
+        Returns:
+            {sample_name: {sent_id: sentence_result}}
         """
+        for result in results:
+            self.add(result)
+        return self.trees
 
-        user_id = m["user_id"]
-        sample_name = m["sample_id"]
-        sent_id = m["sent_id"]
-        conll = m["conll"]
+    def iter_sentences(self, results: Iterable[dict], offset: int = 0, page_size: int = None, counts: Dict[str, int] = None) -> Iterator[Tuple[str, str, dict]]:
+        """Build the sentences of a page of results, in the order of their first match. Grew sends the matches
+        grouped by sentence, so a sentence is yielded as soon as the matches of the next one start. Only the
+        sentences of the page are built and kept, the others are only counted.
 
-        if is_package == False:
-            nodes = m["nodes"]
-            edges = m["edges"]
-        else:
-            modified_nodes = m["modified_nodes"]
-            modified_edges = m["modified_edges"]
-
-        if sample_name not in trees:
-            trees[sample_name] = {}
-
-        if sent_id not in trees[sample_name]:
-            try: 
-                sentence_json = sentenceConllToJson(conll)
-            except Exception as e:
-                abort(400, 'The result of your query can not be processed by ArboratorGrew in sentence `{}` because: {}'.format(sent_id, str(e)))
-
-            
-            trees[sample_name][sent_id] = {
-                "sentence": sentence_json["metaJson"]["text"] if "text" in sentence_json["metaJson"].keys() else constructTextFromTreeJson(sentence_json["treeJson"]),
-                "conlls": {user_id: conll},
-                "sent_id": sent_id,
-            
-            }
-            if is_package == False:
-                trees[sample_name][sent_id]["matches"] = {user_id: [{"edges": edges, "nodes": nodes}]}
-            else:
-                trees[sample_name][sent_id]["packages"] = {user_id: {"modified_edges": modified_edges, "modified_nodes": modified_nodes}}
-        
-        
+        If grew sends more matches of a sentence after another one, they are merged in the same dict and the
+        sentence is yielded again once all the results are read: the consumers keeping the dict only have
+        to keep it once, the ones writing it as it comes write it again.
+
+        Args:
+            results (Iterable[grew_search_result])
+            offset (int, optional): number of sentences skipped
+            page_size (int, optional): maximum number of sentences yielded, all of them by default
+            counts (Dict[str, int], optional): filled with the match_count and sentence_count of all the results,
+                they are complete when the iteration is over
+
+        Yields:
+            (sample_name, sent_id, sentence_result)
+        """
+        end = None if page_size is None else offset + page_size
+
+        def in_page(index):
+            return offset <= index and (end is None or index < end)
+        for _, sample_name, sent_id, sentence in self._iter_merged_sentences(results, in_page, counts):
+            yield sample_name, sent_id, sentence
+
+    def _iter_merged_sentences(self, results: Iterable[dict], is_built: Callable[[int], bool], counts: Dict[str, int] = None,
+                               built: Dict[Tuple[str, str], dict] = None) -> Iterator[Tuple[int, str, str, dict]]:
+        """See iter_sentences
+
+        Args:
+            results (Iterable[grew_search_result])
+            is_built (Callable[[int], bool]): whether the sentence of an index is built, called once by sentence
+                when its first match is read
+            counts (Dict[str, int], optional)
+            built (Dict[(sample_name, sent_id), sentence_result], optional): the sentences being built, the caller
+                can remove the ones it does not need anymore, their next matches are only counted
+
+        Yields:
+            (index, sample_name, sent_id, sentence_result)
+        """
+        if counts is None:
+            counts = {}
+        counts.update(match_count=0, sentence_count=0)
+        # index of every sentence, in the order of their first match
+        indexes: Dict[Tuple[str, str], int] = {}
+        if built is None:
+            built = {}
+        # built sentences yielded before grew sent all their matches
+        updated: Dict[Tuple[str, str], dict] = {}
+        current = None
+        for result in results:
+            counts["match_count"] += 1
+            key = (result["sample_id"], result["sent_id"])
+            if key != current:
+                if current in built and current not in updated:
+                    yield (indexes[current],) + current + (built[current],)
+                current = key
+                index = indexes.get(key)
+                if index is None:
+                    index = indexes[key] = len(indexes)
+                    counts["sentence_count"] = len(indexes)
+                    if is_built(index):
+                        built[key] = self.new_sentence(result)
+                elif key in built:
+                    updated[key] = built[key]
+            sentence = built.get(key)
+            if sentence is not None:
+                self.add_to_sentence(sentence, result)
+        if current in built and current not in updated:
+            yield (indexes[current],) + current + (built[current],)
+        for key, sentence in updated.items():
+            if key in built:
+                yield (indexes[key],) + key + (sentence,)
+
+    def iter_page(self, results: Iterable[dict], offset: int, page_size: int, counts: Dict[str, int], project_id: str = None, query_key: str = None) -> Iterator[Tuple[str, str, dict]]:
+        """Same as iter_sentences, but the results of the query are served from the search cache when
+        the project was not written since they were kept (grew is not called). Else every sentence is built
+        to be kept while they fit in an entry of the cache (SearchCache.max_entry_size), past that only the
+        sentences of the page are built as in iter_sentences
+
+        Args:
+            results (Iterable[grew_search_result]): only read if the query is not in the cache
+            offset (int)
+            page_size (int | None)
+            counts (Dict[str, int])
+            project_id (str, optional): no cache without it
+            query_key (str, optional): see search_query_key
+
+        Yields:
+            (sample_name, sent_id, sentence_result)
+        """
+        if project_id is None or not search_cache.is_active():
+            yield from self.iter_sentences(results, offset, page_size, counts)
+            return
+        end = None if page_size is None else offset + page_size
+        cached = search_cache.get(project_id, query_key)
+        if cached is not None:
+            counts.update(match_count=cached.match_count, sentence_count=len(cached.sentences))
+            yield from itertools.islice(cached.sentences, offset, end)
+            return
+
+        def in_page(index):
+            return offset <= index and (end is None or index < end)
+
+        def is_built(index):
+            return kept is not None or in_page(index)
+
+        version = grew_cache.get_version(project_id)
+        # index: (sample_name, sent_id, sentence_result), the sentences yielded again are already kept
+        kept, sizes, size = {}, {}, 0
+        built = {}
+        for index, sample_name, sent_id, sentence in self._iter_merged_sentences(results, is_built, counts, built):
+            if kept is not None:
+                kept[index] = (sample_name, sent_id, sentence)
+                sentence_size = search_cache.sentence_size(sentence)
+                size += sentence_size - sizes.get(index, 0)
+                sizes[index] = sentence_size
+                if size > search_cache.max_entry_size():
+                    # too big for the cache, the sentences out of the page are not kept anymore
+                    for kept_index, (kept_sample_name, kept_sent_id, _) in kept.items():
+                        if not in_page(kept_index):
+                            built.pop((kept_sample_name, kept_sent_id), None)
+                    kept = sizes = None
+            elif not in_page(index):
+                # built before the results were too big
+                built.pop((sample_name, sent_id), None)
+            if in_page(index):
+                yield sample_name, sent_id, sentence
+        if kept is not None:
+            sentences = [kept[index] for index in sorted(kept)]
+            search_cache.put(project_id, query_key, version, CachedSearch(sentences, counts["match_count"]), size)
+
+    def response(self, results: Iterable[dict], args: dict, query_key: str, project_id: str = None):
+        """Response of the search or try package routes. Without pageSize, cursor or stream in the
+        arguments it is the whole results tree, as it always was.
+
+        With a pageSize (or the cursor of a previous page), the page of results is sent with the counts of all
+        the results and the cursor of the next page (None after the last page):
+        {"trees": {sample_name: {sent_id: sentence_result}}, "match_count", "sentence_count", "result_id", "next_cursor"}
+        (result_id references the results in the search cache, e.g. to export them)
+
+        With stream, the response is NDJSON: a line {"sample_name", "sent_id", "result"} per sentence, written
+        as soon as grew has sent all its matches (the page is not serialized as a whole), the last line has the
+        counts and the next cursor. When grew sends the matches of a sentence out of order, its line is written
+        again with all of them after the other sentences, it replaces the first one.
+
+        Args:
+            results (Iterable[grew_search_result])
+            args (dict): request arguments (pageSize, cursor, stream)
+            query_key (str): see search_query_key, the cursors are only valid for their query
+            project_id (str, optional): the results are kept in the search cache with the version of the project
+
+        Returns:
+            dict | Response
+        """
+        page_size = args.get("pageSize")
+        if page_size is not None and (type(page_size) != int or page_size <= 0):
+            abort(400, "pageSize must be a positive integer")
+        cursor = args.get("cursor")
+        offset = decode_search_cursor(cursor, query_key) if cursor else 0
+        paginated = page_size is not None or cursor or args.get("stream")
+        if not paginated and (project_id is None or not search_cache.is_active()):
+            return self.build(results)
+
+        counts = {}
+        sentences = self.iter_page(results, offset, page_size, counts, project_id, query_key)
+
+        def summary():
+            summary = dict(counts, result_id=query_key, next_cursor=None)
+            if page_size is not None and offset + page_size < counts["sentence_count"]:
+                summary["next_cursor"] = encode_search_cursor(query_key, offset + page_size)
+            return summary
+
+        if not args.get("stream"):
+            trees = {}
+            for sample_name, sent_id, sentence in sentences:
+                trees.setdefault(sample_name, {})[sent_id] = sentence
+            return dict(summary(), trees=trees) if paginated else trees
+
+        def iter_lines():
+            for sample_name, sent_id, sentence in sentences:
+                yield _ndjson_line({"sample_name": sample_name, "sent_id": sent_id, "result": sentence})
+            yield _ndjson_line(summary())
+
+        lines = iter_lines()
+        # built before the response starts, so that a failing grew request still gives an error status
+        first_line = next(lines)
+        return Response(stream_with_context(itertools.chain([first_line], lines)), status=200, mimetype="application/x-ndjson")
+
+    def new_sentence(self, result) -> dict:
+        sentence = {"sentence": get_sentence_text(result["conll"], result["sent_id"]), "conlls": {}, "sent_id": result["sent_id"]}
+        sentence["packages" if self.is_package else "matches"] = {}
+        return sentence
+
+    def add_to_sentence(self, sentence: dict, result):
+        user_id = result["user_id"]
+        sentence["conlls"][user_id] = result["conll"]
+        if self.is_package:
+            sentence["packages"][user_id] = {"modified_edges": result["modified_edges"], "modified_nodes": result["modified_nodes"]}
         else:
-            trees[sample_name][sent_id]["conlls"][user_id] = conll
             # /!\ there can be more than a single match for a same sample, sentence, user so it has to be a list
-            if is_package == False:
-                trees[sample_name][sent_id]["matches"][user_id] = trees[sample_name][sent_id][
-                    "matches"
-                ].get(user_id, []) + [{"edges": edges, "nodes": nodes}]
-            else:
-                trees[sample_name][sent_id]["packages"][user_id] = {"modified_edges": modified_edges, "modified_nodes": modified_nodes}
-    
-        return trees
+            sentence["matches"].setdefault(user_id, []).append({"edges": result["edges"], "nodes": result["nodes"]})
+
+
+def search_query_key(*query) -> str:
+    """Key of a search (project, request, samples, users...) for its cursors
+
+    Args:
+        query: json serializable parameters of the search
+
+    Returns:
+        str
+    """
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_search_cursor(query_key: str, offset: int) -> str:
+    cursor = json.dumps({"query": query_key, "offset": offset})
+    return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor: str, query_key: str) -> int:
+    """Offset of the page of a cursor, aborts if the cursor is invalid or comes from another query
+
+    Args:
+        cursor (str)
+        query_key (str)
+
+    Returns:
+        int: number of sentences before the page
+    """
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = decoded["offset"]
+        valid = decoded["query"] == query_key and type(offset) == int and offset >= 0
+    except (ValueError, TypeError, KeyError, AttributeError):
+        valid = False
+    if not valid:
+        abort(400, "Invalid cursor for this query")
+    return offset
+
+
+def _ndjson_line(value) -> bytes:
+    return (json.dumps(value, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def get_sentence_text(conll: str, sent_id: str = "") -> str:
+    """Text of a tree from its `# text` metadata (the last one, as conllup reads it), the text is rebuilt
+    from the tokens when there is none
+
+    Args:
+        conll (str)
+        sent_id (str, optional): for the error message
+
+    Returns:
+        str
+    """
+    text = None
+    conll = conll.lstrip()
+    position = 0
+    while position < len(conll):
+        end = conll.find("\n", position)
+        if end < 0:
+            end = len(conll)
+        line = conll[position:end].strip()
+        if not line.startswith("#"):
+            break
+        if " = " in line:
+            key, value = line.split(" = ", 1)
+            if key.strip("# ") == "text":
+                text = value
+        position = end + 1
+    if text is not None:
+        return text
+    try:
+        sentence_json = sentenceConllToJson(conll)
+    except Exception as e:
+        abort(400, 'The result of your query can not be processed by ArboratorGrew in sentence `{}` because: {}'.format(sent_id, str(e)))
+    if "text" in sentence_json["metaJson"]:
+        return sentence_json["metaJson"]["text"]
+    return constructTextFromTreeJson(sentence_json["treeJson"])
+
+
+class ExportTree(NamedTuple):
+    """A tree read once for the exports: as it is in grew (plus the final new line), without the
+    stripped metadata, and its timestamp ("" if there is none)"""
+    raw: str
+    stripped: str
+    timestamp: str
+
+
+def read_export_tree(conll: str, stripped_metadata: Tuple[str, ...] = EXPORT_STRIPPED_METADATA) -> ExportTree:
+    """Walk the comment lines at the top of a tree once to remove the metadata lines that are not exported
+    and find the timestamp, the token lines are not read
+
+    Args:
+        conll (str)
+        stripped_metadata (Tuple[str, ...], optional): names of the removed metadata
+
+    Returns:
+        ExportTree
+    """
+    raw = conll + "\n"
+    timestamp = ""
+    kept = []
+    start = position = 0
+    while raw.startswith("#", position):
+        end = raw.find("\n", position) + 1
+        if raw.startswith("# ", position):
+            equal = raw.find(" = ", position, end)
+            # the line has a value, as the "# name = .+" regexes used to require
+            if equal > 0 and equal + 4 < end:
+                name = raw[position + 2:equal]
+                if name == "timestamp" and not timestamp and re_timestamp_value.fullmatch(raw, equal + 3, end - 1):
+                    timestamp = raw[equal + 3:end - 1]
+                if name in stripped_metadata:
+                    kept.append(raw[start:position])
+                    start = end
+        position = end
+    if not kept:
+        return ExportTree(raw, raw, timestamp)
+    kept.append(raw[start:])
+    return ExportTree(raw, "".join(kept), timestamp)
+
 
 def get_timestamp(conll):
     """Get timestamp metadat from conll string
@@ -604,88 +1114,341 @@ def get_timestamp(conll):
         return False
 
 
+class TagsetService:
+    """
+        Tagsets (POS, relations, FEATS and MISC) used in the samples of a project. The tagsets of every
+        sample are kept in the cache until the sample is written, the tagsets of a list of samples are
+        merged from them so only the new or modified samples are sent to grew
+    """
+    @staticmethod
+    def get_tagsets(project_name: str, sample_ids: List[str]):
+        """Get the merged tagsets of samples
+
+        Args:
+            project_name (str)
+            sample_ids (List[str]): all the samples of the project if empty
+
+        Returns:
+            {"pos": List[str], "relations": List[str], "feats": List[str], "misc": List[str]}
+        """
+        if not sample_ids:
+            sample_ids = [sample["name"] for sample in GrewService.get_samples(project_name)]
+        if not grew_cache.is_active():
+            return TagsetService.merge_tagsets([TagsetService.fetch_tagsets(project_name, sample_ids)])
+
+        # the merged result is dropped on any write in the project, it is rebuilt from the samples entries
+        merged_key = "grew_tagset:{}:{}:{}".format(
+            project_name,
+            grew_cache.get_version(project_name),
+            hashlib.sha1(json.dumps(sorted(sample_ids)).encode("utf-8")).hexdigest(),
+        )
+        tagsets = cache.get(merged_key)
+        if tagsets is None:
+            tagsets = TagsetService.merge_tagsets(TagsetService.get_samples_tagsets(project_name, sample_ids))
+            cache.set(merged_key, tagsets, timeout=grew_config.tagset_cache_timeout)
+        return tagsets
+
+    @staticmethod
+    def get_samples_tagsets(project_name: str, sample_ids: List[str]):
+        """Get the tagsets of each sample from the cache, the missing ones are extracted by grew
+
+        Args:
+            project_name (str)
+            sample_ids (List[str])
+
+        Returns:
+            List[tagsets]
+        """
+        keys = {
+            sample_id: "grew_tagset:{}/{}:{}".format(
+                project_name, sample_id, grew_cache.get_sample_version(project_name, sample_id)
+            )
+            for sample_id in sample_ids
+        }
+        samples_tagsets = {sample_id: cache.get(key) for sample_id, key in keys.items()}
+        missing_sample_ids = [sample_id for sample_id, tagsets in samples_tagsets.items() if tagsets is None]
+
+        fetched_tagsets = imap_in_threads(
+            lambda sample_id: TagsetService.fetch_tagsets(project_name, [sample_id]),
+            missing_sample_ids,
+            grew_config.samples_fetch_workers,
+        )
+        for sample_id, tagsets in zip(missing_sample_ids, fetched_tagsets):
+            cache.set(keys[sample_id], tagsets, timeout=grew_config.tagset_cache_timeout)
+            samples_tagsets[sample_id] = tagsets
+        return list(samples_tagsets.values())
+
+    @staticmethod
+    def fetch_tagsets(project_name: str, sample_ids: List[str]):
+        """Extract the tagsets of samples with the three grew calls sent in parallel
+
+        Args:
+            project_name (str)
+            sample_ids (List[str])
+
+        Returns:
+            {"pos": List[str], "relations": List[str], "feats": List[str], "misc": List[str]}
+        """
+        data = {"project_id": project_name, "sample_ids": json.dumps(sample_ids)}
+        pos_list, relation_list, features = map_in_threads(
+            lambda grew_funct: grew_request(grew_funct, data=data)["data"],
+            ["getPOS", "getRelations", "getFeatures"],
+            max_workers=3,
+        )
+        return {"pos": pos_list, "relations": relation_list, "feats": features["FEATS"], "misc": features["MISC"]}
+
+    @staticmethod
+    def merge_tagsets(tagsets_list):
+        """Union of tagsets, the tags are sorted
+
+        Args:
+            tagsets_list (List[tagsets])
+
+        Returns:
+            tagsets
+        """
+        merged = {"pos": set(), "relations": set(), "feats": set(), "misc": set()}
+        for tagsets in tagsets_list:
+            for tagset_name, tags in merged.items():
+                tags.update(tagsets[tagset_name])
+        return {tagset_name: sorted(tags) for tagset_name, tags in merged.items()}
+
+
 class SampleExportService:
     """Class contains sample export functions"""
     @staticmethod
     def serve_sample_trees(samples, timestamps=True, user_ids=True, validated_by=True):
         """ get samples in form of json trees """
+        stripped_metadata = tuple(
+            name for name, kept in (("user_id", user_ids), ("timestamp", timestamps), ("validated_by", validated_by)) if not kept
+        )
         trees = {}
         for sent_id, users in samples.items():
+            conlls = {}
             for user_id, conll in users.items():
-                conll+="\n"
-                if sent_id not in trees:
-                    trees[sent_id] = {"conlls": {}}
-                
-                # Adapt user_id or timestamps lines depending on options
-                if not user_ids: conll = re.sub("# user_id = .+\n", '', conll)
-                if not timestamps: conll = re.sub("# timestamp = .+\n", '', conll)
-                if not validated_by: conll = re.sub("# validated_by = .+\n", '', conll)
-
-                trees[sent_id]["conlls"][user_id] = conll
+                if stripped_metadata:
+                    conlls[user_id] = read_export_tree(conll, stripped_metadata).stripped
+                else:
+                    conlls[user_id] = conll + "\n"
+            if conlls:
+                trees[sent_id] = {"conlls": conlls}
         return trees
 
     @staticmethod
-    def sample_tree_to_content_file(tree) -> Dict[str, str]:
-        """ 
+    def read_sample_trees(sample_data) -> Iterator[Dict[str, ExportTree]]:
+        """Read every tree of a sample once for the exports
 
         Args:
-            tree (tree_object)
+            sample_data ({"sent_id_1":{"user_1":"conllstring"}})
 
-        Returns:
-            Dict[str, str]
+        Yields:
+            {user_id: ExportTree}: the trees of a sentence
         """
-        if isinstance(tree, str):
-            tree = json.loads(tree)
-        usertrees: Dict[str, List[str]] = {}
-        for sent_id in tree.keys():
-            for user, conll in tree[sent_id]["conlls"].items():
-                if user not in usertrees:
-                    usertrees[user] = list()
-                usertrees[user].append(conll)
-        
-        to_return_obj = {}
-        for user, content in usertrees.items():
-            to_return_obj[user] = "".join(content)
-        return to_return_obj
+        for conlls in sample_data.values():
+            yield {user_id: read_export_tree(conll) for user_id, conll in conlls.items()}
 
     @staticmethod
-    def get_last_user(tree):
-        """Get username of most recent tree
+    def get_last_user(trees: Dict[str, ExportTree]) -> str:
+        """Get username of most recent tree, the last one of the sentence if several trees have the same timestamp
 
         Args:
-            tree (dict(str, str))
+            trees ({user_id: ExportTree})
 
         Returns:
             username (str)
         """
-        timestamps = [(user, get_timestamp(conll)) for (user, conll) in tree.items()]
-        if len(timestamps) == 1:
-            last = timestamps[0][0]
-        else:
-            last = sorted(timestamps, key=lambda x: x[1])[-1][0]
+        last, last_timestamp = None, None
+        for user_id, tree in trees.items():
+            if last is None or tree.timestamp >= last_timestamp:
+                last, last_timestamp = user_id, tree.timestamp
         return last
 
     @staticmethod
-    def content_files_to_zip(sample_names, sample_trees, users):
-        """convert files to export in zip file format
+    def iter_sample_content(sample_data, user: str, with_last: bool = True) -> Iterator[str]:
+        """Content of the export file of a user in a sample (without user_id, timestamp and validated_by),
+        one tree at a time. 'last' is the most recent tree of every sentence
+
+        Args:
+            sample_data ({"sent_id_1":{"user_1":"conllstring"}})
+            user (str)
+            with_last (bool, optional): False if 'last' is a user like the others
+
+        Yields:
+            str: conll of a tree
+        """
+        if with_last and user == "last":
+            for trees in SampleExportService.read_sample_trees(sample_data):
+                if trees:
+                    yield trees[SampleExportService.get_last_user(trees)].stripped
+            return
+        for conlls in sample_data.values():
+            if user in conlls:
+                yield read_export_tree(conlls[user]).stripped
+
+    @staticmethod
+    def iter_sample_members(sample_name: str, sample_data, users: List[str], with_last: bool = True) -> Iterator[Tuple[str, Iterator[str]]]:
+        """Files {user}/{sample_name}.conllu of a sample in an export zip, for the users who have trees in it
+
+        Args:
+            sample_name (str)
+            sample_data ({"sent_id_1":{"user_1":"conllstring"}})
+            users (List[str])
+            with_last (bool, optional): see iter_sample_content
+
+        Yields:
+            (path, content)
+        """
+        for user in users:
+            if SampleExportService.has_sample_content(sample_data, user, with_last):
+                content = SampleExportService.iter_sample_content(sample_data, user, with_last)
+                yield "{}/{}.conllu".format(user, sample_name), content
+
+    @staticmethod
+    def iter_search_results_members(sentences: Iterable[Tuple[str, str, dict]], users: List[str]) -> Iterator[Tuple[str, Iterator[str]]]:
+        """Files of the export of search results, the trees of the matched sentences by sample, in the order of
+        the first sentence of each sample
 
         Args:
+            sentences (Iterable[(sample_name, sent_id, sentence_result)]): see SearchResultsBuilder.iter_page
+            users (List[str])
+
+        Yields:
+            (path, content)
+        """
+        samples_data = {}
+        for sample_name, sent_id, sentence in sentences:
+            samples_data.setdefault(sample_name, {})[sent_id] = sentence["conlls"]
+        for sample_name, sample_data in samples_data.items():
+            yield from SampleExportService.iter_sample_members(sample_name, sample_data, users, with_last=False)
+
+    @staticmethod
+    def has_sample_content(sample_data, user: str, with_last: bool = True) -> bool:
+        """Is there a file of the user for the sample in the export ('last' is always there)"""
+        return (with_last and user == "last") or any(user in conlls for conlls in sample_data.values())
+
+    @staticmethod
+    def iter_samples_members(project_name: str, sample_names: List[str], users: List[str], max_workers: int = 1):
+        """Files of the export of samples, the next samples are fetched while a sample is compressed
+
+        Args:
+            project_name (str)
             sample_names (List[str])
-            sample_trees (List[{username: conll_content}, ...]): _description_
             users (List[str])
+            max_workers (int, optional): maximum number of samples fetched in parallel
+
+        Yields:
+            Iterator[(path, content)]: the files of a sample
+        """
+        if not export_cache.is_enabled():
+            replies = GrewService.get_samples_conll(project_name, sample_names, max_workers)
+            for sample_name, reply in zip(sample_names, replies):
+                if reply.get("status") != "OK":
+                    print("Error: {}".format(reply.get("message")))
+                    continue
+                yield SampleExportService.iter_sample_members(sample_name, reply.get("data", {}), users)
+            return
+
+        # the versions are read before the samples are fetched, a write during the fetch can't be cached
+        # under the version it replaced
+        versions = {}
+        if grew_cache.is_active():
+            versions = {
+                sample_name: grew_cache.get_sample_version(project_name, sample_name) for sample_name in sample_names
+            }
+        cached_samples = {
+            sample_name for sample_name, version in versions.items()
+            if all(
+                export_cache.contains(SampleExportService._export_cache_key(project_name, sample_name, version, user))
+                for user in users
+            )
+        }
+        fetched_samples = [sample_name for sample_name in sample_names if sample_name not in cached_samples]
+        replies = zip(fetched_samples, GrewService.get_samples_conll(project_name, fetched_samples, max_workers))
+        try:
+            for sample_name in sample_names:
+                version = versions.get(sample_name)
+                if sample_name in cached_samples:
+                    members = SampleExportService._get_cached_members(project_name, sample_name, version, users)
+                    if members is not None:
+                        yield members
+                        continue
+                    # evicted since it was looked up
+                    sample_data = GrewService.get_sample_trees(project_name, sample_name)
+                else:
+                    _, reply = next(replies)
+                    if reply.get("status") != "OK":
+                        print("Error: {}".format(reply.get("message")))
+                        continue
+                    sample_data = reply.get("data", {})
+                version = version or export_cache.content_version(sample_data)
+                yield SampleExportService._iter_cached_sample_members(project_name, sample_name, version, sample_data, users)
+        finally:
+            export_cache.evict()
+
+    @staticmethod
+    def _export_cache_key(project_name: str, sample_name: str, version: str, user: str) -> str:
+        return export_cache.entry_key(project_name, sample_name, version, user, ",".join(EXPORT_STRIPPED_METADATA))
+
+    @staticmethod
+    def _get_cached_members(project_name: str, sample_name: str, version: str, users: List[str]):
+        """Files of a sample found in the export cache, None if one of them is missing"""
+        members = []
+        for user in users:
+            member = export_cache.get(SampleExportService._export_cache_key(project_name, sample_name, version, user))
+            if member is None:
+                for _, opened_member in members:
+                    opened_member.close()
+                return None
+            if member.present:
+                members.append(("{}/{}.conllu".format(user, sample_name), member))
+            else:
+                member.close()
+        return members
+
+    @staticmethod
+    def _iter_cached_sample_members(project_name: str, sample_name: str, version: str, sample_data, users: List[str]):
+        """Files of a sample, compressed in the export cache when they are written in the archive"""
+        for user in users:
+            key = SampleExportService._export_cache_key(project_name, sample_name, version, user)
+            if SampleExportService.has_sample_content(sample_data, user):
+                content = SampleExportService.iter_sample_content(sample_data, user)
+                # compressed by the workers of iter_archive
+                yield "{}/{}.conllu".format(user, sample_name), functools.partial(export_cache.put, key, content)
+            else:
+                export_cache.put(key, None).close()
+
+    @staticmethod
+    def iter_archive(members: Iterable[Tuple[str, MemberContent]], export_format: ExportFormat = None) -> Iterator[bytes]:
+        """Build an export archive while it is sent, the members are compressed in parallel by
+        Config.EXPORT_COMPRESSION_WORKERS threads
+
+        Args:
+            members (Iterable[(path, Iterable[str] | CachedMember | Callable)]): see app/utils/export_archive.py
+            export_format (ExportFormat, optional): zip with deflate by default
+
+        Yields:
+            bytes
+        """
+        return iter_archive(members, export_format or ExportFormat(), Config.EXPORT_COMPRESSION_WORKERS)
+
+    @staticmethod
+    def archive_response(chunks: Iterator[bytes], file_name: str, export_format: ExportFormat = None) -> Response:
+        """Stream an archive to the client. The first chunk is built before the response starts, so
+        that a failing grew request still gives an error status instead of a truncated file
+
+        Args:
+            chunks (Iterator[bytes]): see iter_archive
+            file_name (str): without the extension of the format
+            export_format (ExportFormat, optional)
 
         Returns:
-            memory_file (File)
-        """
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, "w") as zf:
-            for user in users:
-                for sample_name, sample in zip(sample_names, sample_trees):
-                    if user in sample.keys():
-                        data = zipfile.ZipInfo()
-                        data.filename = "{}/{}.conllu".format(user, sample_name) 
-                        data.date_time = time.localtime(time.time())[:6]
-                        data.compress_type = zipfile.ZIP_DEFLATED
-                        zf.writestr(data, sample.get(user))
-        memory_file.seek(0)
-        return memory_file
\ No newline at end of file
+            Response
+        """
+        export_format = export_format or ExportFormat()
+        first_chunk = next(chunks, b"")
+        return Response(
+            stream_with_context(itertools.chain([first_chunk], chunks)),
+            status=200,
+            mimetype=export_format.mimetype,
+            headers={"Content-Disposition": "attachment;filename={}".format(export_format.file_name(file_name))},
+        )
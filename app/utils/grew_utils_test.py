@@ -1,3 +1,6 @@
+import itertools
+import json
+
 from app.utils.grew_utils import GrewService, get_timestamp
 
 project_name_test = "tdd_1"
@@ -21,4 +24,361 @@ has_no_timestamp = """
 
 def test_true():
     assert get_timestamp(has_timestamp) == "1684250080942.398"
-    assert get_timestamp(has_no_timestamp) == False
\ No newline at end of file
+    assert get_timestamp(has_no_timestamp) == False
+
+def test_read_export_tree():
+    from app.utils.grew_utils import SampleExportService, read_export_tree
+
+    conll = "# sent_id = s1\n# user_id = alice\n# timestamp = 1684250080942.398\n# validated_by = \n# text = a\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_"
+    tree = read_export_tree(conll)
+    assert tree.raw == conll + "\n"
+    assert tree.stripped == "# sent_id = s1\n# validated_by = \n# text = a\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_\n"
+    assert tree.timestamp == "1684250080942.398"
+    assert read_export_tree(conll, ("user_id",)).stripped == conll.replace("# user_id = alice\n", "") + "\n"
+
+    trees = {
+        "alice": read_export_tree("# timestamp = 2\n1\ta"),
+        "bob": read_export_tree("# timestamp = 3\n1\tb"),
+        "carol": read_export_tree("1\tc"),
+    }
+    assert SampleExportService.get_last_user(trees) == "bob"
+
+
+def test_search_results_builder():
+    from app.utils.grew_utils import SearchResultsBuilder, get_sentence_text
+
+    assert get_sentence_text("# sent_id = s1\n# text = a = b \n# text_en = c\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_") == "a = b"
+    assert get_sentence_text("\n#text = a\n## text = b\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_") == "b"
+    assert get_sentence_text("# sent_id = s1\n1\tun\t_\t_\t_\t_\t0\troot\t_\t_\n2\tmot\t_\t_\t_\t_\t1\tdep\t_\t_").strip() == "un mot"
+
+    conll = "# text = a\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_"
+    results = [
+        {"sample_id": "s", "sent_id": "1", "user_id": "alice", "conll": conll, "nodes": {"X": "1"}, "edges": {}},
+        {"sample_id": "s", "sent_id": "1", "user_id": "alice", "conll": conll, "nodes": {"X": "2"}, "edges": {}},
+        {"sample_id": "s", "sent_id": "1", "user_id": "bob", "conll": conll, "nodes": {"X": "1"}, "edges": {}},
+        {"sample_id": "s", "sent_id": "2", "user_id": "bob", "conll": conll, "nodes": {"X": "1"}, "edges": {}},
+    ]
+    trees = SearchResultsBuilder().build(results)
+    assert list(trees["s"]) == ["1", "2"]
+    assert trees["s"]["1"]["sentence"] == "a"
+    assert trees["s"]["1"]["matches"] == {
+        "alice": [{"edges": {}, "nodes": {"X": "1"}}, {"edges": {}, "nodes": {"X": "2"}}],
+        "bob": [{"edges": {}, "nodes": {"X": "1"}}],
+    }
+    assert list(SearchResultsBuilder().iter_sentences(results)) == [("s", sent_id, trees["s"][sent_id]) for sent_id in trees["s"]]
+
+    # the matches of a sentence are not always together in the reply
+    interleaved = [results[0], results[3], results[2], results[1], dict(results[3], sample_id="t"), dict(results[0], nodes={"X": "3"})]
+    expected = SearchResultsBuilder().build(interleaved)
+    assert len(expected["s"]["1"]["matches"]["alice"]) == 3
+    sentences = list(SearchResultsBuilder().iter_sentences(interleaved))
+    # the first sentence is yielded again once its late matches are merged
+    assert sentences == [("s", "1", expected["s"]["1"]), ("s", "2", expected["s"]["2"]), ("t", "2", expected["t"]["2"]), ("s", "1", expected["s"]["1"])]
+    assert sentences[0][2] is sentences[3][2]
+    counts = {}
+    page = list(SearchResultsBuilder().iter_sentences(interleaved, offset=1, page_size=1, counts=counts))
+    assert page == [("s", "2", expected["s"]["2"])]
+    assert counts == {"match_count": 6, "sentence_count": 3}
+
+    # a sentence is yielded as soon as the matches of the next one start
+    read = []
+
+    def reply():
+        for result in results:
+            read.append(result)
+            yield result
+    sentences = SearchResultsBuilder().iter_sentences(reply())
+    assert next(sentences)[1] == "1" and len(read) == 4
+    assert next(sentences)[1] == "2"
+
+    packages = SearchResultsBuilder(is_package=True).build(
+        [dict(result, modified_nodes=["1"], modified_edges=[]) for result in results]
+    )
+    assert packages["s"]["1"]["packages"]["alice"] == {"modified_edges": [], "modified_nodes": ["1"]}
+    assert "matches" not in packages["s"]["1"]
+
+
+def test_samples_fetched_in_parallel_keep_their_order():
+    from app import grew_config
+    from app.test.fake_grew import FakeGrewServer
+
+    conll = "# sent_id = {0}\n# timestamp = 1\n1\t{1}\t_\t_\t_\t_\t0\troot\t_\t_"
+    corpus = {
+        "project": {
+            "sample_{}".format(i): {"s{}".format(i): {"user": conll.format("s{}".format(i), "word{}".format(i))}}
+            for i in range(8)
+        }
+    }
+    sample_names = list(corpus["project"].keys())
+    with FakeGrewServer(latency=0.01, corpus=corpus) as server:
+        grew_config.server = server.url
+        sequential = GrewService.get_samples_with_string_contents("project", sample_names)
+        parallel = GrewService.get_samples_with_string_contents("project", sample_names, max_workers=4)
+    assert parallel == sequential
+    assert "word3" in parallel[1][3]["user"]
+
+
+def test_sample_trees_are_streamed_from_grew():
+    from app import grew_config
+    from app.test.fake_grew import FakeGrewServer
+
+    conll = "# sent_id = s{0}\n# text = mot{0} ü\n1\tmot{0}\t_\t_\t_\t_\t0\troot\t_\t_"
+    sample = {"s{}".format(i): {"user": conll.format(i), "other": conll.format(i)} for i in range(2000)}
+    with FakeGrewServer(corpus={"project": {"sample": sample}}) as server:
+        grew_config.server = server.url
+        assert GrewService.get_sample_trees("project", "sample") == sample
+        assert next(GrewService.iter_sample_trees("project", "sample")) == ("s0", sample["s0"])
+
+
+def test_tagsets_are_merged_from_cached_samples(monkeypatch):
+    from flask import Flask
+
+    from app import cache
+    from app.utils.grew_cache import grew_cache
+    from app.utils.grew_utils import TagsetService
+
+    samples_tags = {
+        "sample_1": {"getPOS": ["NOUN", "DET"], "getRelations": ["det"], "getFeatures": {"FEATS": ["Number"], "MISC": []}},
+        "sample_2": {"getPOS": ["VERB", "NOUN"], "getRelations": ["subj"], "getFeatures": {"FEATS": ["Tense"], "MISC": ["Gloss"]}},
+    }
+    calls = []
+
+    def fake_grew_request(grew_funct, data):
+        sample_ids = json.loads(data["sample_ids"])
+        calls.append((grew_funct, tuple(sample_ids)))
+        return {"status": "OK", "data": samples_tags[sample_ids[0]][grew_funct]}
+
+    monkeypatch.setattr("app.utils.grew_utils.grew_request", fake_grew_request)
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    with app.app_context():
+        tagsets = TagsetService.get_tagsets("project", ["sample_1", "sample_2"])
+        assert tagsets == {
+            "pos": ["DET", "NOUN", "VERB"],
+            "relations": ["det", "subj"],
+            "feats": ["Number", "Tense"],
+            "misc": ["Gloss"],
+        }
+        assert len(calls) == 6
+
+        assert TagsetService.get_tagsets("project", ["sample_2", "sample_1"]) == tagsets
+        assert len(calls) == 6
+
+        samples_tags["sample_2"]["getPOS"] = ["AUX"]
+        grew_cache.invalidate("saveConll", {"project_id": "project", "sample_id": "sample_2"})
+        assert TagsetService.get_tagsets("project", ["sample_1", "sample_2"])["pos"] == ["AUX", "DET", "NOUN"]
+        assert sorted(calls[6:]) == [("getFeatures", ("sample_2",)), ("getPOS", ("sample_2",)), ("getRelations", ("sample_2",))]
+        cache.clear()
+
+
+def test_export_zip_is_streamed_sample_by_sample(monkeypatch, tmp_path):
+    import io
+    import zipfile
+
+    from app import grew_config
+    from app.test.fake_grew import FakeGrewServer
+    from app.utils.grew_utils import SampleExportService
+
+    conll = "# sent_id = {0}\n# user_id = {1}\n# timestamp = {2}\n# validated_by = {1}\n1\t{1}\t_\t_\t_\t_\t0\troot\t_\t_"
+    corpus = {
+        "project": {
+            "sample_{}".format(i): {
+                "s{}_{}".format(i, j): {
+                    "alice": conll.format("s{}_{}".format(i, j), "alice", 10 + j),
+                    "bob": conll.format("s{}_{}".format(i, j), "bob", 10 + 2 * (j % 2)),
+                }
+                for j in range(500)
+            }
+            for i in range(3)
+        }
+    }
+    corpus["project"]["sample_1"]["s1_0"] = {"bob": conll.format("s1_0", "bob", 1)}
+    monkeypatch.setattr("app.utils.export_archive.ARCHIVE_CHUNK_SIZE", 1024)
+    monkeypatch.setattr("app.utils.export_cache.EXPORT_CACHE_FOLDER", str(tmp_path))
+    sample_names = list(corpus["project"].keys())
+    users = ["alice", "last", "carol"]
+    with FakeGrewServer(corpus=corpus) as server:
+        grew_config.server = server.url
+        samples_members = SampleExportService.iter_samples_members("project", sample_names, users, max_workers=2)
+        chunks = list(SampleExportService.iter_archive(itertools.chain.from_iterable(samples_members)))
+        _, contents = GrewService.get_samples_with_string_contents("project", sample_names)
+
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.namelist() == [
+            "{}/{}.conllu".format(user, sample_name) for sample_name in sample_names for user in ("alice", "last")
+        ]
+        for sample_name, content in zip(sample_names, contents):
+            for user in ("alice", "last"):
+                assert zf.read("{}/{}.conllu".format(user, sample_name)).decode() == content[user]
+        last = zf.read("last/sample_1.conllu").decode()
+    assert "# user_id" not in last and "# timestamp" not in last and "# validated_by" not in last
+    trees = last.split("# sent_id = ")[1:]
+    assert "\tbob\t" in trees[0] and "\tbob\t" in trees[1] and "\tbob\t" not in trees[2]
+
+
+def test_export_cache_serves_unchanged_samples(monkeypatch, tmp_path):
+    import io
+    import os
+    import zipfile
+
+    from flask import Flask
+
+    from app import cache, grew_config
+    from app.test.fake_grew import FakeGrewServer
+    from app.utils.export_cache import export_cache
+    from app.utils.grew_cache import grew_cache
+    from app.utils.grew_utils import SampleExportService
+
+    monkeypatch.setattr("app.utils.export_cache.EXPORT_CACHE_FOLDER", str(tmp_path))
+    conll = "# sent_id = {0}\n# user_id = alice\n# timestamp = 1\n1\t{1}\t_\t_\t_\t_\t0\troot\t_\t_"
+    corpus = {
+        "project": {
+            "sample_{}".format(i): {"s{}".format(j): {"alice": conll.format("s{}".format(j), "word{}".format(i))} for j in range(50)}
+            for i in range(3)
+        }
+    }
+    sample_names = list(corpus["project"].keys())
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+
+    def export():
+        samples_members = SampleExportService.iter_samples_members("project", sample_names, ["alice", "last", "bob"])
+        zip_file = b"".join(SampleExportService.iter_archive(itertools.chain.from_iterable(samples_members)))
+        with zipfile.ZipFile(io.BytesIO(zip_file)) as zf:
+            assert zf.testzip() is None
+            return {name: zf.read(name).decode() for name in zf.namelist()}
+
+    with FakeGrewServer(corpus=corpus) as server, app.app_context():
+        grew_config.server = server.url
+        first = export()
+        assert server.calls["getConll"] == 3
+        assert export() == first
+        assert server.calls["getConll"] == 3
+
+        corpus["project"]["sample_1"]["s0"]["alice"] = conll.format("s0", "changed")
+        grew_cache.invalidate("saveGraph", {"project_id": "project", "sample_id": "sample_1"})
+        second = export()
+        assert server.calls["getConll"] == 4
+        assert "\tchanged\t" in second["alice/sample_1.conllu"]
+        assert {name: content for name, content in second.items() if "sample_1" not in name} == {
+            name: content for name, content in first.items() if "sample_1" not in name
+        }
+        cache.clear()
+
+    assert sorted(first) == sorted("{}/{}.conllu".format(user, sample) for sample in sample_names for user in ("alice", "last"))
+    entries = sorted(os.listdir(tmp_path))
+    assert len(entries) == 12
+    for index, entry in enumerate(entries):
+        os.utime(os.path.join(tmp_path, entry), (index, index))
+    size = os.path.getsize(os.path.join(tmp_path, entries[-1]))
+    assert export_cache.evict(max_size=size) == 11
+    assert os.listdir(tmp_path) == entries[-1:]
+
+
+def test_search_results_pages_and_stream():
+    import pytest
+    from flask import Flask
+    from werkzeug.exceptions import BadRequest
+
+    from app import grew_config
+    from app.test.fake_grew import FakeGrewServer
+    from app.utils.grew_utils import SearchResultsBuilder, encode_search_cursor, search_query_key
+
+    conll = "# sent_id = {0}\n# text = a b\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_\n2\tb\t_\t_\t_\t_\t1\tdep\t_\t_"
+    corpus = {
+        "project": {
+            "sample_{}".format(i): {"s{}_{}".format(i, j): {user: conll.format("s{}_{}".format(i, j)) for user in ("alice", "bob")} for j in range(5)}
+            for i in range(2)
+        }
+    }
+    query_key = search_query_key("search", "project", "pattern { X [] }")
+
+    def search(args):
+        results = GrewService.search_request_in_graphs("project", "pattern { X [] }", [], "all", "")
+        return SearchResultsBuilder().response(results, args, query_key)
+
+    with FakeGrewServer(corpus=corpus) as server, Flask(__name__).test_request_context():
+        grew_config.server = server.url
+        trees = search({})
+        assert sorted(trees) == ["sample_0", "sample_1"]
+
+        pages, cursor = [], None
+        while True:
+            page = search({"pageSize": 3, "cursor": cursor})
+            assert (page["match_count"], page["sentence_count"]) == (40, 10)
+            pages.append(page["trees"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert len(pages) == 4
+        assert [sent_id for page in pages for sample in page.values() for sent_id in sample] == [
+            sent_id for sample in trees.values() for sent_id in sample
+        ]
+        assert pages[1] == {"sample_0": {"s0_3": trees["sample_0"]["s0_3"], "s0_4": trees["sample_0"]["s0_4"]}, "sample_1": {"s1_0": trees["sample_1"]["s1_0"]}}
+
+        response = search({"stream": True, "pageSize": 4})
+        assert response.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in b"".join(response.response).splitlines()]
+        assert [line["sent_id"] for line in lines[:-1]] == ["s0_0", "s0_1", "s0_2", "s0_3"]
+        assert lines[0]["result"] == trees["sample_0"]["s0_0"]
+        assert lines[-1]["match_count"] == 40 and lines[-1]["next_cursor"]
+
+        for cursor in ("not a cursor", encode_search_cursor(search_query_key("other"), 3)):
+            with pytest.raises(BadRequest):
+                search({"cursor": cursor})
+
+
+def test_search_results_members_by_sample():
+    from app.utils.grew_utils import SampleExportService
+
+    conll = "# sent_id = {}\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_\n"
+    sentences = [
+        ("sample_1", "s1", {"conlls": {"alice": conll.format("s1"), "bob": conll.format("s1")}}),
+        ("sample_1", "s2", {"conlls": {"bob": conll.format("s2")}}),
+        ("sample_2", "s3", {"conlls": {"bob": conll.format("s3")}}),
+    ]
+    members = {path: "".join(content) for path, content in SampleExportService.iter_search_results_members(iter(sentences), ["alice", "bob"])}
+    assert members == {
+        "alice/sample_1.conllu": conll.format("s1") + "\n",
+        "bob/sample_1.conllu": conll.format("s1") + "\n" + conll.format("s2") + "\n",
+        "bob/sample_2.conllu": conll.format("s3") + "\n",
+    }
+
+
+def test_rule_results_save_only_the_modified_graphs():
+    from app import grew_config
+    from app.test.fake_grew import FakeGrewServer
+
+    conll = "# sent_id = {0}\n# user_id = {1}\n1\t{2}\t_\t_\t_\t_\t0\troot\t_\t_"
+    corpus = {
+        "project": {
+            "sample_{}".format(i): {"s{}".format(j): {user: conll.format("s{}".format(j), user, "a") for user in ("alice", "validated")} for j in range(20)}
+            for i in range(3)
+        }
+    }
+
+    def rewritten(sent_id, modified_users, users=("alice", "validated")):
+        return {
+            "conlls": {user: conll.format(sent_id, user, "b") for user in users},
+            "packages": {user: {"modified_nodes": ["1"] if user in modified_users else [], "modified_edges": []} for user in users},
+        }
+
+    samples = [
+        ("sample_0", {"s3": rewritten("s3", ["alice"]), "s7": rewritten("s7", ["alice", "validated"])}),
+        ("sample_1", {"s1": rewritten("s1", [])}),
+        ("sample_2", {"s2": {"conlls": {"alice": conll.format("s2", "alice", "b")}}}),
+    ]
+    with FakeGrewServer(corpus=corpus) as server:
+        grew_config.server = server.url
+        saved = list(GrewService.save_rule_results("project", iter(samples), max_workers=2))
+        project = server.corpus.project("project")
+
+    assert saved == [("sample_0", ["alice", "alice", "validated"]), ("sample_1", []), ("sample_2", ["alice"])]
+    assert server.calls["saveConll"] == 2
+    changed = sorted(
+        (sample_name, sent_id, user)
+        for sample_name, sample in project.items() for sent_id, trees in sample.items() for user, tree in trees.items() if "\tb\t" in tree
+    )
+    assert changed == [("sample_0", "s3", "alice"), ("sample_0", "s7", "alice"), ("sample_0", "s7", "validated"), ("sample_2", "s2", "alice")]
+    assert all(len(sample) == 20 for sample in project.values())
@@ -0,0 +1,122 @@
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACES = " \t\n\r"
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class _ChunkBuffer:
+    """Text buffer filled from an iterable of byte chunks, consumed from the left"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, minimum_size: int = 1) -> bool:
+        """Read chunks until at least minimum_size characters are available after pos"""
+        if self.pos > 65536 and self.pos > len(self.text) // 2:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        pieces = [self.text]
+        available = len(self.text) - self.pos
+        while available < minimum_size and not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                piece = self._decoder.decode(b"", final=True)
+            else:
+                piece = self._decoder.decode(chunk)
+            pieces.append(piece)
+            available += len(piece)
+        self.text = "".join(pieces)
+        return available >= minimum_size
+
+    def skip_whitespaces(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACES:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def peek(self) -> str:
+        self.skip_whitespaces()
+        if self.pos >= len(self.text):
+            raise JsonStreamError("Unexpected end of the json stream")
+        return self.text[self.pos]
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if character not in characters:
+            raise JsonStreamError("Expected one of '{}' at '{}'".format(characters, self.text[self.pos:self.pos + 20]))
+        self.pos += 1
+        return character
+
+    def decode_value(self) -> Any:
+        """Decode the next complete json value, reading more chunks as long as it is truncated"""
+        self.skip_whitespaces()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # a number at the very end of the buffer might continue in the next chunk
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # grow geometrically so that a large value is parsed a bounded number of times
+            self.fill(2 * (len(self.text) - self.pos) + 1)
+
+
+def iter_json_object(chunks: Iterable[bytes], streamed_key: str, header: Dict[str, Any]) -> Iterator[Any]:
+    """
+        Decode a json object from byte chunks without holding the full text. The value of
+        streamed_key is yielded item by item: elements for a list, (key, value) pairs for an object.
+        The other keys of the object are stored in `header` as soon as they are decoded.
+
+    Args:
+        chunks (Iterable[bytes])
+        streamed_key (str)
+        header (dict): filled with the values of the other keys
+
+    Yields:
+        Any
+    """
+    buffer = _ChunkBuffer(chunks)
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    while True:
+        key = buffer.decode_value()
+        buffer.expect(":")
+        if key == streamed_key and buffer.peek() in "[{":
+            yield from _iter_container(buffer)
+        else:
+            header[key] = buffer.decode_value()
+        if buffer.expect(",}") == "}":
+            return
+
+
+def _iter_container(buffer: _ChunkBuffer) -> Iterator[Any]:
+    opening = buffer.expect("[{")
+    closing = "]" if opening == "[" else "}"
+    if buffer.peek() == closing:
+        buffer.pos += 1
+        return
+    while True:
+        if opening == "[":
+            yield buffer.decode_value()
+        else:
+            key = buffer.decode_value()
+            buffer.expect(":")
+            yield key, buffer.decode_value()
+        if buffer.expect("," + closing) == closing:
+            return
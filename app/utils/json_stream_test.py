@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from app.utils.json_stream import JsonStreamError, iter_json_object
+
+reply = {
+    "status": "OK",
+    "data": {
+        "s1": {"user": "# text = Ça va\n1\tÇa\t_\t_\t_\t_\t0\troot\t_\t_"},
+        "s2": {"user": "# text = 😀\n1\t😀\t_\t_\t_\t_\t0\troot\t_\t_", "other": ""},
+    },
+    "messages": [],
+    "count": 123456789012345678901234567890,
+}
+
+
+def to_chunks(text: str, chunk_size: int):
+    encoded = text.encode("utf-8")
+    return [encoded[i:i + chunk_size] for i in range(0, len(encoded), chunk_size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 100000])
+def test_object_items_are_streamed_whatever_the_chunking(chunk_size):
+    header = {}
+    items = list(iter_json_object(to_chunks(json.dumps(reply, ensure_ascii=False, indent=1), chunk_size), "data", header))
+    assert dict(items) == reply["data"]
+    assert header == {"status": "OK", "messages": [], "count": reply["count"]}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_list_elements_are_streamed(chunk_size):
+    data = [{"sent_id": str(i), "nodes": {"X": str(i)}} for i in range(50)] + [1.5e10, None, True, "end"]
+    header = {}
+    text = json.dumps({"data": data, "status": "OK"})
+    assert list(iter_json_object(to_chunks(text, chunk_size), "data", header)) == data
+    assert header == {"status": "OK"}
+
+
+def test_reply_without_data():
+    header = {}
+    items = list(iter_json_object(to_chunks('{"status": "ERROR", "message": "no such project"}', 3), "data", header))
+    assert items == []
+    assert header == {"status": "ERROR", "message": "no such project"}
+
+
+def test_empty_containers():
+    assert list(iter_json_object([b'{"data": []}'], "data", {})) == []
+    assert list(iter_json_object([b'{"data": {}}'], "data", {})) == []
+    assert list(iter_json_object([b"{}"], "data", {})) == []
+
+
+def test_truncated_stream_raises():
+    with pytest.raises((JsonStreamError, json.JSONDecodeError)):
+        list(iter_json_object([b'{"status": "OK", "data": [1, 2'], "data", {}))
+    with pytest.raises(JsonStreamError):
+        list(iter_json_object([b'<html><p>Internal error</p></html>'], "data", {}))
@@ -0,0 +1,133 @@
+"""
+    Memory cache of the formatted results of the grew searches and try packages (see SearchResultsBuilder
+    in app/utils/grew_utils.py), so that the queries run again (e.g. from the History) are not sent to grew.
+
+    An entry is keyed by its query (project, request, samples and resolved user ids) and stamped with the
+    write version of its project in grew_cache: any write on the project (saveGraph, saveConll...) replaces
+    the version and the entry is dropped at its next lookup. Each worker has its own cache, the least
+    recently used entries are evicted when it gets bigger than Config.SEARCH_CACHE_SIZE.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import Config
+from app.utils.grew_cache import grew_cache
+
+
+class CachedSearch(NamedTuple):
+    """Results of a query: the sentences in grew order and the number of matches"""
+    sentences: List[Tuple[str, str, dict]]
+    match_count: int
+
+
+class SearchCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # query_key: (project version, CachedSearch, size)
+        self._entries: "OrderedDict[str, Tuple[str, CachedSearch, int]]" = OrderedDict()
+        self._size = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def is_active() -> bool:
+        """The versions of the projects are only known when the grew cache is active"""
+        return Config.SEARCH_CACHE_ENABLED and grew_cache.is_active()
+
+    @staticmethod
+    def max_entry_size() -> int:
+        return Config.SEARCH_CACHE_SIZE // 4
+
+    @staticmethod
+    def sentence_size(sentence: dict) -> int:
+        """Memory of a formatted sentence: its dicts, lists and strings as measured by sys.getsizeof (a
+        string of non ascii text takes 2 or 4 bytes by character), the objects shared by its matches once
+
+        Args:
+            sentence (dict): see SearchResultsBuilder
+
+        Returns:
+            int: bytes
+        """
+        size = 0
+        seen = set()
+        pending = [sentence]
+        while pending:
+            value = pending.pop()
+            if id(value) in seen:
+                continue
+            seen.add(id(value))
+            size += sys.getsizeof(value)
+            if isinstance(value, dict):
+                pending.extend(value.keys())
+                pending.extend(value.values())
+            elif isinstance(value, (list, tuple)):
+                pending.extend(value)
+        return size
+
+    def get(self, project_id: str, query_key: str) -> Optional[CachedSearch]:
+        """Results of a query if the project was not written since they were kept
+
+        Args:
+            project_id (str)
+            query_key (str): see search_query_key
+
+        Returns:
+            CachedSearch | None
+        """
+        version = grew_cache.get_version(project_id)
+        with self._lock:
+            entry = self._entries.get(query_key)
+            if entry is not None and entry[0] != version:
+                self._remove(query_key)
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(query_key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, project_id: str, query_key: str, version: str, results: CachedSearch, size: int):
+        """Keep the results of a query, they are dropped if the project was written while grew was searching
+
+        Args:
+            project_id (str)
+            query_key (str)
+            version (str): version of the project before the query was sent
+            results (CachedSearch)
+            size (int): estimated memory of the results
+        """
+        if size > self.max_entry_size() or grew_cache.get_version(project_id) != version:
+            return
+        with self._lock:
+            if query_key in self._entries:
+                self._remove(query_key)
+            self._entries[query_key] = (version, results, size)
+            self._size += size
+            while self._size > Config.SEARCH_CACHE_SIZE:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _remove(self, query_key: str):
+        _, _, size = self._entries.pop(query_key)
+        self._size -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and size of the cache of the current worker
+
+        Returns:
+            {"hits", "misses", "evictions", "entries", "size"}
+        """
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), size=self._size)
+
+
+search_cache = SearchCache()
@@ -0,0 +1,102 @@
+import sys
+
+from flask import Flask
+
+from app import cache, grew_config
+from app.test.fake_grew import FakeGrewServer
+from app.utils.grew_utils import GrewService, SearchResultsBuilder, grew_request, search_query_key
+from app.utils.search_cache import CachedSearch, search_cache
+
+conll = "# sent_id = {0}\n# text = a b\n1\ta\t_\t_\t_\t_\t0\troot\t_\t_\n2\tb\t_\t_\t_\t_\t1\tdep\t_\t_"
+
+
+def search(pattern, args={}):
+    user_ids = GrewService.get_user_ids("all", "")
+    results = GrewService.search_request_in_graphs("project", pattern, [], "all", "")
+    return SearchResultsBuilder().response(results, args, search_query_key("search", "project", pattern, [], user_ids), "project")
+
+
+def test_search_results_are_cached_until_the_project_is_written():
+    corpus = {"project": {"sample": {"s{}".format(j): {"alice": conll.format("s{}".format(j))} for j in range(5)}}}
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    search_cache.clear()
+    with FakeGrewServer(corpus=corpus) as server, app.test_request_context():
+        grew_config.server = server.url
+        trees = search("pattern { X [] }")
+        assert len(trees["sample"]) == 5
+        assert search("pattern { X [] }") == trees
+        page = search("pattern { X [] }", {"pageSize": 2})
+        assert list(page["trees"]["sample"]) == ["s0", "s1"] and page["match_count"] == 10
+        assert server.calls["searchRequestInGraphs"] == 1
+
+        search("pattern { X [upos=NOUN] }")
+        assert server.calls["searchRequestInGraphs"] == 2
+
+        grew_request("saveGraph", {"project_id": "project", "sample_id": "sample", "user_id": "alice", "conll_graph": conll.format("s5")})
+        assert len(search("pattern { X [] }")["sample"]) == 6
+        assert server.calls["searchRequestInGraphs"] == 3
+    search_cache.clear()
+    cache.clear()
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    monkeypatch.setattr("app.config.Config.SEARCH_CACHE_SIZE", 1000)
+    monkeypatch.setattr("app.utils.grew_cache.GrewCache.get_version", lambda self, project_id: "v1")
+    search_cache.clear()
+    for key in ("a", "b", "c"):
+        search_cache.put("project", key, "v1", CachedSearch([], 0), 240)
+    assert search_cache.get("project", "a") is not None
+    search_cache.put("project", "d", "v1", CachedSearch([], 0), 240)
+    search_cache.put("project", "e", "v1", CachedSearch([], 0), 240)
+    assert [key for key in "abcde" if search_cache.get("project", key) is not None] == ["a", "c", "d", "e"]
+    # bigger than a quarter of the cache
+    search_cache.put("project", "f", "v1", CachedSearch([], 0), 300)
+    assert search_cache.get("project", "f") is None
+    # the project was written while grew was searching
+    search_cache.put("project", "g", "v0", CachedSearch([], 0), 10)
+    assert search_cache.get("project", "g") is None
+    search_cache.clear()
+
+
+def test_pages_of_big_results_do_not_build_every_sentence(monkeypatch):
+    monkeypatch.setattr("app.config.Config.SEARCH_CACHE_SIZE", 4 * 5000)
+    monkeypatch.setattr("app.utils.search_cache.SearchCache.is_active", staticmethod(lambda: True))
+    monkeypatch.setattr("app.utils.grew_cache.GrewCache.get_version", lambda self, project_id: "v1")
+    search_cache.clear()
+    results = [
+        {"sample_id": "sample", "sent_id": "s{}".format(j), "user_id": "alice", "conll": conll.format("s{}".format(j)), "nodes": {"X": "1"}, "edges": {}}
+        for j in range(200)
+    ]
+    builder = SearchResultsBuilder()
+    new_sentence = builder.new_sentence
+    built = []
+
+    def spy(result):
+        built.append(result["sent_id"])
+        return new_sentence(result)
+    monkeypatch.setattr(builder, "new_sentence", spy)
+
+    counts = {}
+    page = list(builder.iter_page(iter(results), 150, 2, counts, "project", "key"))
+    assert [sent_id for _, sent_id, _ in page] == ["s150", "s151"]
+    assert counts == {"match_count": 200, "sentence_count": 200}
+    # the sentences before the page are built until they are too big for the cache, the others are only counted
+    assert 0 < len(built) < 50 and built[-2:] == ["s150", "s151"]
+    assert search_cache.get("project", "key") is None
+    search_cache.clear()
+
+
+def test_sentence_size_counts_the_formatted_objects():
+    results = [
+        {"sample_id": "sample", "sent_id": "s1", "user_id": user_id, "conll": conll.format("s1").replace("a", "é"), "nodes": {"X": "1"}, "edges": {}}
+        for user_id in ("alice", "bob")
+    ]
+    _, _, sentence = next(SearchResultsBuilder().iter_sentences(results))
+    size = search_cache.sentence_size(sentence)
+    # the conlls take 2 bytes by character, the dicts of the matches are counted too
+    assert size > 2 * sum(len(tree) for tree in sentence["conlls"].values()) + sys.getsizeof(sentence)
+    # a shared match is counted once, only the list grows
+    match = sentence["matches"]["alice"][0]
+    sentence["matches"]["alice"].append(match)
+    assert search_cache.sentence_size(sentence) < size + sys.getsizeof(match)
@@ -0,0 +1,249 @@
+"""
+    Plain text tokenizer (Kim's script) used to create samples from raw texts.
+
+    The regexes of a configuration are compiled once by PlainTextTokenizer and the tokenizers are
+    cached by language and options (get_tokenizer), the protected words, urls and numbers are replaced
+    by escapes \\index\\ in linear passes and the sentences are tokenized lazily.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+re_url = re.compile(r'''(https?://|\w+@)?[\w\d\%\.]*\w\w\.\w\w[\w\d~/\%\#]*(\?[\w\d~/\%\#]+)*''', re.U+re.M+re.I)
+# combinations of numbers:
+re_spacenum = re.compile(r'\d+[ ,.]+[0-9 ,.]*\d+')
+# regex to match escapes \number\ used for special words:
+rerematch = re.compile(r'\\\d+\\')
+# characters of the strings matched by re_url and re_spacenum
+re_url_chars = re.compile(r'[\w%.:/@~#?]+')
+re_spacenum_chars = re.compile(r'[\d ,.]+')
+
+UPPER_CASES = 'A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ'
+
+Token = Tuple[str, bool]
+
+
+class PlainTextTokenizer:
+    """
+        A tokenizer configuration with its compiled regexes, it can be reused for any number of texts.
+        See tokenize_plain_text in app/samples/service.py for the options.
+    """
+
+    def __init__(
+        self,
+        lang: str,
+        sent_ends: str = '.;!?\\n',
+        new_sent_upper: str = '.!?',
+        char_in_word: str = '_-',
+        whole_words: str = "aujourd'hui l'on etc. Mr. M. Nr. N° ;) ;-)",
+        special_suffix: str = "n't -je -tu -il -elle -on -nous -vous -ils -ils -elles -y -t-il -t-elle -t-ils -t-ils -t-on",
+        keep_url: bool = True,
+        combine_numbers: bool = True,
+        sent_cut: str = "",
+        escape: str = '____',
+        sent_not_cut: str = "§§§",
+    ):
+        self.whole_words = whole_words.strip().split()
+        special_suffix = special_suffix.strip()
+        self.respecial_suffix = re.compile(r'({})\b'.format('|'.join(special_suffix.split()))) if special_suffix else None
+        self.keep_url = keep_url
+        self.combine_numbers = combine_numbers
+        self.sent_cut = sent_cut
+        self.sent_not_cut = sent_not_cut
+        self.num_dot = (escape+'{}'+escape).format('NUMBERDOT')
+        self.space_after_esc = (escape+'{}'+escape).format('NOSPACEAFTER')
+        if lang == 'fr':
+            glue_left = "'~"
+            glue_right = ""
+        else:
+            glue_left = ""
+            glue_right = "'"
+
+        # replace "the 2. guy" by "the 2___NUMDOT___ guy", num followed by . not followed by upper case
+        self.re_num_dot = re.compile(r'\b(\d+)\.(?! [0-9' + UPPER_CASES + '])')
+        self.re_sent_bounds = None
+        if not sent_cut:
+            if new_sent_upper:
+                sent_ends_nopoint = re.sub(r'[{new_sent_upper}]+'.format(new_sent_upper=new_sent_upper), '', sent_ends)
+                not_cut = '(?!{})'.format(sent_not_cut) if sent_not_cut else ''
+                self.re_sent_bounds = re.compile(
+                    r'(([{sent_ends_nopoint}]+{not_cut}\s*)|([{sent_ends}]+{not_cut}\s*(?=[0-9\\{upper}])))'.format(
+                        sent_ends_nopoint=sent_ends_nopoint,
+                        sent_ends=new_sent_upper.replace('.', r'\.'),
+                        not_cut=not_cut,
+                        upper=UPPER_CASES,
+                    ), re.U+re.M)
+            elif sent_not_cut:
+                self.re_sent_bounds = re.compile(
+                    r'([{sent_ends}](?!{sent_not_cut})+\s*)'.format(sent_ends=sent_ends, sent_not_cut=sent_not_cut), re.U+re.M)
+            else:
+                self.re_sent_bounds = re.compile(r'([{sent_ends}]+\s*)'.format(sent_ends=sent_ends), re.U+re.M)
+
+        self.retok = re.compile(r"(?!(\\d+\\)|([\\{} ]+))(\W+)(?!\d)".format(re.escape((char_in_word+glue_left+glue_right).replace('-', r'\-'))))
+        self.reglue_left = re.compile(r'([{}])'.format(glue_left)) if glue_left else None
+        self.reglue_right = re.compile(r'([{}])'.format(glue_right)) if glue_right else None
+        self.tok_replacement = r'{}\3 '.format(self.space_after_esc)
+
+    def tokenize(self, text: str) -> Iterator[Tuple[str, List[Token]]]:
+        """Sentences of a text, the protection of the special words is done on the whole text first
+
+        Args:
+            text (str)
+
+        Yields:
+            (sentence text, [(token, space after)])
+        """
+        whole_words = list(self.whole_words)
+        ntext = text
+        for ind, word in enumerate(self.whole_words):
+            ntext = ntext.replace(word, '\\{}\\'.format(ind))
+        if self.respecial_suffix:
+            ntext = _protect_suffixes(ntext, self.respecial_suffix, whole_words)
+        if self.keep_url:
+            ntext = _protect_matches(ntext, re_url, re_url_chars, whole_words)
+        if self.combine_numbers:
+            ntext = _protect_matches(ntext, re_spacenum, re_spacenum_chars, whole_words)
+        ntext = self.re_num_dot.sub(r'\1' + self.num_dot, ntext)
+
+        is_suffix: Dict[int, bool] = {}
+
+        def simplerematchreplace(matchobj):  # used to reconstruct the sentence
+            return whole_words[int(matchobj.group(0)[1:-1])]
+
+        def rematchreplace(matchobj):  # used to build the correct tokens
+            index = int(matchobj.group(0)[1:-1])
+            if index not in is_suffix:
+                is_suffix[index] = bool(self.respecial_suffix and self.respecial_suffix.match(whole_words[index]))
+            if is_suffix[index]:
+                return self.space_after_esc + whole_words[index]
+            return whole_words[index]
+
+        for s in self._iter_sentences(ntext):
+            rs = rerematch.sub(simplerematchreplace, s.replace(self.num_dot, '.'))
+            if self.reglue_left:
+                s = self.reglue_left.sub(r'\1 ', s)
+            if self.reglue_right:
+                s = self.reglue_right.sub(r' \1', s)
+            s = self.retok.sub(self.tok_replacement, s)  # adding the additional spaces
+            tokens: List[Token] = []
+            for t in s.split():
+                t = t.replace(self.num_dot, '.')
+                ts = rerematch.sub(rematchreplace, t) if rerematch.search(t) else t
+                if self.space_after_esc not in ts:
+                    tokens.append((ts, True))
+                    continue
+                tsl = [tt for tt in ts.split(self.space_after_esc) if tt]
+                tokens += [(tt, ii == len(tsl) - 1) for ii, tt in enumerate(tsl)]
+            yield rs, tokens
+
+    def _iter_sentences(self, ntext: str) -> Iterator[str]:
+        if self.sent_cut:
+            position = 0
+            while True:
+                found = ntext.find(self.sent_cut, position)
+                if found < 0:
+                    yield ntext[position:]
+                    return
+                yield ntext[position:found]
+                position = found + len(self.sent_cut)
+
+        # the pieces of re.split, taken two by two: a sentence and the group after it
+        pieces = self._iter_split(ntext)
+        for piece, next_piece in zip(pieces, pieces):
+            if piece and next_piece is not None:
+                yield (piece.replace(self.sent_not_cut, '') + next_piece).strip()
+
+    def _iter_split(self, ntext: str) -> Iterator[Optional[str]]:
+        """Same as re_sent_bounds.split(ntext) + [''] without building the list"""
+        position = 0
+        for match in self.re_sent_bounds.finditer(ntext):
+            yield ntext[position:match.start()]
+            yield from match.groups()
+            position = match.end()
+        yield ntext[position:]
+        yield ''
+
+
+@lru_cache(maxsize=32)
+def get_tokenizer(lang: str, **options) -> PlainTextTokenizer:
+    """The tokenizer of a language and options, compiled at the first call
+
+    Args:
+        lang (str): fr or en
+        options: see PlainTextTokenizer
+
+    Returns:
+        PlainTextTokenizer
+    """
+    return PlainTextTokenizer(lang, **options)
+
+
+def _escape(index: int) -> str:
+    return '\\{}\\'.format(index)
+
+
+def _protect_suffixes(ntext: str, respecial_suffix: re.Pattern, whole_words: List[str]) -> str:
+    """Replace the special suffixes by escapes. Every suffix found is replaced everywhere in the text as
+    it always was (also inside longer words), there are only a few different suffixes"""
+    first_index: Dict[str, int] = {}
+    for match in respecial_suffix.finditer(ntext):
+        first_index.setdefault(match.group(0), len(whole_words))
+        whole_words.append(match.group(0))
+    for suffix, index in first_index.items():
+        ntext = ntext.replace(suffix, _escape(index))
+    return ntext
+
+
+def _protect_matches(ntext: str, regex: re.Pattern, re_chars: re.Pattern, whole_words: List[str]) -> str:
+    """Replace the urls or the numbers by escapes, the same way as replacing every distinct match everywhere
+    in the text in the order of the matches, without reading the whole text for every match.
+
+    A match can only be found again in a run of the characters matches are made of (re_chars) and such a run
+    always contains a match of regex, so the replacements are done run by run, with the distinct matches
+    found in the run.
+    """
+    first_index: Dict[str, int] = {}
+    starts = []
+    for match in regex.finditer(ntext):
+        first_index.setdefault(match.group(0), len(whole_words))
+        whole_words.append(match.group(0))
+        starts.append(match.start())
+    if not starts:
+        return ntext
+    lengths = sorted({len(matched) for matched in first_index})
+
+    # the same runs come back often (e.g. numbers)
+    replaced_runs: Dict[str, str] = {}
+    pieces = []
+    position = 0
+    for start in starts:
+        if start < position:
+            continue
+        run_start = start
+        while run_start > position and re_chars.match(ntext, run_start - 1, run_start):
+            run_start -= 1
+        run_end = re_chars.match(ntext, start).end()
+        run = ntext[run_start:run_end]
+        if run not in replaced_runs:
+            replaced_runs[run] = _replace_in_run(run, first_index, lengths)
+
+        pieces.append(ntext[position:run_start])
+        pieces.append(replaced_runs[run])
+        position = run_end
+    pieces.append(ntext[position:])
+    return "".join(pieces)
+
+
+def _replace_in_run(run: str, first_index: Dict[str, int], lengths: List[int]) -> str:
+    """Replace the matches found in a run by their escapes, in the order of the matches"""
+    found: Dict[str, int] = {}
+    for length in lengths:
+        if length > len(run):
+            break
+        for i in range(len(run) - length + 1):
+            index = first_index.get(run[i:i + length])
+            if index is not None:
+                found[run[i:i + length]] = index
+    for matched in sorted(found, key=found.get):
+        run = run.replace(matched, _escape(found[matched]))
+    return run
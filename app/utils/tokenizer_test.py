@@ -0,0 +1,54 @@
+import pytest
+
+from app.utils.tokenizer import PlainTextTokenizer, get_tokenizer
+
+
+def tokenize(text, lang, **options):
+    return list(PlainTextTokenizer(lang, **options).tokenize(text))
+
+
+def test_french_suffixes_and_numbers():
+    assert tokenize("« Où vas-tu ? » demanda-t-il. Ils ont 1 200 livres, disent-ils.", "fr") == [
+        ("« Où vas-tu ? » demanda-t-il.", [
+            ("«", True), ("Où", True), ("vas", False), ("-tu", True), ("?", True), ("»", True),
+            ("demanda", False), ("-t-il", False), (".", True),
+        ]),
+        ("Ils ont 1 200 livres, disent-ils.", [
+            ("Ils", True), ("ont", True), ("1 200", True), ("livres", False), (",", True),
+            ("disent", False), ("-ils", False), (".", True),
+        ]),
+    ]
+
+
+def test_english_whole_words_and_urls():
+    assert tokenize("Mr. Smith doesn't live at www.example.com. He paid 3.5 dollars!", "en") == [
+        ("Mr. Smith doesn't live at www.example.com.", [
+            ("Mr.", True), ("Smith", True), ("does", False), ("n't", True), ("live", True), ("at", True),
+            ("www.example.com", False), (".", True),
+        ]),
+        ("He paid 3.5 dollars!", [("He", True), ("paid", True), ("3.5", True), ("dollars", False), ("!", True)]),
+    ]
+
+
+def test_protected_strings_found_inside_others():
+    # "-il" and "1 000" are also replaced inside "-ils" and "21 000", the tokens stay the same
+    assert tokenize("Viens, dit-il. Non, disent-ils. Le 1 000 et le 21 000.", "fr") == [
+        ("Viens, dit-il.", [("Viens", False), (",", True), ("dit", False), ("-il", False), (".", True)]),
+        ("Non, disent-ils.", [("Non", False), (",", True), ("disent", False), ("-ils", False), (".", True)]),
+        ("Le 1 000 et le 21 000.", [("Le", True), ("1 000", True), ("et", True), ("le", True), ("21 000", False), (".", True)]),
+    ]
+
+
+@pytest.mark.parametrize("options, sentences", [
+    ({"sent_cut": "|"}, ["Un chat.", "Deux chiens !"]),
+    ({"new_sent_upper": ""}, ["Un chat.", "|Deux chiens !"]),
+    ({"sent_not_cut": ""}, ["Un chat.|Deux chiens !"]),
+])
+def test_sentence_options(options, sentences):
+    assert [sentence for sentence, _ in tokenize("Un chat.|Deux chiens !", "fr", **options)] == sentences
+
+
+def test_tokenizers_are_cached():
+    assert get_tokenizer("fr") is get_tokenizer("fr")
+    assert get_tokenizer("fr") is not get_tokenizer("en")
+    assert get_tokenizer("fr", sent_cut="|") is not get_tokenizer("fr")
@@ -0,0 +1,99 @@
+"""Content of the exported files of a sample: the previous regex passes vs read_export_tree
+
+The previous get_sample_content served the sample trees twice (with and without metadata, up to
+three re.sub over every tree) and searched the timestamp of every tree with another regex to find
+the most recent ones. read_export_tree walks the comment lines of every tree once.
+
+    python -m benchmarks.export_benchmark --sentences 20000 --users 5
+"""
+import argparse
+import random
+import re
+import time
+
+from app.test.corpus_generator import CorpusGenerator
+from app.utils.grew_utils import GrewService
+
+
+def get_timestamp(conll):
+    t = re.search(r"# timestamp = (\d+(?:\.\d+)?)\n", conll)
+    if t and t.groups():
+        return t.groups()[0]
+    else:
+        return False
+
+
+def serve_sample_trees(samples, timestamps=True, user_ids=True, validated_by=True):
+    trees = {}
+    for sent_id, users in samples.items():
+        for user_id, conll in users.items():
+            conll += "\n"
+            if sent_id not in trees:
+                trees[sent_id] = {"conlls": {}}
+            if not user_ids: conll = re.sub("# user_id = .+\n", '', conll)
+            if not timestamps: conll = re.sub("# timestamp = .+\n", '', conll)
+            if not validated_by: conll = re.sub("# validated_by = .+\n", '', conll)
+            trees[sent_id]["conlls"][user_id] = conll
+    return trees
+
+
+def get_last_user(tree):
+    timestamps = [(user, get_timestamp(conll)) for (user, conll) in tree.items()]
+    if len(timestamps) == 1:
+        return timestamps[0][0]
+    return sorted(timestamps, key=lambda x: x[1])[-1][0]
+
+
+def regex_passes(sample_data):
+    """get_sample_content as it was"""
+    sample_tree = serve_sample_trees(sample_data)
+    sample_tree_nots_noui = serve_sample_trees(sample_data, timestamps=False, user_ids=False, validated_by=False)
+    usertrees = {}
+    for sent_id in sample_tree_nots_noui:
+        for user, conll in sample_tree_nots_noui[sent_id]["conlls"].items():
+            usertrees.setdefault(user, []).append(conll)
+    sample_content = {user: "".join(content) for user, content in usertrees.items()}
+    for sent_id in sample_tree:
+        last = get_last_user(sample_tree[sent_id]["conlls"])
+        sample_content["last"] = sample_content.get("last", []) + [sample_tree_nots_noui[sent_id]["conlls"][last]]
+    sample_content["last"] = "".join(sample_content.get("last", ""))
+    return sample_content
+
+
+def generate(sentences, users, seed):
+    """A sample where the users annotated the sentences in any order, some trees are validated"""
+    rng = random.Random(seed)
+    sample_data = {}
+    for sent_id, trees in CorpusGenerator(seed=seed, users=users).iter_sentences(sentences=sentences):
+        sample_data[sent_id] = {}
+        for user_id, conll in trees.items():
+            conll = re.sub(r"# timestamp = \d+", "# timestamp = {}".format(1700000000000 + rng.randint(0, 10 ** 9)), conll)
+            if rng.random() < 0.2:
+                conll = conll.replace("# text = ", "# validated_by = {}\n# text = ".format(user_id), 1)
+            sample_data[sent_id][user_id] = conll
+    return sample_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="best of")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sample_data = generate(args.sentences, args.users, args.seed)
+    print("{} sentences, {} users".format(args.sentences, args.users))
+    outputs = {}
+    for name, build in (("regex passes", regex_passes), ("single pass", GrewService.get_sample_content)):
+        durations = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            outputs[name] = build(sample_data)
+            durations.append(time.perf_counter() - begin)
+        print("{:<14} {:7.3f} s".format(name, min(durations)))
+    print("same output: {}".format(outputs["regex passes"] == outputs["single pass"]))
+
+
+if __name__ == "__main__":
+    main()
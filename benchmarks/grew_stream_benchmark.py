@@ -0,0 +1,70 @@
+"""Peak memory of a large getConll reply: decoded at once (grew_request) vs on the fly (grew_request_stream)
+
+    python -m benchmarks.grew_stream_benchmark --sentences 50000
+"""
+import argparse
+import multiprocessing
+import time
+import tracemalloc
+
+from app import grew_config
+from app.test.fake_grew import FakeGrewServer
+from app.utils.grew_utils import grew_request, grew_request_stream
+
+CONLL = (
+    "# sent_id = sent_{0}\n# text = le petit chat dort\n# timestamp = 1684250080942.398\n"
+    "1\tle\tle\tDET\t_\tDefinite=Def|PronType=Art\t3\tdet\t_\t_\n"
+    "2\tpetit\tpetit\tADJ\t_\tGender=Masc|Number=Sing\t3\tmod\t_\t_\n"
+    "3\tchat\tchat\tNOUN\t_\tGender=Masc|Number=Sing\t4\tsubj\t_\t_\n"
+    "4\tdort\tdormir\tVERB\t_\tMood=Ind|Tense=Pres\t0\troot\t_\t_\n"
+)
+DATA = {"project_id": "project", "sample_id": "sample"}
+
+
+def serve(number_sentences, urls):
+    sample = {"sent_{}".format(i): {"user": CONLL.format(i), "validated": CONLL.format(i)} for i in range(number_sentences)}
+    with FakeGrewServer(corpus={"project": {"sample": sample}}) as server:
+        urls.put(server.url)
+        while True:
+            time.sleep(60)
+
+
+def measure(consume):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    count = consume()
+    duration = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, duration, peak
+
+
+def full_reply():
+    return len(grew_request("getConll", data=DATA)["data"])
+
+
+def streamed_reply():
+    # the sentences are only counted, a real consumer formats or writes them one by one
+    return sum(1 for _ in grew_request_stream("getConll", data=DATA))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sentences", type=int, default=50000)
+    args = parser.parse_args()
+
+    # the server runs in its own process so that its allocations are not traced
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args.sentences, urls), daemon=True)
+    server.start()
+    grew_config.server = urls.get(timeout=120)
+    try:
+        for name, consume in (("grew_request", full_reply), ("grew_request_stream", streamed_reply)):
+            count, duration, peak = measure(consume)
+            print("{:<20} {} sentences   {:6.2f} s   peak {:8.1f} MB".format(name, count, duration, peak / 2 ** 20))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Per-request latency of grew calls: bare requests.post vs the pooled keep-alive transport
+
+    python -m benchmarks.grew_transport_benchmark --requests 500
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from app import grew_config
+from app.test.fake_grew import FakeGrewServer
+from app.utils.grew_transport import grew_transport
+
+CORPUS = {
+    "project": {
+        "sample": {
+            "sent_{}".format(i): {"user": "# sent_id = sent_{}\n1\tword\t_\t_\t_\t_\t0\troot\t_\t_\n".format(i)}
+            for i in range(20)
+        }
+    }
+}
+DATA = {"project_id": "project", "sample_id": "sample"}
+
+
+def measure(send, number_requests):
+    latencies = []
+    for _ in range(number_requests):
+        begin = time.perf_counter()
+        response = send()
+        response.json()
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("{:<18} mean {:7.3f} ms   p50 {:7.3f} ms   p95 {:7.3f} ms".format(
+        name,
+        statistics.mean(latencies),
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.95)],
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial grew latency in seconds")
+    args = parser.parse_args()
+
+    with FakeGrewServer(latency=args.latency, corpus=CORPUS) as server:
+        grew_config.server = server.url
+        url = "{}/getConll".format(server.url)
+
+        bare = measure(lambda: requests.post(url, data=DATA), args.requests)
+        pooled = measure(lambda: grew_transport.post("getConll", data=DATA), args.requests)
+        grew_transport.close()
+
+    report("requests.post", bare)
+    report("grew_transport", pooled)
+    print("speedup (p50)      x{:.2f}".format(sorted(bare)[len(bare) // 2] / sorted(pooled)[len(pooled) // 2]))
+
+
+if __name__ == "__main__":
+    main()
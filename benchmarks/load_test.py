@@ -0,0 +1,251 @@
+"""End-to-end load test of the backend against the fake grew server (app/test/fake_grew.py)
+
+The fake grew server and the backend (create_app, test config and database) run in their own
+processes, the load is generated by threads of this process that replay the hot endpoints:
+project listing, tree loading, tree saving, search and export.
+
+    python -m benchmarks.load_test --duration 30 --concurrency 8 --grew-latency 0.02
+    python -m benchmarks.load_test --save before.json
+    python -m benchmarks.load_test --compare before.json --tolerance 0.2
+
+With --compare the exit code is 1 when the p95 latency of a scenario regressed by more than the tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from queue import Empty
+
+import requests
+
+from app.test.corpus_generator import CorpusGenerator
+
+USER_ID = "load-tester"
+USERNAME = "load_tester"
+
+
+def run_fake_grew(corpus, latency, urls):
+    from app.test.fake_grew import FakeGrewServer
+
+    server = FakeGrewServer(latency=latency, corpus=corpus).start()
+    urls.put(server.url)
+    while True:
+        time.sleep(3600)
+
+
+def run_backend(grew_url, project_names, urls, show_logs):
+    os.environ["GREW_SERVER"] = grew_url
+    if not show_logs:
+        # the request logs and prints of the backend would hide the report
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.dup2(devnull, sys.stderr.fileno())
+    from werkzeug.serving import make_server
+
+    from app import create_app, db
+    from app.projects.model import Project, ProjectAccess
+    from app.user.model import User
+
+    app = create_app("test")
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(id=USER_ID, username=USERNAME, super_admin=True))
+        for project_name in project_names:
+            project = Project(project_name=project_name, visibility=2, blind_annotation_mode=False, collaborative_mode=True)
+            db.session.add(project)
+            db.session.flush()
+            db.session.add(ProjectAccess(project_id=project.id, user_id=USER_ID, access_level=3))
+        db.session.commit()
+        session_cookie = app.session_interface.get_signing_serializer(app).dumps({"_user_id": USER_ID, "_fresh": True})
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    urls.put(("http://127.0.0.1:{}".format(server.server_port), app.config["SESSION_COOKIE_NAME"], session_cookie))
+    server.serve_forever()
+
+
+def wait_for(queue, process, timeout=120):
+    """Get the message of a child process, fails as soon as the process died"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return queue.get(timeout=0.5)
+        except Empty:
+            if not process.is_alive():
+                raise RuntimeError("{} exited with code {}".format(process.name, process.exitcode))
+    raise RuntimeError("{} did not start in {} s".format(process.name, timeout))
+
+
+def scenarios(corpus, seed):
+    """(name, weight, request builder) of the replayed endpoints"""
+    saved_trees = CorpusGenerator(seed=seed + 1, users=[USERNAME])
+
+    def pick():
+        project_name = random.choice(list(corpus))
+        sample_name = random.choice(list(corpus[project_name]))
+        return project_name, sample_name
+
+    def list_projects():
+        return "GET", "/api/projects/", {"params": {"type": "all_projects", "page": 1, "name": ""}}
+
+    def load_trees():
+        project_name, sample_name = pick()
+        return "GET", "/api/projects/{}/samples/{}/trees".format(project_name, sample_name), {}
+
+    def save_tree():
+        project_name, sample_name = pick()
+        sent_id = random.choice(list(corpus[project_name][sample_name]))
+        conll = saved_trees.sentence(sent_id)[USERNAME]
+        payload = {"userId": USERNAME, "conll": conll, "sentId": sent_id, "updateCommit": False}
+        return "POST", "/api/projects/{}/samples/{}/trees".format(project_name, sample_name), {"json": payload}
+
+    def search():
+        project_name, _ = pick()
+        payload = {"pattern": "pattern { X [upos=NOUN] }", "userType": "all", "sampleIds": [], "otherUser": ""}
+        return "POST", "/api/projects/{}/search".format(project_name), {"json": payload}
+
+    def export():
+        project_name, sample_name = pick()
+        payload = {"sampleNames": [sample_name], "users": ["user_0", "last"]}
+        return "POST", "/api/projects/{}/samples/export".format(project_name), {"json": payload}
+
+    return [
+        ("list_projects", 2, list_projects),
+        ("load_trees", 5, load_trees),
+        ("save_tree", 3, save_tree),
+        ("search", 2, search),
+        ("export", 1, export),
+    ]
+
+
+def generate_load(backend_url, cookie, corpus, seed, duration, concurrency):
+    names, weights, builders = zip(*scenarios(corpus, seed))
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        session.cookies.set(*cookie)
+        while time.monotonic() < deadline:
+            index = random.choices(range(len(names)), weights=weights)[0]
+            method, path, kwargs = builders[index]()
+            begin = time.perf_counter()
+            try:
+                response = session.request(method, backend_url + path, timeout=120, **kwargs)
+                failed = response.status_code >= 400
+                response.close()
+            except requests.RequestException:
+                failed = True
+            duration_ms = (time.perf_counter() - begin) * 1000
+            with lock:
+                latencies[names[index]].append(duration_ms)
+                if failed:
+                    errors[names[index]] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies, errors, duration):
+    results = {}
+    for name, values in sorted(latencies.items()):
+        values = sorted(values)
+        results[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "throughput": len(values) / duration,
+            "mean": statistics.mean(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    return results
+
+
+def report(results):
+    print("{:<14} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}".format("scenario", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, result in results.items():
+        print("{:<14} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            name, result["requests"], result["errors"], result["throughput"], result["p50"], result["p95"], result["p99"]
+        ))
+
+
+def compare(results, baseline, tolerance):
+    """Print the p95 regressions against a saved run, returns True if there is none"""
+    ok = True
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["p95"] / baseline[name]["p95"]
+        if ratio > 1 + tolerance:
+            ok = False
+            print("REGRESSION {}: p95 {:.1f} ms, was {:.1f} ms (x{:.2f})".format(name, result["p95"], baseline[name]["p95"], ratio))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous clients")
+    parser.add_argument("--grew-latency", type=float, default=0.0, help="artificial delay of the fake grew server in seconds")
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=4, help="samples by project")
+    parser.add_argument("--sentences", type=int, default=200, help="sentences by sample")
+    parser.add_argument("--users", type=int, default=2, help="annotators by sentence")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file of a previous run to compare the p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase with --compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend-logs", action="store_true", help="keep the output of the backend")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    corpus = CorpusGenerator(seed=args.seed, users=args.users).grew_corpus(args.projects, args.samples, args.sentences)
+    queue = multiprocessing.Queue()
+    grew_process = multiprocessing.Process(
+        target=run_fake_grew, args=(corpus, args.grew_latency, queue), name="fake grew server", daemon=True
+    )
+    grew_process.start()
+    grew_url = wait_for(queue, grew_process)
+    backend_process = multiprocessing.Process(
+        target=run_backend, args=(grew_url, list(corpus), queue, args.backend_logs), name="backend", daemon=True
+    )
+    backend_process.start()
+    try:
+        backend_url, cookie_name, cookie_value = wait_for(queue, backend_process)
+        latencies, errors = generate_load(
+            backend_url, (cookie_name, cookie_value), corpus, args.seed, args.duration, args.concurrency
+        )
+    finally:
+        backend_process.terminate()
+        grew_process.terminate()
+
+    results = summarize(latencies, errors, args.duration)
+    report(results)
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            if not compare(results, json.load(baseline_file), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Search results sent to the front: format_trees_new vs SearchResultsBuilder
+
+format_trees_new parsed the first tree of every sentence with sentenceConllToJson to read its text
+and copied the list of matches of a user at every new match (quadratic in the matches of a tree).
+SearchResultsBuilder reads the text in the metadata and appends the matches in place.
+
+    python -m benchmarks.search_benchmark --sentences 20000 --users 3 --matches 4
+"""
+import argparse
+import random
+import time
+
+from conllup.conllup import sentenceConllToJson
+from conllup.processing import constructTextFromTreeJson
+
+from app.test.corpus_generator import CorpusGenerator
+from app.utils.grew_utils import SearchResultsBuilder
+
+
+def format_trees_new(m, trees):
+    """format_trees_new as it was (search results only)"""
+    user_id = m["user_id"]
+    sample_name = m["sample_id"]
+    sent_id = m["sent_id"]
+    conll = m["conll"]
+    nodes = m["nodes"]
+    edges = m["edges"]
+    if sample_name not in trees:
+        trees[sample_name] = {}
+    if sent_id not in trees[sample_name]:
+        sentence_json = sentenceConllToJson(conll)
+        trees[sample_name][sent_id] = {
+            "sentence": sentence_json["metaJson"]["text"] if "text" in sentence_json["metaJson"].keys() else constructTextFromTreeJson(sentence_json["treeJson"]),
+            "conlls": {user_id: conll},
+            "sent_id": sent_id,
+            "matches": {user_id: [{"edges": edges, "nodes": nodes}]},
+        }
+    else:
+        trees[sample_name][sent_id]["conlls"][user_id] = conll
+        trees[sample_name][sent_id]["matches"][user_id] = trees[sample_name][sent_id]["matches"].get(user_id, []) + [{"edges": edges, "nodes": nodes}]
+    return trees
+
+
+def previous_format(results):
+    trees = {}
+    for result in results:
+        trees = format_trees_new(result, trees)
+    return trees
+
+
+def generate(sentences, users, matches, seed):
+    """Grew results: every tree of every user matches 1 to `matches` times"""
+    rng = random.Random(seed)
+    results = []
+    for sentence_index, (sent_id, trees) in enumerate(CorpusGenerator(seed=seed, users=users).iter_sentences(sentences=sentences)):
+        for user_id, conll in trees.items():
+            for index in range(rng.randint(1, matches)):
+                results.append({
+                    "sample_id": "sample_{}".format(sentence_index // 1000), "sent_id": sent_id, "user_id": user_id,
+                    "conll": conll, "nodes": {"X": str(index + 1)}, "edges": {},
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--matches", type=int, default=4, help="maximum number of matches in a tree")
+    parser.add_argument("--repeat", type=int, default=3, help="best of")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = generate(args.sentences, args.users, args.matches, args.seed)
+    print("{} sentences, {} results".format(args.sentences, len(results)))
+    outputs = {}
+    for name, build in (("format_trees_new", previous_format), ("builder", lambda results: SearchResultsBuilder().build(results))):
+        durations = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            outputs[name] = build(results)
+            durations.append(time.perf_counter() - begin)
+        print("{:<17} {:7.3f} s".format(name, min(durations)))
+    print("same output: {}".format(outputs["format_trees_new"] == outputs["builder"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Plain text tokenization (samples created from raw texts): the previous tokenize_plain_text vs PlainTextTokenizer
+
+The previous function compiled its regexes at every call and replaced every protected word, suffix, url
+and number in the whole text once per occurrence. The texts are novel-like French and English texts
+with dialogues, numbers, abbreviations and a few urls.
+
+    python -m benchmarks.tokenizer_benchmark --size 1
+"""
+import argparse
+import random
+import re
+import time
+
+from app.utils.tokenizer import get_tokenizer
+
+FRENCH = {
+    "subjects": ["le vieux marin", "la jeune femme", "M. Dupont", "Mme Lefèvre", "l'enfant", "le capitaine", "Jean-Pierre", "sa mère"],
+    "verbs": ["regardait", "attendait", "traversa", "racontait", "oublia", "aperçut", "ouvrait", "quitta"],
+    "objects": ["la mer grise", "le port", "une lettre froissée", "les collines", "la vieille maison", "le chemin du village"],
+    "extras": ["aujourd'hui", "depuis 1 200 jours", "à 3,5 kilomètres", "vers 18 h 30", "etc.", "sans un mot", "comme l'on dit", "au 2e étage"],
+    "dialogues": ["« Où vas-tu ? » demanda-t-il.", "« Viendra-t-elle ce soir ? » dit-on.", "« Je ne sais pas », répondit-elle.",
+                  "« Que faites-vous ? » disent-ils.", "« Allons-y ! » cria-t-il.", "« Pourquoi pas ? » murmura-t-on."],
+    "chapter": "Chapitre {}.",
+    "url": "Voir https://www.gutenberg.org/ebooks/{} pour le texte.",
+}
+ENGLISH = {
+    "subjects": ["the old sailor", "the young woman", "Mr. Smith", "Mrs. Brown", "the child", "the captain", "her mother", "John"],
+    "verbs": ["watched", "waited for", "crossed", "told", "forgot", "noticed", "opened", "left"],
+    "objects": ["the grey sea", "the harbour", "a crumpled letter", "the hills", "the old house", "the village road"],
+    "extras": ["today", "for 1,200 days", "3.5 miles away", "at 6 p.m.", "etc.", "without a word", "as they say", "on the 2nd floor"],
+    "dialogues": ["\"Where are you going?\" he asked.", "\"I don't know,\" she said.", "\"It's late,\" they said.",
+                  "\"Isn't it?\" he wondered.", "\"Let's go!\" he shouted.", "\"Why not?\" someone murmured."],
+    "chapter": "Chapter {}.",
+    "url": "See https://www.gutenberg.org/ebooks/{} for the text.",
+}
+
+
+def generate(lexicon, size, seed=0):
+    """A text of about size characters, paragraphs of narration and dialogues"""
+    rng = random.Random(seed)
+    paragraphs = []
+    written = 0
+    chapter = 0
+    while written < size:
+        if rng.random() < 0.01:
+            chapter += 1
+            paragraph = lexicon["chapter"].format(chapter)
+        else:
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                if rng.random() < 0.3:
+                    sentences.append(rng.choice(lexicon["dialogues"]))
+                elif rng.random() < 0.002:
+                    sentences.append(lexicon["url"].format(rng.randint(1, 70000)))
+                else:
+                    sentence = "{} {} {}, {}.".format(
+                        rng.choice(lexicon["subjects"]), rng.choice(lexicon["verbs"]),
+                        rng.choice(lexicon["objects"]), rng.choice(lexicon["extras"]),
+                    )
+                    sentences.append(sentence[0].upper() + sentence[1:])
+            paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        written += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+re_url = re.compile(r'''(https?://|\w+@)?[\w\d\%\.]*\w\w\.\w\w[\w\d~/\%\#]*(\?[\w\d~/\%\#]+)*''', re.U+re.M+re.I)
+re_spacenum = re.compile(r'\d+[ ,.]+[0-9 ,.]*\d+')
+rerematch = re.compile(r'\\\d+\\')
+
+
+def previous_tokenize_plain_text(text, lang, sent_ends='.;!?\\n', new_sent_upper='.!?', char_in_word='_-',
+                                 whole_words="aujourd'hui l'on etc. Mr. M. Nr. N° ;) ;-)",
+                                 special_suffix="n't -je -tu -il -elle -on -nous -vous -ils -ils -elles -y -t-il -t-elle -t-ils -t-ils -t-on",
+                                 escape='____', sent_not_cut="§§§"):
+    """tokenize_plain_text as it was, with the default options"""
+    whole_words = whole_words.strip().split()
+    special_suffix = special_suffix.strip()
+    num_dot = (escape+'{}'+escape).format('NUMBERDOT')
+    space_after_esc = (escape+'{}'+escape).format('NOSPACEAFTER')
+    if lang == 'fr':
+        glue_left = "'~"
+        glue_right = ""
+    else:
+        glue_left = ""
+        glue_right = "'"
+    ind = 0
+    ntext = text
+    for word in whole_words:
+        ntext = ntext.replace(word, '\\{ind}\\'.format(ind=ind))
+        ind += 1
+    respecial_suffix = re.compile(r'({})\b'.format('|'.join(special_suffix.split())))
+    for m in respecial_suffix.finditer(ntext):
+        ntext = ntext.replace(m.group(0), '\\{ind}\\'.format(ind=ind))
+        whole_words += [m.group(0)]
+        ind += 1
+    for murl in re_url.finditer(ntext):
+        ntext = ntext.replace(murl.group(0), '\\{ind}\\'.format(ind=ind))
+        whole_words += [murl.group(0)]
+        ind += 1
+    for mnum in re_spacenum.finditer(ntext):
+        ntext = ntext.replace(mnum.group(0), '\\{ind}\\'.format(ind=ind))
+        whole_words += [mnum.group(0)]
+        ind += 1
+    re_num_dot = re.compile(r'\b(\d+)\.(?! [0-9A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ])')
+    ntext = re_num_dot.sub(r'\1'+num_dot, ntext)
+    sent_ends_nopoint = re.sub(r'[{new_sent_upper}]+'.format(new_sent_upper=new_sent_upper), '', sent_ends)
+    re_sent_bounds = re.compile(
+        r'(([{sent_ends_nopoint}]+(?!{sent_not_cut})\s*)|([{sent_ends}]+(?!{sent_not_cut})\s*(?=[0-9\\A-ZÀÈÌÒÙÁÉÍÓÚÝÂÊÎÔÛÄËÏÖÜÃÑÕÆÅÐÇØ])))'.format(
+            sent_ends_nopoint=sent_ends_nopoint, sent_ends=new_sent_upper.replace('.', r'\.'), sent_not_cut=sent_not_cut
+        ), re.U+re.M)
+    doubsents = re_sent_bounds.split(ntext)+['']
+    sents = []
+    for i in range(0, len(doubsents), 2):
+        if doubsents[i] and doubsents[i+1] is not None:
+            sents += [(doubsents[i].replace(sent_not_cut, '') + (doubsents[i+1] if i+1 < len(doubsents) else '')).strip()]
+    retok = re.compile(r"(?!(\\d+\\)|([\\{} ]+))(\W+)(?!\d)".format(re.escape((char_in_word+glue_left+glue_right).replace('-', r'\-'))))
+    reglue_left = re.compile(r'([{}])'.format(glue_left)) if glue_left else None
+    reglue_right = re.compile(r'([{}])'.format(glue_right)) if glue_right else None
+    stoks = {}
+
+    def simplerematchreplace(matchobj):
+        return whole_words[int(matchobj.group(0)[1:-1])]
+
+    def rematchreplace(matchobj):
+        if special_suffix and respecial_suffix.match(whole_words[int(matchobj.group(0)[1:-1])]):
+            return space_after_esc+whole_words[int(matchobj.group(0)[1:-1])]
+        return whole_words[int(matchobj.group(0)[1:-1])]
+    for si, s in enumerate(sents):
+        rs = rerematch.sub(simplerematchreplace, s.replace(num_dot, '.'))
+        if glue_left:
+            s = reglue_left.sub(r'\1 ', s)
+        if glue_right:
+            s = reglue_right.sub(r' \1', s)
+        s = retok.sub(r'{}\3 '.format(space_after_esc), s)
+        toks = []
+        spaceafters = []
+        for t in s.split():
+            t = t.replace(num_dot, '.')
+            ts = rerematch.sub(rematchreplace, t) if rerematch.search(t) else t
+            tsl = [tt for tt in ts.split(space_after_esc) if tt]
+            toks += tsl
+            spaceafters += [ii == len(tsl)-1 for ii, tt in enumerate(tsl)]
+        stoks[(si, rs)] = list(zip(toks, spaceafters))
+    return stoks
+
+
+def engine_tokenize(text, lang):
+    return {(si, rs): toks for si, (rs, toks) in enumerate(get_tokenizer(lang).tokenize(text))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=float, default=1, help="size of the generated texts in MB")
+    args = parser.parse_args()
+
+    for lang, lexicon in (("fr", FRENCH), ("en", ENGLISH)):
+        text = generate(lexicon, int(args.size * 2 ** 20))
+        size = len(text.encode("utf-8")) / 2 ** 20
+        print("{} text, {:.1f} MB".format(lang, size))
+        outputs = {}
+        for name, tokenize in (("previous", previous_tokenize_plain_text), ("tokenizer", engine_tokenize)):
+            begin = time.perf_counter()
+            outputs[name] = tokenize(text, lang)
+            duration = time.perf_counter() - begin
+            print("  {:<10} {:7.2f} s   {:6.2f} MB/s   {} sentences".format(name, duration, size / duration, len(outputs[name])))
+        print("  same output: {}".format(outputs["previous"] == outputs["tokenizer"]))
+
+
+if __name__ == "__main__":
+    main()
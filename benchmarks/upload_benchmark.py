@@ -0,0 +1,103 @@
+"""Rewrite of an uploaded CoNLL-U file: the previous chain of helpers vs the single pass ConlluTransformer
+
+The previous chain re-reads the whole file for every check and rewrite (six parse passes, four
+serializations), the transformer parses and serializes every sentence once.
+
+    python -m benchmarks.upload_benchmark --size 100
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+from conllup.conllup import readConlluFile, sentenceJsonToConll
+
+from app.samples.service import ConlluTransformer
+from app.test.corpus_generator import CorpusGenerator
+
+SAMPLE_NAME = "sample"
+
+
+def generate(path_file, size):
+    """Write a conllu file of about size bytes, without user_id since the upload rejects them"""
+    written = 0
+    with open(path_file, "w", encoding="utf-8") as outfile:
+        for tree in CorpusGenerator(seed=0, users=1).iter_conllu(tokens=10 ** 12):
+            tree = "\n".join(line for line in tree.split("\n") if not line.startswith("# user_id"))
+            written += outfile.write(tree)
+            if written >= size:
+                break
+
+
+def chained_helpers(path_file):
+    """The upload as it was: every helper reads the file again"""
+    def read():
+        return readConlluFile(path_file, keepEmptyTrees=True)
+
+    def write(sentences_json):
+        with open(path_file, "w", encoding="utf-8") as outfile:
+            for sentence_json in sentences_json:
+                outfile.write(sentenceJsonToConll(sentence_json) + "\n")
+
+    sentences_json = read()
+    for index, sentence_json in enumerate(sentences_json, start=1):
+        sentence_json["metaJson"]["sent_id"] = "{}__{}".format(SAMPLE_NAME, index)
+    write(sentences_json)
+    sent_ids = Counter(sentence["metaJson"]["sent_id"] for sentence in read())
+    assert all(count == 1 for count in sent_ids.values())
+    assert not any(sentence["metaJson"].get("user_id") for sentence in read())
+    for rewrite in (
+        lambda meta: meta.update(user_id="annotator"),
+        lambda meta: meta.setdefault("timestamp", str(datetime.timestamp(datetime.now()) * 1000)),
+        lambda meta: meta.update(rtl="yes"),
+    ):
+        sentences_json = read()
+        for sentence_json in sentences_json:
+            rewrite(sentence_json["metaJson"])
+        write(sentences_json)
+
+
+def single_pass(path_file):
+    transformer = ConlluTransformer(
+        SAMPLE_NAME, user_id="annotator", rtl=True, new_sent_ids=True, check_duplicate_sent_ids=True, check_user_ids=True
+    )
+    with open(path_file, "rb") as infile:
+        transformer.write(infile, path_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=float, default=100, help="size of the generated file in MB")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, "source.conllu")
+        generate(source, int(args.size * 2 ** 20))
+        size = os.path.getsize(source) / 2 ** 20
+        print("{:.1f} MB conllu file".format(size))
+        outputs = {}
+        for name, transform in (("chained helpers", chained_helpers), ("single pass", single_pass)):
+            path_file = os.path.join(directory, name.replace(" ", "_") + ".conllu")
+            shutil.copy(source, path_file)
+            begin = time.perf_counter()
+            transform(path_file)
+            duration = time.perf_counter() - begin
+            print("{:<16} {:7.2f} s   {:6.1f} MB/s".format(name, duration, size / duration))
+            outputs[name] = path_file
+        # the timestamps differ, only the structure is compared
+        with open(outputs["chained helpers"]) as before, open(outputs["single pass"]) as after:
+            same = all(
+                line_before == line_after or line_before.startswith("# timestamp")
+                for line_before, line_after in zip(before, after)
+            )
+        print("same output: {}".format(same))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()